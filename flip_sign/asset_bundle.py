@@ -0,0 +1,299 @@
+import json
+import logging
+import mmap
+import os
+import pathlib
+import struct
+from PIL import Image, ImageChops, ImageFont, features
+import PIL
+from flip_sign.assets import root_dir
+import flip_sign.glyph_atlas as glyph_atlas
+
+logger_name = 'flip_sign.asset_bundle'
+asset_bundle_logger = logging.getLogger(logger_name)
+
+weather_images_dir = root_dir + "/assets/weather_images"
+bundle_path = root_dir + "/cache/assets.bundle"
+
+# file layout: magic, little-endian uint32 length of the json index, the json index, then the packed data.  offsets in
+# the index are relative to the start of the packed data
+_MAGIC = b'FLIPSGN\x01'
+_HEADER = struct.Struct('<8sI')
+_FORMAT_VERSION = 1
+
+_bundle = None
+
+
+def _renderer_versions():
+    """
+    The versions of the libraries that rasterize the assets.  A bundle built with different versions is stale.
+
+    :return: (dict) the versions of the bundle format, Pillow and FreeType
+    """
+    return {'format': _FORMAT_VERSION, 'pillow': PIL.__version__, 'freetype': features.version('freetype2')}
+
+
+def _source_stamp(path: str):
+    """
+    Identifies the version of a source file by its size and modification time, without reading it.
+
+    :param path: (str) the path of the file
+    :return: (list) [size, mtime_ns]
+    """
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _relative(path: str):
+    """
+    Converts a path to be relative to root_dir where possible, so the bundle survives moving the install directory.
+
+    :param path: (str) the path
+    :return: (str) the path relative to root_dir, or the absolute path if outside root_dir
+    """
+    path = os.path.realpath(path)
+    root = os.path.realpath(root_dir)
+    if os.path.commonpath([path, root]) == root:
+        return os.path.relpath(path, root)
+    return path
+
+
+def load_weather_image(relative_path: str, inverted: bool = False):
+    """
+    Loads a weather dashboard image from the loose files in assets/weather_images, converted to 1-bit exactly as
+    Image.paste would convert it onto a 1-bit image.
+
+    :param relative_path: (str) path of the image within assets/weather_images, e.g. 'numbers/5.png'
+    :param inverted: (bool) whether to invert the image (used for below-zero temperatures)
+    :return: (PIL.Image) the 1-bit image
+    """
+    with Image.open(fp=weather_images_dir + "/" + relative_path) as image:
+        image.load()
+        if inverted:
+            image = ImageChops.invert(image)
+        return image.convert(mode='1')
+
+
+def weather_image_names():
+    """
+    Lists the weather dashboard images, with the inverted variants used by render_day.
+
+    :return: (list) (relative_path, inverted) tuples
+    """
+    names = []
+    for image_path in sorted(pathlib.Path(weather_images_dir).rglob("*.png")):
+        relative_path = image_path.relative_to(weather_images_dir).as_posix()
+        names.append((relative_path, False))
+        if relative_path.startswith("numbers/"):
+            names.append((relative_path, True))
+    return names
+
+
+def build(wrap_parameter_sets, path: str = bundle_path, characters: str = glyph_atlas.DEFAULT_CHARACTERS):
+    """
+    Packs the weather images (as 1-bit bitmaps) and the glyph atlases and font metrics for every font and size in
+    wrap_parameter_sets into a single bundle file.  The file is written to a temporary name and moved into place, so
+    a running sign never maps a partially written bundle.
+
+    :param wrap_parameter_sets: (iterable) helpers.wrap_parameter_set namedtuples whose fonts should be bundled
+    :param path: (str) where to write the bundle
+    :param characters: (str) the characters to rasterize for each font
+    :return: None
+    """
+    data = bytearray()
+    sources = {}
+
+    weather = []
+    for relative_path, inverted in weather_image_names():
+        source = weather_images_dir + "/" + relative_path
+        sources[_relative(source)] = _source_stamp(source)
+        image = load_weather_image(relative_path, inverted)
+        packed = image.tobytes()
+        weather.append([relative_path, inverted, len(data), len(packed), image.width, image.height])
+        data += packed
+
+    fonts = []
+    for font_path, font_size in sorted({(params.font_path, params.font_size) for params in wrap_parameter_sets}):
+        sources[_relative(font_path)] = _source_stamp(font_path)
+        font = ImageFont.truetype(font_path, size=font_size, layout_engine=ImageFont.LAYOUT_BASIC)
+        atlas = glyph_atlas.GlyphAtlas(font)
+        atlas.preload(characters)
+
+        glyphs = []
+        for character, glyph in atlas.glyphs.items():
+            row_bytes = max(1, (max((row.bit_length() for row in glyph.rows), default=0) + 7) // 8)
+            glyphs.append([character, glyph.advance, glyph.cbox_left, glyph.cbox_top, glyph.left, glyph.top,
+                           glyph.valid, len(glyph.rows), row_bytes, len(data)])
+            data += b''.join(row.to_bytes(row_bytes, 'little') for row in glyph.rows)
+
+        fonts.append({'font': _relative(font_path), 'size': font_size, 'ascender': atlas.ascender,
+                      'line_height': atlas.line_height, 'glyphs': glyphs})
+
+    index = json.dumps({'versions': _renderer_versions(), 'sources': sources, 'weather': weather, 'fonts': fonts},
+                       ensure_ascii=False).encode('utf-8')
+
+    temp_path = path + ".tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, len(index)))
+        f.write(index)
+        f.write(data)
+    os.replace(temp_path, path)
+
+    asset_bundle_logger.info("Built asset bundle: {} weather images, {} fonts, {} bytes."
+                             .format(len(weather), len(fonts), _HEADER.size + len(index) + len(data)))
+
+
+class AssetBundle(object):
+    """
+    A memory-mapped asset bundle.  Images and glyphs are decoded from the mapping when they are first requested.
+    """
+    def __init__(self, path: str):
+        """
+        Maps the bundle file and reads its index.  Raises ValueError if the file is not a bundle.  The mapping is
+        closed if the index cannot be read.
+
+        :param path: (str) the path of the bundle
+        """
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, index_length = _HEADER.unpack_from(self.map, 0)
+            if magic != _MAGIC:
+                raise ValueError("Not an asset bundle: " + path)
+
+            self.index = json.loads(self.map[_HEADER.size:_HEADER.size + index_length].decode('utf-8'))
+            self.data_start = _HEADER.size + index_length
+            self.weather = {(name, inverted): (offset, length, (width, height))
+                            for name, inverted, offset, length, width, height in self.index['weather']}
+        except Exception:
+            self.map.close()
+            raise
+
+    def close(self):
+        """
+        Unmaps the bundle.  Images and glyphs can no longer be decoded from it.
+
+        :return: None
+        """
+        self.map.close()
+
+    def stale_reason(self):
+        """
+        Checks whether the bundle still matches the loose files and the libraries that rasterized it.
+
+        :return: (str or None) why the bundle is stale, or None if it is current
+        """
+        if self.index['versions'] != _renderer_versions():
+            return "built with " + str(self.index['versions'])
+        for source, stamp in self.index['sources'].items():
+            try:
+                if _source_stamp(os.path.join(root_dir, source)) != stamp:
+                    return source + " changed"
+            except OSError:
+                return source + " missing"
+        return None
+
+    def weather_image(self, relative_path: str, inverted: bool = False):
+        """
+        Decodes a weather image from the bundle.
+
+        :param relative_path: (str) path of the image within assets/weather_images, e.g. 'numbers/5.png'
+        :param inverted: (bool) whether to return the inverted variant
+        :return: (PIL.Image or None) the 1-bit image, or None if it is not in the bundle
+        """
+        try:
+            offset, length, size = self.weather[(relative_path, inverted)]
+        except KeyError:
+            return None
+        start = self.data_start + offset
+        return Image.frombytes('1', size, self.map[start:start + length])
+
+    def font_loader(self, entry: dict):
+        """
+        Creates the function which decodes a font's glyphs and metrics for glyph_atlas.register_bundled.
+
+        :param entry: (dict) the font entry from the bundle index
+        :return: (callable) returns (ascender, line_height, glyphs dict) when called
+        """
+        def load():
+            glyphs = {}
+            for character, advance, cbox_left, cbox_top, left, top, valid, n_rows, row_bytes, offset in entry['glyphs']:
+                start = self.data_start + offset
+                rows = tuple(int.from_bytes(self.map[i:i + row_bytes], 'little')
+                             for i in range(start, start + n_rows * row_bytes, row_bytes))
+                glyphs[character] = glyph_atlas.glyph_bitmap(advance, cbox_left, cbox_top, left, top, rows, valid)
+            return entry['ascender'], entry['line_height'], glyphs
+
+        return load
+
+
+def load(path: str = bundle_path):
+    """
+    Maps the asset bundle at startup, if it exists and is current, and registers its glyph data with the glyph atlas.
+    When the bundle is missing or stale, assets continue to be read from the loose files.
+
+    :param path: (str) the path of the bundle
+    :return: (bool) whether the bundle is in use
+    """
+    global _bundle
+
+    try:
+        bundle = AssetBundle(path)
+    except FileNotFoundError:
+        asset_bundle_logger.info("No asset bundle at " + path + ", using loose asset files.")
+        return False
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        asset_bundle_logger.warning("Unable to read asset bundle, using loose asset files.  Error: " + str(e))
+        return False
+
+    stale_reason = bundle.stale_reason()
+    if stale_reason is not None:
+        asset_bundle_logger.info("Asset bundle is stale (" + stale_reason + "), using loose asset files.")
+        bundle.close()
+        return False
+
+    for entry in bundle.index['fonts']:
+        glyph_atlas.register_bundled(os.path.join(root_dir, entry['font']), entry['size'], bundle.font_loader(entry))
+
+    _bundle = bundle
+    asset_bundle_logger.info("Using asset bundle at " + path)
+    return True
+
+
+def unload():
+    """
+    Stops using the asset bundle and unmaps it, reverting to the loose files.  Atlases already built from the bundle
+    are kept.
+
+    :return: None
+    """
+    global _bundle
+
+    glyph_atlas.clear_bundled()
+    if _bundle is not None:
+        _bundle.close()
+    _bundle = None
+
+
+def weather_image(relative_path: str, inverted: bool = False):
+    """
+    Reads a weather image from the asset bundle if one is loaded, otherwise from the loose files.
+
+    :param relative_path: (str) path of the image within assets/weather_images, e.g. 'numbers/5.png'
+    :param inverted: (bool) whether to return the inverted image (used for below-zero temperatures)
+    :return: (PIL.Image) the 1-bit image
+    """
+    if _bundle is not None:
+        image = _bundle.weather_image(relative_path, inverted)
+        if image is not None:
+            return image
+    return load_weather_image(relative_path, inverted)
+
+
+if __name__ == '__main__':
+    import flip_sign.message_generation as msg_gen
+
+    logging.basicConfig(level=logging.INFO)
+    build(msg_gen.basic_text_default_wrap_params + msg_gen.weather_stub_default_wrap_params +
+          (msg_gen.date_message_wrap_params, msg_gen.date_match_wrap_params))
@@ -0,0 +1,226 @@
+import datetime
+import json
+import logging
+import sqlite3
+import threading
+from googleapiclient.errors import HttpError
+from tzlocal import get_localzone_name
+from pytz import timezone
+from flip_sign.assets import root_dir
+
+logger_name = 'flip_sign.calendar_sync'
+calendar_sync_logger = logging.getLogger(logger_name)
+
+LOCAL_TIMEZONE = timezone(get_localzone_name())
+
+event_store_path = root_dir + "/cache/calendar_events.sqlite3"
+
+
+def event_times(event: dict):
+    """
+    Reads the start and end of a google calendar event.  All-day events start and end at local midnight, and their
+    end is moved back one day (the API gives the day after the event ends).
+
+    :param event: (dict) the event resource from the google calendar API
+    :return: start, end, all_day:
+             start: (datetime.datetime) the time-zone aware start of the event
+             end: (datetime.datetime) the time-zone aware end of the event
+             all_day: (bool) whether the event is an all-day event
+    """
+    all_day = 'date' in event['start'].keys() and 'date' in event['end'].keys()
+    if all_day:
+        start = datetime.datetime.fromisoformat(event['start']['date']).replace(tzinfo=LOCAL_TIMEZONE)
+        end = datetime.datetime.fromisoformat(event['end']['date']).replace(tzinfo=LOCAL_TIMEZONE)
+        end -= datetime.timedelta(days=1)  # remove 1 day from all-day events (handling convention)
+    else:  # if not all-day event
+        start = datetime.datetime.fromisoformat(event['start']['dateTime'])  # expect time-zone-aware
+        end = datetime.datetime.fromisoformat(event['end']['dateTime'])  # expect time-zone aware
+
+    return start, end, all_day
+
+
+class CalendarEventStore(object):
+    """
+    A local copy of google calendar events, stored in SQLite and indexed by start time, along with the sync token for
+    fetching the changes since the copy was made.  Events which have ended are dropped whenever changes are stored, so
+    the copy does not grow without bound.  If the database cannot be used the store is kept in memory, and calendars
+    are fully synced again after a restart.
+    """
+    def __init__(self, path: str):
+        """
+        Initializes the store.  The database is opened on first use.
+
+        :param path: (str) the path of the SQLite database file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _connect(self):
+        """
+        Opens the database if it is not open, creating the tables if necessary.
+
+        :return: (sqlite3.Connection) the open database
+        """
+        if self._connection is None:
+            try:
+                self._connection = self._create(self.path)
+            except sqlite3.Error as e:
+                calendar_sync_logger.warning("Calendar event store unavailable, storing events in memory only.  "
+                                             "Path: " + self.path + " Error: " + str(e))
+                self._connection = self._create(':memory:')
+        return self._connection
+
+    @staticmethod
+    def _create(path: str):
+        """
+        Opens a database and creates the tables if they do not exist.
+
+        :param path: (str) the path of the database, or ':memory:'
+        :return: (sqlite3.Connection) the open database
+        """
+        connection = sqlite3.connect(path, check_same_thread=False)
+        with connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS events (calendar_id TEXT NOT NULL, event_id TEXT NOT NULL, "
+                               "start REAL NOT NULL, end REAL NOT NULL, event TEXT NOT NULL, "
+                               "PRIMARY KEY (calendar_id, event_id))")
+            connection.execute("CREATE INDEX IF NOT EXISTS events_by_start ON events (calendar_id, start)")
+            connection.execute("CREATE TABLE IF NOT EXISTS sync_tokens (calendar_id TEXT PRIMARY KEY, "
+                               "sync_token TEXT NOT NULL)")
+        return connection
+
+    def sync_token(self, calendar_id: str):
+        """
+        :param calendar_id: (str) the ID of the google calendar
+        :return: (str or None) the token for fetching changes to the stored events, or None if not synced
+        """
+        with self._lock:
+            rows = self._connect().execute("SELECT sync_token FROM sync_tokens WHERE calendar_id = ?",
+                                           (calendar_id,)).fetchall()
+            return rows[0][0] if rows else None
+
+    def apply(self, calendar_id: str, events: list, sync_token: str, full: bool):
+        """
+        Stores changed events and the new sync token in a single transaction.  Cancelled events, and events which have
+        ended, are removed.
+
+        :param calendar_id: (str) the ID of the google calendar
+        :param events: (list) event resources from the google calendar API
+        :param sync_token: (str or None) the token for fetching changes after these
+        :param full: (bool) whether events is the whole calendar, replacing every stored event
+        :return: None
+        """
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                if full:
+                    connection.execute("DELETE FROM events WHERE calendar_id = ?", (calendar_id,))
+                for event in events:
+                    if event.get('status') == 'cancelled':
+                        connection.execute("DELETE FROM events WHERE calendar_id = ? AND event_id = ?",
+                                           (calendar_id, event['id']))
+                        continue
+                    start, end, all_day = event_times(event)
+                    if all_day:  # all-day events run until the end of their last day
+                        end += datetime.timedelta(days=1)
+                    connection.execute("INSERT OR REPLACE INTO events (calendar_id, event_id, start, end, event) "
+                                       "VALUES (?, ?, ?, ?, ?)", (calendar_id, event['id'], start.timestamp(),
+                                                                  end.timestamp(), json.dumps(event)))
+                # ended events are never shown again - drop them, including any stored by earlier syncs
+                connection.execute("DELETE FROM events WHERE calendar_id = ? AND end <= ?",
+                                   (calendar_id, datetime.datetime.now(datetime.timezone.utc).timestamp()))
+                if sync_token is None:
+                    connection.execute("DELETE FROM sync_tokens WHERE calendar_id = ?", (calendar_id,))
+                else:
+                    connection.execute("INSERT OR REPLACE INTO sync_tokens (calendar_id, sync_token) VALUES (?, ?)",
+                                       (calendar_id, sync_token))
+
+    def events(self, calendar_id: str, end_after: datetime.datetime, start_before: datetime.datetime):
+        """
+        Looks up the stored events which overlap a period, in order of start time.
+
+        :param calendar_id: (str) the ID of the google calendar
+        :param end_after: (datetime.datetime) the start of the period - events which end before it are excluded
+        :param start_before: (datetime.datetime) the end of the period - events which start after it are excluded
+        :return: (list) event resources from the google calendar API
+        """
+        with self._lock:
+            rows = self._connect().execute("SELECT event FROM events WHERE calendar_id = ? AND start < ? AND end > ? "
+                                           "ORDER BY start, event_id",
+                                           (calendar_id, start_before.timestamp(), end_after.timestamp())).fetchall()
+        return [json.loads(event) for event, in rows]
+
+    def clear(self, calendar_id: str):
+        """
+        Removes the stored events and sync token for a calendar, so that it is fully synced next time.
+
+        :param calendar_id: (str) the ID of the google calendar
+        :return: None
+        """
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute("DELETE FROM events WHERE calendar_id = ?", (calendar_id,))
+                connection.execute("DELETE FROM sync_tokens WHERE calendar_id = ?", (calendar_id,))
+
+
+def _list_events(calendar_service, calendar_id: str, **list_kwargs):
+    """
+    Requests every page of an events list.  Without a sync token this is every event in the calendar, past and future:
+    google rejects timeMin (or any other filter) together with syncToken, so a full sync cannot be bounded in time if
+    it is to return a sync token.  Ended events are dropped when the result is stored.
+
+    :param calendar_service: (googleapiclient.discovery.Resource) the google calendar service
+    :param calendar_id: (str) the ID of the google calendar
+    :param list_kwargs: additional parameters for events().list, e.g. syncToken
+    :return: events, sync_token:
+             events: (list) the event resources from every page
+             sync_token: (str or None) the token for fetching changes after these, from the last page
+    """
+    events = []
+    sync_token = None
+    events_request = calendar_service.events().list(calendarId=calendar_id, singleEvents=True, **list_kwargs)
+    while events_request is not None:
+        events_result = events_request.execute()
+        events.extend(events_result.get('items', []))
+        sync_token = events_result.get('nextSyncToken', sync_token)
+        events_request = calendar_service.events().list_next(events_request, events_result)
+
+    return events, sync_token
+
+
+def sync(calendar_service, calendar_id: str, store: CalendarEventStore = None):
+    """
+    Brings the stored copy of a calendar up to date.  If the calendar has been synced before only the changes since
+    then are requested, otherwise (or if google no longer accepts the sync token) every event is requested - the full
+    calendar history, as a full sync cannot be bounded in time (see _list_events).
+
+    :param calendar_service: (googleapiclient.discovery.Resource) the google calendar service
+    :param calendar_id: (str) the ID of the google calendar
+    :param store: (CalendarEventStore, default default_store) where the events are stored
+    :return: (int) the number of events received
+    """
+    if store is None:
+        store = default_store
+
+    sync_token = store.sync_token(calendar_id)
+    if sync_token is not None:
+        try:
+            events, next_sync_token = _list_events(calendar_service, calendar_id, syncToken=sync_token)
+        except HttpError as e:
+            if e.resp.status != 410:  # 410 Gone: the sync token has expired
+                raise
+            calendar_sync_logger.info("Calendar sync token expired, running a full sync.  Calendar: " + calendar_id)
+        else:
+            store.apply(calendar_id, events, next_sync_token, full=False)
+            calendar_sync_logger.info("Calendar incremental sync: {} changed events.  Calendar: {}"
+                                      .format(len(events), calendar_id))
+            return len(events)
+
+    events, next_sync_token = _list_events(calendar_service, calendar_id)
+    store.apply(calendar_id, events, next_sync_token, full=True)
+    calendar_sync_logger.info("Calendar full sync: {} events.  Calendar: {}".format(len(events), calendar_id))
+    return len(events)
+
+
+default_store = CalendarEventStore(path=event_store_path)
@@ -5,3 +5,14 @@ WEATHER_LANGUAGE = 'english'  # 'english' or 'portuguese' or 'random'
 WAIT_TIME = datetime.timedelta(minutes=5)
 START_TIME = datetime.time(hour=6, minute=45)
 END_TIME = datetime.time(hour=22, minute=30)
+TEXT_RENDERER = 'atlas'  # 'atlas' (pre-rasterized glyphs) or 'freetype' (ImageDraw.multiline_text)
+LAYOUT_PROCESSES = None  # processes for laying out text messages ahead of display.  None for one per core
+FACTORY_WORKERS = 8  # message factories (network requests) run at once when generating the message list
+FACTORY_TIMEOUT = 120  # seconds to wait for each message factory before skipping its messages.  None for no limit
+DRIVE_DOWNLOAD_WORKERS = 4  # google drive images downloaded at once
+IMAGE_DITHER = 'floyd-steinberg'  # images fitted to the sign: 'floyd-steinberg', 'ordered' or 'threshold'
+IMAGE_THRESHOLD = 128  # gray level (0-255) at or above which a pixel is set, for IMAGE_DITHER = 'threshold'
+ACCUWEATHER_DAILY_LIMIT = 50  # accuweather API requests allowed in any 24 hours (the free tier limit)
+ACCUWEATHER_MAX_TTL_STRETCH = 4  # factor by which weather cache lifetimes are stretched as the daily limit is reached
+WEATHER_PREFETCH_LEAD = 15 * 60  # seconds before expiry to refresh the forecasts of weather messages in the background
+WEATHER_PREFETCH_INTERVAL = 60  # seconds between checks of the weather message forecasts
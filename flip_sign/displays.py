@@ -1,6 +1,7 @@
 from serial import Serial
 from flip_sign.message_generation import ImageMessage
 import flip_sign.transitions as transitions
+import flip_sign.layout_stats as layout_stats
 from urllib.error import URLError
 from PIL import Image
 import copy
@@ -199,7 +200,8 @@ class FlipDotDisplay(object):
         """
 
         try:
-            next_message.render()
+            with layout_stats.attribute_to(str(next_message)):
+                next_message.render()
         except (ValueError, URLError) as e:
             displays_logger.warning("Error rendering message.")
             displays_logger.warning("Full error: " + str(e))
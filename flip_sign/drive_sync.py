@@ -0,0 +1,364 @@
+import json
+import logging
+import os
+import pathlib
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from flip_sign.assets import root_dir
+import flip_sign.helpers as hlp
+import flip_sign.google_services as google_services
+import flip_sign.config as config
+from googleapiclient.errors import HttpError
+
+logger_name = 'flip_sign.drive_sync'
+drive_sync_logger = logging.getLogger(logger_name)
+
+images_dir = root_dir + "/cache/google_drive_images"
+manifest_path = root_dir + "/cache/google_drive_manifest.json"
+listing_path = root_dir + "/cache/google_drive_listing.json"
+
+file_fields = "id, name, sha256Checksum, trashed"
+# a folder query the changes feed can stand in for: every file with the folder as a parent
+_folder_query = re.compile(r"^\s*'([^']+)'\s+in\s+parents\s*$")
+
+
+class DriveManifest(object):
+    """
+    A record of the google drive images in the local cache: for each file name, the drive file id and sha256 checksum
+    of the downloaded file, and the size and modification time of the local copy.  While the local copy's size and
+    modification time are unchanged it is known to match the checksum without reading it.
+    """
+    def __init__(self, path: str):
+        """
+        Initializes the manifest.  The file is read on first use.
+
+        :param path: (str) the path of the manifest file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = None
+        self._changed = False
+
+    def _load(self):
+        """
+        Reads the manifest from disk, if it has not already been read.
+
+        :return: (dict) file name -> entry dict
+        """
+        if self._entries is None:
+            self._entries = {}
+            try:
+                with open(self.path, 'r') as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                drive_sync_logger.warning("Unable to read drive manifest, images will be checked again.  Path: " +
+                                          self.path + " Error: " + str(e))
+        return self._entries
+
+    def get(self, name: str):
+        """
+        :param name: (str) the file name
+        :return: (dict or None) the entry for the file - id, sha256, size and mtime_ns - or None if not recorded
+        """
+        with self._lock:
+            return self._load().get(name)
+
+    def record(self, name: str, file_id: str, checksum: str, file_path: pathlib.Path):
+        """
+        Records that the local copy of a file matches a checksum, along with the copy's current size and modification
+        time.  Nothing is recorded if there is no local copy.
+
+        :param name: (str) the file name
+        :param file_id: (str) the google drive file id
+        :param checksum: (str) the sha256 checksum of the file
+        :param file_path: (pathlib.Path) the local copy
+        :return: None
+        """
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._load()[name] = {'id': file_id, 'sha256': checksum, 'size': stat.st_size,
+                                  'mtime_ns': stat.st_mtime_ns}
+            self._changed = True
+
+    def save(self):
+        """
+        Writes the manifest to disk if it has changed, via a temporary file so that a crash never leaves a partially
+        written manifest.
+
+        :return: None
+        """
+        with self._lock:
+            if not self._changed:
+                return
+            temp_path = self.path + ".tmp"
+            try:
+                with open(temp_path, 'w') as f:
+                    json.dump(self._load(), f)
+                os.replace(temp_path, self.path)
+                self._changed = False
+            except OSError as e:
+                drive_sync_logger.warning("Unable to save drive manifest.  Path: " + self.path + " Error: " + str(e))
+
+
+def is_current(file: dict, file_path: pathlib.Path, manifest: DriveManifest = None):
+    """
+    Checks whether the local copy of a google drive file matches the drive version.  Files recorded in the manifest
+    with their current size and modification time are compared by the recorded checksum, others are hashed (and
+    recorded if they match).
+
+    :param file: (dict) the drive file resource, with id, name and sha256Checksum
+    :param file_path: (pathlib.Path) the local copy
+    :param manifest: (DriveManifest, default default_manifest) the record of the local copies
+    :return: (bool) whether the local copy is up to date
+    """
+    if manifest is None:
+        manifest = default_manifest
+
+    entry = manifest.get(file['name'])
+    if entry is not None and entry['sha256'] == file['sha256Checksum']:
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return False
+        if (stat.st_size, stat.st_mtime_ns) == (entry['size'], entry['mtime_ns']):
+            return True
+
+    if hlp.sha256_with_default(file_path) == file['sha256Checksum']:
+        manifest.record(file['name'], file['id'], file['sha256Checksum'], file_path)
+        return True
+
+    return False
+
+
+# the download threads, kept between syncs so that each reuses the drive service google_services built for it
+_download_executor = None
+_download_executor_workers = 0
+_download_executor_lock = threading.Lock()
+
+
+def _download_pool(max_workers: int):
+    """
+    Gets the thread pool for downloads, starting it (or restarting it with a different size) if needed.
+
+    :param max_workers: (int) the maximum number of downloads at once
+    :return: (ThreadPoolExecutor) the pool
+    """
+    global _download_executor, _download_executor_workers
+    with _download_executor_lock:
+        if _download_executor is not None and _download_executor_workers != max_workers:
+            _download_executor.shutdown(wait=False)
+            _download_executor = None
+        if _download_executor is None:
+            _download_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='drive-download')
+            _download_executor_workers = max_workers
+        return _download_executor
+
+
+def _download(file: dict, file_path: pathlib.Path):
+    """
+    Downloads a drive file on a worker thread, using the thread's own drive service.
+
+    :param file: (dict) the drive file resource, with id and name
+    :param file_path: (pathlib.Path) where to save the file
+    :return: None
+    """
+    hlp.download_file_google_drive(file_id=file['id'], out_path=file_path,
+                                   drive_service=google_services.service('drive', 'v3'))
+
+
+def download_files(downloads: list, manifest: DriveManifest = None, max_workers: int = None):
+    """
+    Downloads drive files concurrently and records them in the manifest.  Each file is written to a temporary file
+    and moved into place when complete, so a failed download leaves the previous copy in place.  Errors are passed on
+    once every download has finished.
+
+    :param downloads: (list) (file resource, pathlib.Path) pairs to download
+    :param manifest: (DriveManifest, default default_manifest) the record of the local copies
+    :param max_workers: (int, default config.DRIVE_DOWNLOAD_WORKERS) the maximum number of downloads at once
+    :return: None
+    """
+    if manifest is None:
+        manifest = default_manifest
+    if max_workers is None:
+        max_workers = config.DRIVE_DOWNLOAD_WORKERS
+
+    errors = []
+    if downloads:
+        executor = _download_pool(max_workers)
+        futures = [executor.submit(_download, file, file_path) for file, file_path in downloads]
+        wait(futures)
+
+        for future, (file, file_path) in zip(futures, downloads):
+            if future.exception() is not None:
+                errors.append(future.exception())
+                continue
+            manifest.record(file['name'], file['id'], file['sha256Checksum'], file_path)
+        drive_sync_logger.info("Downloaded {} of {} drive images.".format(len(downloads) - len(errors),
+                                                                          len(downloads)))
+
+    manifest.save()
+    if errors:
+        raise errors[0]
+
+
+class DriveListingStore(object):
+    """
+    Keeps the listing of each google drive folder along with the changes feed page token it is current as of, saved
+    to disk so that after a restart only the changes since need to be fetched.
+    """
+    def __init__(self, path: str):
+        """
+        Initializes the store.  The file is read on first use.
+
+        :param path: (str) the path of the store file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._folders = None
+
+    def _load(self):
+        """
+        Reads the stored listings from disk, if they have not already been read.
+
+        :return: (dict) folder query -> {'page_token': str, 'files': {file id: file resource}}
+        """
+        if self._folders is None:
+            self._folders = {}
+            try:
+                with open(self.path, 'r') as f:
+                    self._folders = json.load(f)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                drive_sync_logger.warning("Unable to read drive listings, folders will be listed again.  Path: " +
+                                          self.path + " Error: " + str(e))
+        return self._folders
+
+    def get(self, drive_folder: str):
+        """
+        :param drive_folder: (str) the folder query
+        :return: (dict or None) the page token and files of the folder, or None if it has not been listed
+        """
+        with self._lock:
+            return self._load().get(drive_folder)
+
+    def set(self, drive_folder: str, page_token: str, files: dict):
+        """
+        Stores the listing of a folder and saves the store to disk, via a temporary file so that a crash never leaves a
+        partially written file.
+
+        :param drive_folder: (str) the folder query
+        :param page_token: (str) the changes feed page token the listing is current as of
+        :param files: (dict) file id -> file resource
+        :return: None
+        """
+        with self._lock:
+            folders = self._load()
+            folders[drive_folder] = {'page_token': page_token, 'files': files}
+            temp_path = self.path + ".tmp"
+            try:
+                with open(temp_path, 'w') as f:
+                    json.dump(folders, f)
+                os.replace(temp_path, self.path)
+            except (OSError, TypeError, ValueError) as e:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                drive_sync_logger.warning("Unable to save drive listings.  Path: " + self.path + " Error: " + str(e))
+
+
+def _full_listing(drive_service, drive_folder: str):
+    """
+    Lists every file matching the folder query, page by page.
+
+    :param drive_service: (googleapiclient.discovery.Resource) the drive v3 service
+    :param drive_folder: (str) the folder query
+    :return: (dict) file id -> file resource, including trashed files
+    """
+    files_request = drive_service.files().list(q=drive_folder, fields="nextPageToken, files(" + file_fields + ")")
+
+    files = {}
+    while files_request is not None:
+        files_result = files_request.execute()
+        files.update((file['id'], file) for file in files_result.get('files', []))
+        files_request = drive_service.files().list_next(files_request, files_result)
+
+    return files
+
+
+def _apply_changes(drive_service, folder_id: str, page_token: str, files: dict):
+    """
+    Fetches the changes feed from a page token and applies it to a folder listing: files added to or changed in the
+    folder are stored, files removed, trashed or moved out of it are dropped.
+
+    :param drive_service: (googleapiclient.discovery.Resource) the drive v3 service
+    :param folder_id: (str) the drive id of the folder
+    :param page_token: (str) the page token the listing is current as of
+    :param files: (dict) file id -> file resource, updated in place
+    :return: (tuple) the page token the listing is now current as of, and the number of changes received
+    """
+    fields = "nextPageToken, newStartPageToken, changes(fileId, removed, file(" + file_fields + ", parents))"
+    received = 0
+    while True:
+        result = drive_service.changes().list(pageToken=page_token, spaces='drive', fields=fields).execute()
+        for change in result.get('changes', []):
+            received += 1
+            file = change.get('file')
+            if change.get('removed') or file is None or file.get('trashed') or \
+                    folder_id not in file.get('parents', []):
+                files.pop(change['fileId'], None)
+            else:
+                files[change['fileId']] = {key: value for key, value in file.items() if key != 'parents'}
+
+        if 'newStartPageToken' in result:
+            return result['newStartPageToken'], received
+        page_token = result['nextPageToken']
+
+
+def list_folder(drive_service, drive_folder: str, store: DriveListingStore = None):
+    """
+    Lists the files in a google drive folder.  The first time a folder is seen it is listed in full and the changes
+    feed page token saved; afterwards only the changes since are fetched (usually a single request).  Folders whose
+    query is not simply "'<folder id>' in parents", or whose page token is rejected, are listed in full.
+
+    :param drive_service: (googleapiclient.discovery.Resource) the drive v3 service
+    :param drive_folder: (str) the folder query
+    :param store: (DriveListingStore, default default_listing_store) the stored folder listings
+    :return: (list) the file resources in the folder (id, name, sha256Checksum, trashed), excluding trashed files
+    """
+    if store is None:
+        store = default_listing_store
+
+    folder_match = _folder_query.match(drive_folder)
+    if folder_match is None:
+        files = _full_listing(drive_service, drive_folder)
+        return [file for file in files.values() if not file['trashed']]
+
+    stored = store.get(drive_folder)
+    files = None
+    if stored is not None:
+        files = dict(stored['files'])
+        try:
+            page_token, received = _apply_changes(drive_service, folder_match.group(1), stored['page_token'], files)
+            drive_sync_logger.debug("Received {} drive changes for {}".format(received, drive_folder))
+        except HttpError as e:
+            drive_sync_logger.warning("Drive changes unavailable, listing the folder in full.  Folder: " +
+                                      drive_folder + " Error: " + str(e))
+            files = None
+
+    if files is None:
+        # the token is taken before listing, so anything changed during the listing is picked up next time
+        page_token = drive_service.changes().getStartPageToken().execute()['startPageToken']
+        files = _full_listing(drive_service, drive_folder)
+
+    store.set(drive_folder, page_token, files)
+    return [file for file in files.values() if not file['trashed']]
+
+
+default_manifest = DriveManifest(path=manifest_path)
+default_listing_store = DriveListingStore(path=listing_path)
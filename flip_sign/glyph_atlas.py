@@ -0,0 +1,409 @@
+import logging
+import math
+import os
+import string
+from collections import namedtuple
+from typing import Union
+from PIL import Image, ImageDraw, ImageFont
+
+logger_name = 'flip_sign.glyph_atlas'
+glyph_atlas_logger = logging.getLogger(logger_name)
+
+# lookup table to reverse the bits in a byte.  PIL packs mode '1' rows most-significant-bit first, while the atlas
+# keeps rows as python ints with the leftmost pixel in the least significant bit (so shifting left moves right)
+_REVERSE_BITS = bytes(int('{:08b}'.format(i)[::-1], 2) for i in range(256))
+
+# glyph used as a fixed point when measuring where FreeType places other glyphs vertically
+_REFERENCE_CHARACTER = 'H'
+
+DEFAULT_CHARACTERS = string.printable.strip() + ' ' + 'ÀÁÂÃÇÉÊÍÓÔÕÚàáâãçéêíóôõúü’'
+
+# a single pre-rasterized glyph.  offsets are in pixels, relative to the pen position on the baseline
+#   advance: (int) the pen advance, in 26.6 fixed point (as used internally by FreeType)
+#   cbox_left, cbox_top: (int) the outline control box left edge (clamped <= 0) and top (clamped >= 0)
+#   left, top: (int) the position of the first inked column / row (top is measured upwards from the baseline)
+#   rows: (tuple) one int per inked row, leftmost pixel in the least significant bit
+#   valid: (bool) whether the glyph reproduces FreeType output exactly when drawn from the atlas
+glyph_bitmap = namedtuple('glyph_bitmap', ['advance', 'cbox_left', 'cbox_top', 'left', 'top', 'rows', 'valid'])
+
+
+def _pixel(value: int):
+    """
+    Rounds a 26.6 fixed point value to whole pixels, the same way as the PIXEL macro in Pillow's FreeType wrapper.
+
+    :param value: (int) the value in 26.6 fixed point
+    :return: (int) the value in pixels
+    """
+    return (value + 32) >> 6
+
+
+def _image_to_rows(image: Image.Image):
+    """
+    Converts a mode '1' image into a list of ints, one per row, with the leftmost pixel in the least significant bit.
+
+    :param image: (PIL.Image) the mode '1' image to convert
+    :return: (list) the rows of the image as ints
+    """
+    row_bytes = (image.width + 7) // 8
+    data = image.tobytes()
+    return [int.from_bytes(data[i:i + row_bytes].translate(_REVERSE_BITS), 'little')
+            for i in range(0, len(data), row_bytes)]
+
+
+def rows_to_image(rows: list, size: tuple):
+    """
+    Packs a list of row ints (leftmost pixel in the least significant bit) into a mode '1' image.
+
+    :param rows: (list) the rows, from top to bottom.  must be exactly size[1] long
+    :param size: (tuple) the size of the output image (width, height)
+    :return: (PIL.Image) the packed mode '1' image
+    """
+    row_bytes = (size[0] + 7) // 8
+    width_mask = (1 << size[0]) - 1
+    data = b''.join((row & width_mask).to_bytes(row_bytes, 'little').translate(_REVERSE_BITS) for row in rows)
+    return ink_image(Image.frombytes('1', size, data))
+
+
+def ink_image(mask: Image.Image):
+    """
+    Redraws a mode '1' image with set pixels of value 1, as ImageDraw draws text with fill=1.  Images decoded from
+    packed bytes hold 255 for set pixels, which packs to the same bytes but reads differently through getdata and
+    ImageChops.
+
+    :param mask: (PIL.Image) the mode '1' image
+    :return: (PIL.Image) the same image, set pixels 1
+    """
+    image = Image.new('1', mask.size, 0)
+    image.paste(1, mask=mask)
+    return image
+
+
+class GlyphAtlas(object):
+    """
+    A cache of pre-rasterized 1-bit glyphs for a single font at a single size.  Lays out and composes multiline text
+    by OR-ing glyph rows directly into a packed frame buffer, following the same placement rules that FreeType uses
+    inside ImageDraw.multiline_text for mode '1' images with the basic layout engine.  Each glyph is checked against
+    FreeType when it is first loaded; text containing a glyph that fails the check is reported as unsupported so that
+    callers can fall back to ImageDraw.
+    """
+    def __init__(self, font: ImageFont.FreeTypeFont, ascender: int = None, line_height: int = None,
+                 glyphs: dict = None):
+        """
+        Initializes the atlas.  Glyphs are rasterized lazily, or up front using the preload method.  Metrics and
+        glyphs previously built for the same font and size (e.g. from the asset bundle) can be provided instead.
+
+        :param font: (PIL.ImageFont.FreeTypeFont) the font (and size) for this atlas
+        :param ascender: (int, default None) the font ascender, measured from the font if None
+        :param line_height: (int, default None) the height of the letter 'A', measured from the font if None
+        :param glyphs: (dict, default None) pre-rasterized glyph_bitmap namedtuples, keyed by character
+        """
+        self.font = font
+        self.glyphs = dict(glyphs) if glyphs is not None else {}
+        self.kerning = {}
+        self.ascender = ascender if ascender is not None else font.getmetrics()[0]
+        # matches ImageDraw._multiline_spacing: the bottom of the letter 'A' plus the requested spacing
+        self.line_height = line_height if line_height is not None else font.getbbox("A", mode='1')[3]
+
+    def preload(self, characters: str = DEFAULT_CHARACTERS):
+        """
+        Rasterizes all the provided characters into the atlas.
+
+        :param characters: (str) the characters to load
+        :return: None
+        """
+        for character in characters:
+            self.glyph(character)
+
+    def glyph(self, character: str):
+        """
+        Returns the glyph for a character, rasterizing it if it is not yet in the atlas.
+
+        :param character: (str) a single character
+        :return: (glyph_bitmap) the pre-rasterized glyph
+        """
+        try:
+            return self.glyphs[character]
+        except KeyError:
+            pass
+
+        try:
+            glyph = self._rasterize(character)
+        except (OSError, ValueError) as e:
+            glyph_atlas_logger.info("Unable to rasterize glyph: " + repr(character) + " Error: " + str(e))
+            glyph = glyph_bitmap(0, 0, 0, 0, 0, (), False)
+
+        self.glyphs[character] = glyph
+        return glyph
+
+    def _rasterize(self, character: str):
+        """
+        Rasterizes a character using FreeType and verifies that drawing it from the atlas matches FreeType exactly.
+
+        FreeType positions the text box using the glyph outlines but places the glyphs using their bitmaps, which can
+        differ by a pixel.  The bitmap offsets are therefore measured by drawing the character after a reference
+        glyph, separated by blank space so nothing overlaps or is clipped.
+
+        :param character: (str) a single character
+        :return: (glyph_bitmap) the rasterized glyph
+        """
+        advance = round(self.font.getlength(character, mode='1') * 64)
+        cbox = self.font.getbbox(character, mode='1', anchor='ls')
+
+        size = max(self.font.size, 1)
+        probe = _REFERENCE_CHARACTER + ' ' * 4 + character
+        pen = round(self.font.getlength(probe, mode='1') * 64) - advance
+        reference_end = _pixel(round(self.font.getlength(_REFERENCE_CHARACTER, mode='1') * 64))
+        origin = (size, 3 * size)
+        canvas = Image.new('1', (_pixel(pen) + 6 * size, 5 * size), 0)
+        ImageDraw.Draw(canvas).text(origin, probe, font=self.font, fill=1, anchor='ls')
+
+        split = origin[0] + (reference_end + _pixel(pen)) // 2
+        reference_ink = canvas.crop((0, 0, split, canvas.height)).getbbox()
+        ink = canvas.crop((split, 0, canvas.width, canvas.height)).getbbox()
+
+        if ink is None:
+            glyph = glyph_bitmap(advance, cbox[0], -cbox[1], 0, 0, (), True)
+        else:
+            rows = tuple(_image_to_rows(canvas.crop((split + ink[0], ink[1], split + ink[2], ink[3]))))
+            reference_top = -self.font.getbbox(_REFERENCE_CHARACTER, mode='1', anchor='ls')[1]
+            glyph = glyph_bitmap(advance, cbox[0], -cbox[1], split + ink[0] - origin[0] - _pixel(pen),
+                                 reference_top + reference_ink[1] - ink[1], rows, True)
+
+        # verify the glyph on its own at whole and half-pixel positions, and next to the reference glyph
+        self.glyphs[character] = glyph
+        for text, x in ((character, size), (character, size + 0.5),
+                        (_REFERENCE_CHARACTER + character, size), (character + _REFERENCE_CHARACTER, size)):
+            reference = Image.new('1', canvas.size, 0)
+            ImageDraw.Draw(reference).text((x, size), text, font=self.font, fill=1, anchor='la')
+            rows = [0] * canvas.height
+            self._compose_line(rows, self.layout_line(text)[0], (x, size))
+            if rows_to_image(rows, canvas.size).tobytes() != reference.tobytes():
+                glyph_atlas_logger.info("Glyph does not match FreeType output, not using atlas: " + repr(character))
+                return glyph._replace(valid=False)
+
+        return glyph
+
+    def _kerning(self, previous: str, character: str):
+        """
+        Returns the kerning adjustment between two characters, in 26.6 fixed point.
+
+        :param previous: (str) the preceding character
+        :param character: (str) the current character
+        :return: (int) the adjustment to the pen position
+        """
+        try:
+            return self.kerning[(previous, character)]
+        except KeyError:
+            pair_advance = round(self.font.getlength(previous + character, mode='1') * 64)
+            kerning = pair_advance - self.glyph(previous).advance - self.glyph(character).advance
+            self.kerning[(previous, character)] = kerning
+            return kerning
+
+    def supports(self, text: Union[str, list]):
+        """
+        Checks whether every glyph in the text can be drawn from the atlas.
+
+        :param text: (str or list) the text to check
+        :return: (bool) whether the atlas can draw the text exactly
+        """
+        if isinstance(text, list):
+            text = '\n'.join(text)
+        return all(self.glyph(character).valid for character in text if character != '\n')
+
+    def layout_line(self, line: str):
+        """
+        Lays out a single line of text.
+
+        :param line: (str) the line of text
+        :return: (placements, advance):
+                placements: (list) (glyph, pen position in 26.6 fixed point) for each character
+                advance: (int) the total advance of the line, in 26.6 fixed point
+        """
+        placements = []
+        pen = 0
+        previous = None
+        for character in line:
+            if previous is not None:
+                pen += self._kerning(previous, character)
+            glyph = self.glyph(character)
+            placements.append((glyph, pen))
+            pen += glyph.advance
+            previous = character
+        return placements, pen
+
+    def _compose_line(self, rows: list, placements: list, xy: tuple):
+        """
+        ORs a laid-out line into the frame rows, positioned as ImageDraw.text would with anchor 'la'.  Pixels to the
+        left of or above the frame are dropped, pixels to the right are kept (callers mask them off if needed).
+
+        :param rows: (list) the frame buffer rows, modified in place
+        :param placements: (list) the output of layout_line
+        :param xy: (tuple) the position of the line, as passed to ImageDraw.text
+        :return: None
+        """
+        if not placements:
+            return
+
+        cbox_left = min(0, min(glyph.cbox_left + _pixel(pen) for glyph, pen in placements))
+        bitmap_left = min(0, min(glyph.left + _pixel(pen) for glyph, pen in placements))
+        cbox_top = max(0, max(glyph.cbox_top for glyph, _ in placements))
+        bitmap_top = max(0, max(glyph.top for glyph, _ in placements))
+
+        x_start = math.modf(xy[0])[0]
+        y_start = math.modf(xy[1])[0]
+        pen_x = int((-bitmap_left + x_start) * 64)
+        pen_y = _pixel(int((-bitmap_top - y_start) * 64))
+        base_column = int(xy[0]) + cbox_left
+        base_row = int(xy[1]) + self.ascender - cbox_top
+
+        for glyph, pen in placements:
+            if not glyph.rows:
+                continue
+            column = base_column + _pixel(pen_x + pen) + glyph.left
+            row = base_row - (pen_y + glyph.top)
+            for glyph_row in glyph.rows:
+                if 0 <= row < len(rows):
+                    if column >= 0:
+                        rows[row] |= glyph_row << column
+                    else:
+                        rows[row] |= glyph_row >> -column
+                row += 1
+
+    def _compose(self, rows: list, xy: tuple, text: str, spacing: int, align: str):
+        """
+        Composes multiline text into the frame rows, following ImageDraw.multiline_text with anchor 'la'.
+
+        :param rows: (list) the frame buffer rows, modified in place
+        :param xy: (tuple) the position of the text
+        :param text: (str) the text, with lines separated by newlines
+        :param spacing: (int) the line spacing, as per ImageDraw.multiline_text
+        :param align: ('left', 'center', 'right') the text alignment
+        :return: None
+        """
+        lines = [self.layout_line(line) for line in text.split('\n')]
+        max_width = max(advance / 64 for _, advance in lines)
+        line_spacing = self.line_height + spacing
+
+        top = xy[1]
+        for placements, advance in lines:
+            left = xy[0]
+            width_difference = max_width - advance / 64
+            if align == 'left':
+                pass
+            elif align == 'center':
+                left += width_difference / 2.0
+            elif align == 'right':
+                left += width_difference
+            else:
+                raise ValueError('align must be "left", "center" or "right"')
+            self._compose_line(rows, placements, (left, top))
+            top += line_spacing
+
+    def draw_multiline_text(self, size: tuple, xy: tuple, text: Union[str, list], spacing: int, align: str):
+        """
+        Draws text onto a new black mode '1' image, pixel-for-pixel identical to ImageDraw.multiline_text.
+
+        :param size: (tuple) the size of the image
+        :param xy: (tuple) the position of the text, as per ImageDraw.multiline_text with anchor 'la'
+        :param text: (str or list) the text to draw
+        :param spacing: (int) the line spacing, as per ImageDraw.multiline_text
+        :param align: ('left', 'center', 'right') the text alignment
+        :return: (PIL.Image) the drawn text
+        """
+        if isinstance(text, list):
+            text = '\n'.join(text)
+        rows = [0] * size[1]
+        self._compose(rows, xy, text, spacing, align)
+        return rows_to_image(rows, size)
+
+    def text_bbox_size(self, text: Union[str, list], line_spacing: int, align: str):
+        """
+        Drop-in replacement for helpers.text_bbox_size which measures the text from the atlas without drawing it.
+
+        :param text: (str or list) the message to be sized
+        :param line_spacing: (int) the spacing between lines, as per PIL.ImageDraw.multiline_text
+        :param align: (str) 'center' or 'left' or 'right'
+        :return: size (tuple), target (tuple), as per helpers.text_bbox_size.  None if the text has no ink to measure.
+        """
+        if isinstance(text, list):
+            text = '\n'.join(text)
+
+        # same layout as the measurement canvas in helpers.text_bbox_size: text drawn at (10, 10)
+        rows = [0] * (len(text.split('\n')) * (self.line_height + max(line_spacing, 0)) + 4 * self.font.size + 20)
+        self._compose(rows, (10, 10), text, line_spacing, align)
+
+        inked = [i for i, row in enumerate(rows) if row]
+        if not inked:
+            return None
+        left = min((row & -row).bit_length() - 1 for row in rows if row)
+        right = max(row.bit_length() for row in rows if row)
+        bbox = (left, inked[0], right, inked[-1] + 1)
+
+        # the measurement canvas grows to at most 8192 pixels and must keep the text within 70% of it
+        if bbox[2] >= 8192 * 0.7 or bbox[3] >= 8192 * 0.7:
+            raise ValueError("Font too large.")
+
+        return (bbox[2] - bbox[0], bbox[3] - bbox[1]), (10 - bbox[0], 10 - bbox[1])
+
+
+_atlases = {}
+_bundled = {}
+
+
+def register_bundled(font_path: str, font_size: int, loader: callable):
+    """
+    Registers pre-built glyphs and metrics for a font and size (e.g. from the asset bundle).  They are used when the
+    atlas for that font is first created, instead of measuring the font and rasterizing the glyphs again.
+
+    :param font_path: (str) the path of the font file
+    :param font_size: (int) the font size
+    :param loader: (callable) returns (ascender, line_height, glyphs dict) when called
+    :return: None
+    """
+    _bundled[(os.path.realpath(font_path), font_size)] = loader
+
+
+def clear_bundled():
+    """
+    Forgets all glyphs registered with register_bundled.  Atlases already created from them are kept.
+
+    :return: None
+    """
+    _bundled.clear()
+
+
+def get_atlas(font: ImageFont.FreeTypeFont):
+    """
+    Returns the shared glyph atlas for a font, creating it if necessary.
+
+    :param font: (PIL.ImageFont.FreeTypeFont) the font
+    :return: (GlyphAtlas) the atlas for the font path and size
+    """
+    key = (font.path, font.size, font.index, font.layout_engine)
+    try:
+        return _atlases[key]
+    except KeyError:
+        loader = None
+        if isinstance(font.path, str) and font.index == 0 and font.layout_engine == ImageFont.LAYOUT_BASIC:
+            loader = _bundled.get((os.path.realpath(font.path), font.size))
+        if loader is not None:
+            ascender, line_height, glyphs = loader()
+            atlas = GlyphAtlas(font, ascender=ascender, line_height=line_height, glyphs=glyphs)
+        else:
+            atlas = GlyphAtlas(font)
+        _atlases[key] = atlas
+        return atlas
+
+
+def preload(wrap_parameter_sets, characters: str = DEFAULT_CHARACTERS):
+    """
+    Rasterizes the glyphs for every font and size in the provided wrap parameter sets.  Intended to be called at
+    startup so that the first renders do not pay the cost of building the atlases.
+
+    :param wrap_parameter_sets: (iterable) helpers.wrap_parameter_set namedtuples
+    :param characters: (str) the characters to load for each font
+    :return: None
+    """
+    for font_path, font_size in {(params.font_path, params.font_size) for params in wrap_parameter_sets}:
+        font = ImageFont.truetype(font_path, size=font_size, layout_engine=ImageFont.LAYOUT_BASIC)
+        get_atlas(font).preload(characters)
@@ -0,0 +1,121 @@
+import logging
+import threading
+import google_auth_httplib2
+from google.auth.transport.requests import Request as google_Request
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import UnknownApiNameOrVersion
+from googleapiclient.http import build_http
+from flip_sign.assets import keys
+import flip_sign.helpers as hlp
+
+logger_name = 'flip_sign.google_services'
+google_services_logger = logging.getLogger(logger_name)
+
+
+class GoogleServiceProvider(object):
+    """
+    Provides Google API service objects, sharing one set of credentials across the process.  Credentials are read
+    (and token.json written) only when first needed or when they can no longer be refreshed, and services are built
+    from the discovery documents shipped with the client library rather than fetched from Google.
+
+    Service objects are built once per (API, version) per thread: the httplib2 connection underneath a service is not
+    thread-safe, so each thread which makes requests gets its own.  The credentials and discovery documents are shared
+    by every thread.
+    """
+    def __init__(self, get_credentials: callable = None):
+        """
+        Initializes the provider.  Nothing is read until the first service is requested.
+
+        :param get_credentials: (callable, default helpers.get_credentials) loads credentials from token.json, or
+                                runs the OAuth flow if necessary
+        """
+        self._get_credentials = get_credentials
+        self._lock = threading.RLock()
+        self._credentials = None
+        self._generation = 0  # incremented whenever the credentials object is replaced
+        self._documents = {}
+        self._local = threading.local()
+        self.services_built = 0
+
+    def credentials(self):
+        """
+        The shared credentials, refreshed if they have expired.  token.json is rewritten only when the credentials are
+        refreshed or replaced.
+
+        :return: (google.oauth2.credentials.Credentials) valid credentials
+        """
+        with self._lock:
+            credentials = self._credentials
+            if credentials is None or (not credentials.valid and not (credentials.expired and
+                                                                        credentials.refresh_token)):
+                self._credentials = (self._get_credentials or hlp.get_credentials)()
+                self._generation += 1
+            elif not credentials.valid:
+                google_services_logger.debug("Refreshing Google API credentials.")
+                credentials.refresh(google_Request())
+                with open(keys['GOOGLE_TOKEN_PATH'], 'w') as token:
+                    token.write(credentials.to_json())
+            return self._credentials
+
+    def _document(self, api: str, version: str):
+        """
+        Reads the discovery document for an API from the client library, once per process.
+
+        :param api: (str) the API name, e.g. 'calendar'
+        :param version: (str) the API version, e.g. 'v3'
+        :return: (str) the discovery document
+        """
+        with self._lock:
+            try:
+                return self._documents[(api, version)]
+            except KeyError:
+                pass
+            document = get_static_doc(api, version)
+            if document is None:
+                raise UnknownApiNameOrVersion("No static discovery document for: " + api + " " + version)
+            self._documents[(api, version)] = document
+            return document
+
+    def service(self, api: str, version: str):
+        """
+        Returns the service object for an API, building it if this thread has not used the API before.
+
+        :param api: (str) the API name, e.g. 'calendar'
+        :param version: (str) the API version, e.g. 'v3'
+        :return: (googleapiclient.discovery.Resource) the service object
+        """
+        credentials = self.credentials()
+        with self._lock:
+            generation = self._generation
+
+        # services built on credentials which have since been replaced are discarded
+        if getattr(self._local, 'generation', None) != generation:
+            self._local.services = {}
+            self._local.generation = generation
+
+        try:
+            return self._local.services[(api, version)]
+        except KeyError:
+            pass
+
+        http = google_auth_httplib2.AuthorizedHttp(credentials, http=build_http())
+        service = build_from_document(self._document(api, version), http=http)
+        self._local.services[(api, version)] = service
+        with self._lock:
+            self.services_built += 1
+        return service
+
+
+default_provider = GoogleServiceProvider()
+
+
+def service(api: str, version: str):
+    """
+    Returns a service object from the shared provider.  See GoogleServiceProvider.service.
+
+    :param api: (str) the API name, e.g. 'calendar'
+    :param version: (str) the API version, e.g. 'v3'
+    :return: (googleapiclient.discovery.Resource) the service object
+    """
+    return default_provider.service(api, version)
@@ -1,26 +1,36 @@
 import logging
 import pathlib
-from urllib.request import Request, urlopen
-from urllib.parse import quote
+from urllib.parse import quote, urlsplit, urlunsplit, parse_qsl, urlencode
 import datetime as dt
 from googleapiclient.discovery import Resource
 from googleapiclient.http import MediaIoBaseDownload
-from cachetools import cached, TLRUCache, TTLCache
+from cachetools import cached, LRUCache
+from cachetools.keys import hashkey
 from typing import Union, Literal
 import json
-from PIL import ImageFont, ImageDraw, ImageChops, Image
+from PIL import ImageFont, ImageDraw, Image
 from tzlocal import get_localzone_name
 from pytz import timezone
 from math import acos, sin, cos, radians
 from hashlib import sha256
-import gzip
 import re
 import os
 import io
 import textwrap
+import threading
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from flip_sign.assets import root_dir, keys
+import flip_sign.glyph_atlas as glyph_atlas
+import flip_sign.asset_bundle as asset_bundle
+from flip_sign.response_cache import PersistentResponseCache
+from flip_sign.request_budget import RequestBudget
+import flip_sign.http_client as http_client
+import flip_sign.layout_stats as layout_stats
+import flip_sign.config as config
 import math
+import time
 from google.auth.transport.requests import Request as google_Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -59,45 +69,210 @@ def accuweather_cache_ttu(_key, value, now):
     return now + increment
 
 
-_accuweather_cache = TLRUCache(maxsize=10, ttu=accuweather_cache_ttu)
-@cached(cache=_accuweather_cache)
-def accuweather_api_request(url):
+def accuweather_cache_key(url: tuple):
     """
-    Requests the provided URL from the accuweather API and returns.  No errors are handled in this function,
-    all are passed along.  Results cached as per ttu function.
+    Builds the cache key for an accuweather request: the URL with the API key removed (so that changing the key does
+    not invalidate the cache, and the key is not written to disk) and the remaining query parameters sorted.
 
     :param url: (tuple) - ordered pieces of the url to request
+    :return: (str) the cache key
+    """
+    split_url = urlsplit(''.join(url))
+    query = sorted((name, value) for name, value in parse_qsl(split_url.query, keep_blank_values=True)
+                   if name.lower() != 'apikey')
+    return urlunsplit(split_url._replace(query=urlencode(query)))
+
+
+accuweather_cache_path = root_dir + "/cache/accuweather_cache.sqlite3"
+_accuweather_cache = PersistentResponseCache(path=accuweather_cache_path)
+accuweather_budget_path = root_dir + "/cache/accuweather_budget.sqlite3"
+_accuweather_budget = RequestBudget(path=accuweather_budget_path, limit=config.ACCUWEATHER_DAILY_LIMIT,
+                                    max_ttl_stretch=config.ACCUWEATHER_MAX_TTL_STRETCH)
+
+
+def _accuweather_fetch(url, priority: str):
+    """
+    Makes an accuweather request, if the request budget allows it at this priority.
+
+    :param url: (tuple) - ordered pieces of the url to request
+    :param priority: ('high', 'normal' or 'low') the priority of the request against the budget
+    :return: (dict) the json response from accuweather, parsed to dict
+    """
+    _accuweather_budget.acquire(priority)
+    return json.loads(http_client.get(''.join(url)))
+
+
+def accuweather_api_request(url, priority: Literal['high', 'normal', 'low'] = 'normal'):
+    """
+    Requests the provided URL from the accuweather API and returns.  Results are cached on disk as per the ttu
+    function, with the lifetimes stretched as the daily request budget runs down.  Concurrent identical requests share
+    a single fetch.  Requests the budget does not allow at this priority are not made (see request_budget).  If the
+    request fails or is not allowed and an expired result is cached, the expired result is returned, otherwise errors
+    are passed along.
+
+    :param url: (tuple) - ordered pieces of the url to request
+    :param priority: ('high', 'normal' or 'low') the priority of the request against the budget
     :return: (dict) the json response from accuweather, parsed to dict
     """
-    url_string = ''.join(url)
-    req = Request(url_string, headers={"Accept-Encoding": "gzip, deflate"})
-    response = json.loads(gzip.decompress(urlopen(req).read()))
+    return _accuweather_cache.get_or_fetch(key=accuweather_cache_key(url),
+                                           fetch=lambda: _accuweather_fetch(url, priority),
+                                           expiry=lambda response, now: accuweather_cache_ttu((url,), response, now),
+                                           is_fresh=lambda entry, now: now < _accuweather_refresh_due(entry, lead=0))
+
+
+def _accuweather_refresh_due(entry, lead: float):
+    """
+    When a cached accuweather response should be requested again: the lead time before it expires, once its lifetime
+    is stretched for the request budget.
+
+    :param entry: (response_cache.cache_entry) the cached response
+    :param lead: (float) how long before expiry to request it again, in seconds
+    :return: (float) the time, as a unix timestamp
+    """
+    stretched = entry.fetched + (entry.expires - entry.fetched) * _accuweather_budget.ttl_stretch()
+    return max(entry.expires, stretched) - lead
+
+
+def accuweather_prefetch(url, lead: float, priority: Literal['high', 'normal', 'low'] = 'low'):
+    """
+    Refreshes a cached accuweather response in the background if it expires within the lead time (or is not cached),
+    so that the next accuweather_api_request for it is served from the cache.  Nothing is requested if the budget does
+    not allow it at this priority; the response is then fetched when it is next needed, as usual.
+
+    :param url: (tuple) - ordered pieces of the url to request
+    :param lead: (float) how long before expiry to refresh, in seconds
+    :param priority: ('high', 'normal' or 'low') the priority of the request against the budget
+    :return: (bool) whether a request was made.  if it fails the cached response is kept, and if there is none the
+             error is passed along
+    """
+    key = accuweather_cache_key(url)
+    entry = _accuweather_cache.get(key)
+    if entry is not None and _accuweather_cache.timer() < _accuweather_refresh_due(entry, lead):
+        return False
+    if not _accuweather_budget.allows(priority):
+        helper_logger.debug("Not prefetching, request budget reserved for more important requests.  Key: " + key)
+        return False
+
+    _accuweather_cache.get_or_fetch(key=key, fetch=lambda: _accuweather_fetch(url, priority),
+                                    expiry=lambda response, now: accuweather_cache_ttu((url,), response, now),
+                                    is_fresh=lambda cached, now: now < _accuweather_refresh_due(cached, lead))
+    return True
+
+
+def accuweather_cache_info():
+    """
+    Hit/miss statistics for the accuweather response cache.
+
+    :return: (response_cache.cache_info) hits, misses, stale_hits, errors, coalesced and the number of cached responses
+    """
+    return _accuweather_cache.info()
+
+
+def accuweather_budget_info():
+    """
+    Usage of the daily accuweather request budget.
 
-    return response
+    :return: (request_budget.budget_info) requests used in the last 24 hours, the limit and requests refused
+    """
+    return _accuweather_budget.info()
+
+
+def normalize_location(location_string: str):
+    """
+    Normalizes a location string for geocoding: surrounding whitespace removed and runs of whitespace collapsed to a
+    single space.  The lower-cased result is used as the geocoding cache key, since the API ignores case.
+
+    :param location_string: (str) the location as entered, e.g. in a calendar event
+    :return: (str) the normalized location
+    """
+    return ' '.join(location_string.split())
+
+
+def geocoding_cache_ttu(value, now):
+    """
+    Returns the expiry time for cached geocoding results.  Found locations are cached for 30 days, locations the API
+    could not find for 1 day, so that an unfound location is not requested on every update.
+
+    :param value: the cached result - the location dict, or None if the location was not found
+    :param now: current unix timestamp
+    :return: (float) expiration time for the cached result
+    """
+    if value is None:
+        return now + 24 * 60 * 60
+    return now + 30 * 24 * 60 * 60
+
+
+geocoding_cache_path = root_dir + "/cache/geocoding_cache.sqlite3"
+_google_geocoding_cache = PersistentResponseCache(path=geocoding_cache_path)
 
 
-_google_geocoding_cache = TTLCache(maxsize=50, ttl=60*60*24*30)  # cache geocoding results for 30 days
-@cached(cache=_google_geocoding_cache)
 def geocode_to_lat_long(location_string: str):
     """
     Uses google's geocoding API to turn strings provided into lat/long coordinates.  Always chooses the most likely /
-    first option returned by the API.  Raises ValueError if location not found by google.  Does not handle any
-    HTTP exceptions - all are passed on.
+    first option returned by the API.  Raises ValueError if location not found by google.  Results (including
+    locations not found) are cached on disk, keyed on the normalized location.  If the request fails and the location
+    is cached, the expired cached result is returned; HTTP and network errors are only raised when nothing is cached.
 
     :param location_string: (str) - the location to be geocoded.
     :return: (dict): a dictionary containing {'lat': **latitude_value**, 'lng': **longitude_value**}
     """
+    location_string = normalize_location(location_string)
 
-    geocode_base_url = 'https://maps.googleapis.com/maps/api/geocode/json?address='
-    url_string = ''.join([geocode_base_url, quote(location_string), "&key=", keys['GoogleLocationAPI']])
-    req = Request(url_string)
-    response = json.loads(urlopen(req).read())
+    def fetch():
+        geocode_base_url = 'https://maps.googleapis.com/maps/api/geocode/json?address='
+        url_string = ''.join([geocode_base_url, quote(location_string), "&key=", keys['GoogleLocationAPI']])
+        response = json.loads(http_client.get(url_string))
 
-    if response['status'] == 'ZERO_RESULTS':
-        raise ValueError("Location not found by Google API.")
-    else:
+        if response['status'] == 'ZERO_RESULTS':
+            return None
         return response['results'][0]['geometry']['location']
 
+    location = _google_geocoding_cache.get_or_fetch(key=location_string.lower(), fetch=fetch,
+                                                    expiry=geocoding_cache_ttu)
+    if location is None:
+        raise ValueError("Location not found by Google API.")
+    return location
+
+
+def geocode_many(location_strings, max_workers: int = 8):
+    """
+    Geocodes several locations at once.  Locations are normalized and de-duplicated, and the unique locations are
+    resolved concurrently, so each unique location costs at most one request (none if it is cached).  As in
+    geocode_to_lat_long, a failed request returns the expired cached result if there is one, and HTTP and network
+    errors are only raised when nothing is cached.
+
+    :param location_strings: (iterable) the locations to be geocoded
+    :param max_workers: (int) the maximum number of concurrent requests
+    :return: (dict) each location string mapped to {'lat': .., 'lng': ..}, or to None if google could not find it
+    """
+    location_strings = list(location_strings)
+    unique_locations = {}
+    for location_string in location_strings:
+        unique_locations.setdefault(normalize_location(location_string).lower(), location_string)
+
+    def resolve(location_string):
+        try:
+            return geocode_to_lat_long(location_string)
+        except ValueError:
+            return None
+
+    results = {}
+    if unique_locations:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(unique_locations))) as executor:
+            results = dict(zip(unique_locations, executor.map(resolve, unique_locations.values())))
+
+    return {location_string: results[normalize_location(location_string).lower()]
+            for location_string in location_strings}
+
+
+def geocoding_cache_info():
+    """
+    Hit/miss statistics for the geocoding cache.
+
+    :return: (response_cache.cache_info) hits, misses, stale_hits, errors, coalesced and the number of cached results
+    """
+    return _google_geocoding_cache.info()
+
 
 def countdown_format(target_start, target_end, all_day):
     """
@@ -319,10 +494,20 @@ def text_bbox_size(font: ImageFont, text: Union[list, str], line_spacing: int, a
               target: the location to be fed to multiline_text to put the first pixel at the origin (x, y)
     """
 
+    layout_stats.record_measurement()
+
     # handle case of being passed a list - turn it into a string with newlines
     if isinstance(text, list):
         text = '\n'.join(text)
 
+    # measure from the glyph atlas if possible, which gives the same answer without drawing the text
+    if config.TEXT_RENDERER == 'atlas':
+        atlas = glyph_atlas.get_atlas(font)
+        if atlas.supports(text):
+            measurement = atlas.text_bbox_size(text=text, line_spacing=line_spacing, align=align)
+            if measurement is not None:
+                return measurement
+
     canvas_size = 1024
     finished_bbox = False
 
@@ -330,6 +515,7 @@ def text_bbox_size(font: ImageFont, text: Union[list, str], line_spacing: int, a
     while not finished_bbox:
         # create new image filled with black
         image = Image.new('1', (canvas_size, canvas_size), 0)
+        layout_stats.record_canvas(image.size)
         # draw the message on the canvas in the font at position 10,10 and get bbox
         draw = ImageDraw.Draw(image)
         draw.multiline_text(xy=(10, 10), text=text, font=font, anchor='la', spacing=line_spacing, align=align, fill=1)
@@ -354,6 +540,34 @@ def text_bbox_size(font: ImageFont, text: Union[list, str], line_spacing: int, a
     return (width, height), (target_x, target_y)
 
 
+def draw_multiline_text(size: tuple, xy: Union[tuple, list], text: str, font: ImageFont, spacing: int, align: str):
+    """
+    Draws multiline text on a new black image, as per PIL.ImageDraw.multiline_text with anchor 'la'.  Uses the glyph
+    atlas when config.TEXT_RENDERER is 'atlas' and every glyph in the text is supported, otherwise draws with FreeType.
+    Output is identical either way.
+
+    :param size: (tuple) the size of the image to draw on
+    :param xy: (tuple or list) the location of the text, as per PIL.ImageDraw.multiline_text
+    :param text: (str) the text to draw
+    :param font: (PIL.ImageFont) the font to be used
+    :param spacing: (int) the spacing between lines, as per PIL.ImageDraw.multiline_text
+    :param align: (str) 'center' or 'left' or 'right'
+    :return: (PIL.Image) the drawn text
+    """
+
+    layout_stats.record_canvas(size)
+
+    if config.TEXT_RENDERER == 'atlas':
+        atlas = glyph_atlas.get_atlas(font)
+        if atlas.supports(text):
+            return atlas.draw_multiline_text(size=size, xy=xy, text=text, spacing=spacing, align=align)
+
+    image = Image.new(mode='1', size=size, color=0)
+    ImageDraw.Draw(image).multiline_text(xy, text=text, spacing=spacing, font=font, fill=1, anchor='la', align=align)
+
+    return image
+
+
 def wrap_text_split_words(text: str, width: int, replace_whitespace: bool = True, drop_whitespace: bool = True,
                           max_lines: int = None, placeholder: str = '[...]', already_wrapped: list = []):
     """
@@ -436,6 +650,7 @@ def bbox_text_no_truncation(bbox_size: tuple, line_spacing: int, text: str, spli
             test_text = wrap_text_split_words(text, width=columns, **kwargs)
         else:
             test_text = textwrap.wrap(text, width=columns, **kwargs)
+        layout_stats.record_wrap_attempt()
 
         # check size with current number of columns
         check_size, _ = text_bbox_size(font=font, text=test_text, line_spacing=line_spacing, align=align)
@@ -494,6 +709,7 @@ def bbox_text_truncation(bbox_size: tuple, line_spacing: int, text: str, split_w
     while columns > 0:
         # wrap text using current number of columns
         test_text = wrap_func(text=text, width=columns, **kwargs)
+        layout_stats.record_wrap_attempt()
 
         # calculate size - if fits horizontally, break out.  if not, reduce number of columns
         check_size, _ = text_bbox_size(font=font, text=test_text, line_spacing=line_spacing, align=align)
@@ -511,6 +727,7 @@ def bbox_text_truncation(bbox_size: tuple, line_spacing: int, text: str, split_w
     lines = len(test_text)
     while lines > 0:
         # need to wrap in try-except to handle case where placeholder is too large for the columns
+        layout_stats.record_wrap_attempt()
         try:
             test_text = wrap_func(text=text, width=columns, max_lines=lines, **kwargs)
         except ValueError as e:
@@ -590,7 +807,9 @@ def draw_text_best_parameters(params_order: tuple, bbox_size: tuple, text: Union
     if type(text) == list and wrap_text:
         raise ValueError("wrap_text must be False if text is passed as list.")
 
-    for wrap_parameters in params_order:
+    start_time = time.perf_counter()
+
+    for params_index, wrap_parameters in enumerate(params_order):
         # select appropriate bbox function
         if not wrap_text:
             bbox_func = check_bbox_no_wrap
@@ -644,8 +863,14 @@ def draw_text_best_parameters(params_order: tuple, bbox_size: tuple, text: Union
             # calculate how much more whitespace we want within the text.  round it up to space out slightly more
             new_whitespace_within = math.ceil(whitespace_per_break * (num_whitespace_breaks - 2))
 
+            # block height grows by at most (lines - 1) pixels per pixel of line spacing, and by exactly that much
+            # unless lines overlap.  so no smaller spacing can add the desired whitespace: start from the closed-form
+            # answer, which is confirmed by a single measurement.  only overlapping lines need further iterations.
+            num_gaps = num_whitespace_breaks - 2
+            first_candidate = min(math.ceil(new_whitespace_within / num_gaps), extra_lines - 1)
+
             # iterate, adding to line_spacing until we have added the desired whitespace
-            for i in range(extra_lines):
+            for i in range(first_candidate, extra_lines):
                 text_size, draw_target = text_bbox_size(font=font, text=wrapped, line_spacing=line_spacing + i,
                                                         align=text_align)
                 # check if we have added the desired amount of whitespace
@@ -696,17 +921,174 @@ def draw_text_best_parameters(params_order: tuple, bbox_size: tuple, text: Union
         raise ValueError("Horizontal_align must be 'center' or int.")
 
     # draw the image using the final parameters
-    image = Image.new(mode='1', size=bbox_size, color=0)
-    ImageDraw.Draw(image).multiline_text(draw_target, text=wrapped, spacing=final_line_spacing, font=font, fill=1,
-                                         anchor='la', align=text_align)
+    image = draw_multiline_text(size=bbox_size, xy=draw_target, text=wrapped, font=font, spacing=final_line_spacing,
+                                align=text_align)
+
+    layout_stats.record_draw(fitted_index=params_index if fits else None, seconds=time.perf_counter() - start_time)
 
     return image, wrap_parameters, final_line_spacing
 
 
+# define namedtuples for batch text layout - the jobs submitted and the packed 1-bit images returned
+text_layout_job = namedtuple('text_layout_job', ['text', 'params_order', 'bbox_size', 'options'],
+                             defaults=[(168, 21), {}])
+packed_text_layout = namedtuple('packed_text_layout', ['data', 'size', 'params', 'spacing', 'stats'],
+                                defaults=[None])
+
+
+def _draw_text_layout_job(job: text_layout_job):
+    """
+    Worker for draw_text_best_parameters_batch.  Lays out a single job and packs the resulting image.
+
+    :param job: (text_layout_job) the text, parameters, bounding box and draw_text_best_parameters options
+    :return: (packed_text_layout or None) the packed image, parameters used and layout counts, or None on failure
+    """
+    # collect the layout counts so they can be attributed to the message in the parent process
+    with layout_stats.collect() as stats:
+        try:
+            image, params, spacing = draw_text_best_parameters(params_order=job.params_order, bbox_size=job.bbox_size,
+                                                               text=job.text, **job.options)
+        except ValueError as e:
+            helper_logger.warning("Batch text layout failed.  Text: " + str(job.text) + " Error: " + str(e))
+            return None
+
+    return packed_text_layout(data=image.tobytes(), size=image.size, params=params, spacing=spacing, stats=stats)
+
+
+def unpack_text_layout(layout: packed_text_layout):
+    """
+    Restores the image from a packed text layout.
+
+    :param layout: (packed_text_layout) a result from draw_text_best_parameters_batch
+    :return: (PIL.Image) the 1-bit image of the text, with the same pixel values as draw_text_best_parameters
+    """
+    return glyph_atlas.ink_image(Image.frombytes('1', layout.size, layout.data))
+
+
+# the process pool for batch text layout, kept between batches so worker processes (and the glyph atlases they have
+# built) are reused from one cycle to the next
+_layout_executor = None
+_layout_executor_workers = 0
+_layout_executor_lock = threading.Lock()
+
+
+def _layout_pool(processes: int):
+    """
+    Gets the process pool for batch text layout, starting it (or restarting it with a different size) if needed.
+    Must be called with _layout_executor_lock held.
+
+    :param processes: (int) number of worker processes
+    :return: (ProcessPoolExecutor) the pool
+    """
+    global _layout_executor, _layout_executor_workers
+    if _layout_executor is not None and _layout_executor_workers != processes:
+        _layout_executor.shutdown()
+        _layout_executor = None
+    if _layout_executor is None:
+        _layout_executor = ProcessPoolExecutor(max_workers=processes)
+        _layout_executor_workers = processes
+    return _layout_executor
+
+
+def draw_text_best_parameters_batch(jobs: Union[list, tuple], processes: int = None):
+    """
+    Lays out many text jobs with draw_text_best_parameters, spread across a pool of processes.  Images are returned
+    packed (1 bit per pixel) to keep the transfer between processes small.  Jobs which fail to lay out return None
+    so they can be rendered (and their errors handled) individually later.
+
+    :param jobs: (list or tuple) a sequence of text_layout_job namedtuples (or (text, params_order, bbox, options))
+    :param processes: (int, default None) number of worker processes.  None for one per core, 1 to run serially.  the
+                      pool is kept for later batches with the same number of processes
+    :return: (list) a packed_text_layout (or None) for each job, in the order of jobs
+    """
+    global _layout_executor
+    jobs = [text_layout_job(*job) for job in jobs]
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    if processes <= 1 or len(jobs) <= 1:
+        return [_draw_text_layout_job(job) for job in jobs]
+
+    with _layout_executor_lock:
+        executor = _layout_pool(processes)
+        try:
+            return list(executor.map(_draw_text_layout_job, jobs, chunksize=math.ceil(len(jobs) / (processes * 4))))
+        except BrokenProcessPool as e:
+            # a worker died - start a fresh pool next time, and lay out this batch here
+            helper_logger.warning("Text layout process pool failed, laying out serially.  Error: " + str(e))
+            _layout_executor = None
+    return [_draw_text_layout_job(job) for job in jobs]
+
+
+_weather_sprites = {}
+
+
+def weather_sprite(relative_path: str, inverted: bool = False):
+    """
+    Gets a weather dashboard image from the in-memory sprite cache, loading it on first use from the asset bundle (or
+    the loose files in assets/weather_images).  Sprites are stored already converted to 1-bit, exactly as Image.paste
+    would convert them onto a 1-bit image.  The returned image is shared - do not modify it.
+
+    :param relative_path: (str) path of the image within assets/weather_images, e.g. 'numbers/5.png'
+    :param inverted: (bool) whether to return the inverted image (used for below-zero temperatures)
+    :return: (PIL.Image) the 1-bit image
+    """
+
+    try:
+        return _weather_sprites[(relative_path, inverted)]
+    except KeyError:
+        pass
+
+    sprite = asset_bundle.weather_image(relative_path, inverted)
+    _weather_sprites[(relative_path, inverted)] = sprite
+    return sprite
+
+
+def preload_weather_sprites():
+    """
+    Warm-up hook which loads every weather dashboard image into the sprite cache, including the inverted numbers, so
+    that render_day never has to read from disk.
+
+    :return: (int) the number of sprites in the cache
+    """
+
+    for relative_path, inverted in asset_bundle.weather_image_names():
+        weather_sprite(relative_path, inverted=inverted)
+
+    return len(_weather_sprites)
+
+
+def precipitation_bucket(chance_precipitation: float):
+    """
+    Buckets the chance of precipitation into the height of the precipitation bar on the forecast tile.
+
+    :param chance_precipitation: (float): the chance of precipitation, as a probability (0-1)
+    :return: (int) the bar height, range 0-5
+    """
+    return min(math.floor(chance_precipitation * 6), 5)
+
+
+def render_day_cache_key(high: Union[float, int], low: Union[float, int], chance_precipitation: float,
+                         iso_weekday: int, icon_name: str, language: Literal['english', 'portugues'] = "english"):
+    """
+    Normalizes the arguments of render_day to the values the tile actually depends on, so that forecasts which draw
+    the same tile share a cache entry.  Temperatures are kept as sign and rounded magnitude since e.g. -0.3 and 0.3
+    both round to 0 but are drawn differently.
+
+    :return: (tuple) the cache key
+    """
+    return hashkey(high < 0, round(abs(high)), low < 0, round(abs(low)), precipitation_bucket(chance_precipitation),
+                   iso_weekday, icon_name, language)
+
+
+_render_day_cache = LRUCache(maxsize=128)
+@cached(cache=_render_day_cache, key=render_day_cache_key, info=True)
 def render_day(high: Union[float, int], low: Union[float, int], chance_precipitation: float,
                iso_weekday: int, icon_name: str, language: Literal['english', 'portugues'] = "english"):
     """
-    Creates a sub-image with the forecast for a specific day.
+    Creates a sub-image with the forecast for a specific day.  Tiles are memoized on render_day_cache_key in a bounded
+    LRU cache - the returned image is shared, do not modify it.  Hit/miss stats are available from
+    render_day.cache_info().
 
     :param high: (float or int): the daily high, in degrees C
     :param low: (float or int): the daily high, in degrees C
@@ -720,13 +1102,11 @@ def render_day(high: Union[float, int], low: Union[float, int], chance_precipita
     day_rendered = Image.new(mode="1", size=(22, 21), color=0)
 
     # paste day-of-week image
-    weekday_img_path = "/".join([root_dir, "assets/weather_images/days_of_week", language,
-                                "ISOWEEKDAY_" + str(iso_weekday) + ".png"])
-    weekday_img = Image.open(fp=weekday_img_path, mode="r")
+    weekday_img = weather_sprite("days_of_week/" + language + "/ISOWEEKDAY_" + str(iso_weekday) + ".png")
     day_rendered.paste(im=weekday_img, box=(0, 6))
 
     # paste weather icon
-    icon_img = Image.open(fp=root_dir + "/assets/weather_images/conditions_icons/" + icon_name + ".png")
+    icon_img = weather_sprite("conditions_icons/" + icon_name + ".png")
     day_rendered.paste(im=icon_img, box=(6, 6))
 
     # paste the high and the low
@@ -740,9 +1120,7 @@ def render_day(high: Union[float, int], low: Union[float, int], chance_precipita
 
     x_position = 1
     for char in high_rounded:
-        number_image = Image.open(fp=root_dir + "/assets/weather_images/numbers/" + char + ".png")
-        if high_below_zero:
-            number_image = ImageChops.invert(number_image)
+        number_image = weather_sprite("numbers/" + char + ".png", inverted=high_below_zero)
         day_rendered.paste(im=number_image, box=(x_position, 0))
         x_position += 4
 
@@ -751,14 +1129,12 @@ def render_day(high: Union[float, int], low: Union[float, int], chance_precipita
 
     x_position = 13
     for char in low_rounded:
-        number_image = Image.open(fp=root_dir + "/assets/weather_images/numbers/" + char + ".png")
-        if low_below_zero:
-            number_image = ImageChops.invert(number_image)
+        number_image = weather_sprite("numbers/" + char + ".png", inverted=low_below_zero)
         day_rendered.paste(im=number_image, box=(x_position, 0))
         x_position += 4
 
     # paste the chance of precipitation
-    chance_precipitation_rounded = min(math.floor(chance_precipitation * 6), 5)  # range 0-5
+    chance_precipitation_rounded = precipitation_bucket(chance_precipitation)  # range 0-5
     day_rendered.paste(im=1, box=(10, 5-chance_precipitation_rounded, 11, 5))
 
     return day_rendered
@@ -843,7 +1219,8 @@ def download_file_google_drive(file_id: str, out_path: Union[str, pathlib.Path],
                                drive_service: Resource):
     """
     Downloads the file specified by file_id from the provided Google API Resource drive_service and saves it
-    at location out_path.
+    at location out_path.  The file is downloaded to a temporary file alongside out_path and moved into place once
+    complete, so a failed download never replaces an existing file.
 
     :param file_id: (str) the file_id to download
     :param out_path: (str or Path) where to save the file
@@ -853,14 +1230,23 @@ def download_file_google_drive(file_id: str, out_path: Union[str, pathlib.Path],
 
     if isinstance(out_path, pathlib.Path):
         out_path = out_path.as_posix()
+    temp_path = out_path + ".part"
 
     file_request = drive_service.files().get_media(fileId=file_id)
-    file_handler = io.FileIO(out_path, mode='wb')
-    downloader = MediaIoBaseDownload(fd=file_handler, request=file_request)
-    done = False
-    while done is False:
-        status, done = downloader.next_chunk()
-        helper_logger.info("Downloading file " + out_path + "progress: " + str(status.progress()))
+    file_handler = io.FileIO(temp_path, mode='wb')
+    try:
+        downloader = MediaIoBaseDownload(fd=file_handler, request=file_request)
+        done = False
+        while done is False:
+            status, done = downloader.next_chunk()
+            helper_logger.info("Downloading file " + out_path + "progress: " + str(status.progress()))
+    except BaseException:
+        file_handler.close()
+        os.remove(temp_path)
+        raise
+
+    file_handler.close()
+    os.replace(temp_path, out_path)
 
 
 def is_timezone_naive(d: dt.datetime):
@@ -0,0 +1,199 @@
+import gzip
+import http.client
+import io
+import logging
+import ssl
+import threading
+import zlib
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit, urljoin
+
+logger_name = 'flip_sign.http_client'
+http_client_logger = logging.getLogger(logger_name)
+
+# errors which mean a kept-alive connection was closed by the server while idle.  the request is retried once on a
+# new connection when they happen on a reused connection
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine, BrokenPipeError,
+                            ConnectionResetError, ConnectionAbortedError)
+
+# redirects are followed, as urlopen does, up to the same limit
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 10
+
+
+class HTTPClient(object):
+    """
+    A small HTTP client which keeps connections alive between requests, pooled per host, so that repeated API calls
+    skip the TCP/TLS handshake.  Errors are raised as urllib.error.HTTPError / URLError, the same as urlopen, so callers
+    handle them in the same way.
+    """
+    def __init__(self, connect_timeout: float = 5, read_timeout: float = 20, max_idle_per_host: int = 2):
+        """
+        Initializes the client.  No connections are made until the first request.
+
+        :param connect_timeout: (float) seconds to wait to establish a connection
+        :param read_timeout: (float) seconds to wait for data once connected
+        :param max_idle_per_host: (int) the number of idle connections kept open for each host
+        """
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_idle_per_host = max_idle_per_host
+        self.ssl_context = ssl.create_default_context()
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+
+    def _new_connection(self, scheme: str, host: str, port: int):
+        """
+        Opens a new connection, applying the connect timeout while connecting and the read timeout afterwards.
+
+        :param scheme: (str) 'http' or 'https'
+        :param host: (str) the host name
+        :param port: (int or None) the port, or None for the default port
+        :return: (http.client.HTTPConnection) the connected connection
+        """
+        if scheme == 'https':
+            connection = http.client.HTTPSConnection(host, port, timeout=self.connect_timeout,
+                                                     context=self.ssl_context)
+        elif scheme == 'http':
+            connection = http.client.HTTPConnection(host, port, timeout=self.connect_timeout)
+        else:
+            raise URLError("Unsupported URL scheme: " + scheme)
+
+        connection.connect()
+        connection.sock.settimeout(self.read_timeout)
+        with self._lock:
+            self.connections_opened += 1
+        return connection
+
+    def _checkout(self, pool_key: tuple):
+        """
+        Takes an idle connection for the host from the pool, or opens a new one.
+
+        :param pool_key: (tuple) (scheme, host, port)
+        :return: (connection, reused): the connection, and whether it was previously used
+        """
+        with self._lock:
+            idle = self._idle.get(pool_key)
+            if idle:
+                return idle.pop(), True
+        return self._new_connection(*pool_key), False
+
+    def _checkin(self, pool_key: tuple, connection: http.client.HTTPConnection):
+        """
+        Returns a connection to the pool, closing it if the pool for the host is full.
+
+        :param pool_key: (tuple) (scheme, host, port)
+        :param connection: (http.client.HTTPConnection) the idle connection
+        :return: None
+        """
+        with self._lock:
+            idle = self._idle.setdefault(pool_key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def get(self, url: str, headers: dict = None):
+        """
+        Makes a GET request and returns the (decompressed) response body.  Redirects are followed; any other response
+        which is not a success (2xx) is raised as an HTTPError.
+
+        :param url: (str) the URL to request
+        :param headers: (dict, default None) additional request headers
+        :return: (bytes) the response body, with gzip or deflate content encoding removed
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            response, body = self._request(url, headers)
+            location = response.getheader('Location')
+            if response.status in REDIRECT_STATUSES and location:
+                http_client_logger.debug("Following redirect from " + url + " to " + location)
+                url = urljoin(url, location)
+                continue
+            if not 200 <= response.status < 300:
+                raise HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(body))
+            return body
+
+        raise HTTPError(url, response.status, "Too many redirects", response.headers, io.BytesIO(body))
+
+    def _request(self, url: str, headers: dict = None):
+        """
+        Makes a single GET request, on a pooled connection.
+
+        :param url: (str) the URL to request
+        :param headers: (dict, default None) additional request headers
+        :return: (response, body): the http.client.HTTPResponse (already read) and its body, with gzip or deflate
+                 content encoding removed
+        """
+        split_url = urlsplit(url)
+        pool_key = (split_url.scheme, split_url.hostname, split_url.port)
+        path = split_url.path or '/'
+        if split_url.query:
+            path += '?' + split_url.query
+        request_headers = {'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'}
+        if headers is not None:
+            request_headers.update(headers)
+
+        try:
+            while True:
+                connection, reused = self._checkout(pool_key)
+                try:
+                    connection.request('GET', path, headers=request_headers)
+                    response = connection.getresponse()
+                    body = response.read()
+                except _STALE_CONNECTION_ERRORS:
+                    connection.close()
+                    if reused:
+                        http_client_logger.debug("Idle connection closed by server, reconnecting: " + str(pool_key))
+                        continue
+                    raise
+                except BaseException:
+                    connection.close()
+                    raise
+                break
+        except URLError:
+            raise
+        except (OSError, http.client.HTTPException) as e:
+            raise URLError(e)
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._checkin(pool_key, connection)
+
+        encoding = response.getheader('Content-Encoding', '').lower()
+        try:
+            if encoding == 'gzip':
+                body = gzip.decompress(body)
+            elif encoding == 'deflate':
+                body = zlib.decompress(body)
+        except (OSError, EOFError, zlib.error) as e:
+            raise URLError("Unable to decode response body: " + str(e))
+
+        return response, body
+
+    def close(self):
+        """
+        Closes all idle connections.
+
+        :return: None
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+default_client = HTTPClient()
+
+
+def get(url: str, headers: dict = None):
+    """
+    Makes a GET request with the shared client.  See HTTPClient.get.
+
+    :param url: (str) the URL to request
+    :param headers: (dict, default None) additional request headers
+    :return: (bytes) the response body, with gzip or deflate content encoding removed
+    """
+    return default_client.get(url, headers=headers)
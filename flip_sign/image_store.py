@@ -0,0 +1,314 @@
+import json
+import logging
+import mmap
+import os
+import pathlib
+import threading
+from hashlib import sha256
+from PIL import Image, ImageChops, ImageOps, UnidentifiedImageError
+from flip_sign.assets import root_dir
+import flip_sign.config as config
+
+logger_name = 'flip_sign.image_store'
+image_store_logger = logging.getLogger(logger_name)
+
+data_path = root_dir + "/cache/packed_images.bin"
+index_path = root_dir + "/cache/packed_images.json"
+
+SIGN_SIZE = (168, 21)
+# a 1-bit image the size of the sign, as returned by Image.tobytes: 21 bytes per row, 21 rows
+PACKED_LENGTH = SIGN_SIZE[0] // 8 * SIGN_SIZE[1]
+
+# the reason an image could not be packed, recorded so that the file is not opened again until it changes
+OPEN_ERROR = 'open'
+
+DITHER_METHODS = ('floyd-steinberg', 'ordered', 'threshold')
+# 4x4 bayer matrix, scaled to thresholds between 0 and 255
+_BAYER_4 = [0, 8, 2, 10,
+            12, 4, 14, 6,
+            3, 11, 1, 9,
+            15, 7, 13, 5]
+
+
+def _bayer_tile(size: tuple):
+    """
+    Tiles the bayer threshold matrix over an image of the given size.
+
+    :param size: (tuple) (width, height)
+    :return: (PIL.Image) 'L' mode image of thresholds
+    """
+    cell = Image.new('L', (4, 4))
+    cell.putdata([int((value + 0.5) * 256 / 16) for value in _BAYER_4])
+    tile = Image.new('L', size)
+    for x in range(0, size[0], 4):
+        for y in range(0, size[1], 4):
+            tile.paste(cell, (x, y))
+    return tile
+
+
+def to_one_bit(image: Image.Image, method: str = 'floyd-steinberg', threshold: int = 128):
+    """
+    Converts an image to 1-bit.  Each method runs as whole-image operations within Pillow.
+
+    :param image: (PIL.Image) the image
+    :param method: (str) 'floyd-steinberg' (error diffusion, the Pillow default), 'ordered' (4x4 bayer matrix, keeps
+                   flat areas free of noise) or 'threshold' (no dithering, best for line drawings)
+    :param threshold: (int) for 'threshold', the gray level (0-255) at or above which a pixel is set
+    :return: (PIL.Image) the 1-bit image
+    """
+    if image.mode == '1':
+        return image
+    if method == 'floyd-steinberg':
+        return image.convert(mode='1')
+    if image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info):
+        # transparent areas are the unset (background) colour
+        image = image.convert('RGBA')
+        background = Image.new('RGBA', image.size, (0, 0, 0, 255))
+        image = Image.alpha_composite(background, image)
+    gray = image.convert(mode='L')
+    if method == 'ordered':
+        # set wherever the gray level exceeds the matrix threshold at that position
+        gray = ImageChops.subtract(gray, _bayer_tile(gray.size))
+        return gray.point(lambda value: 255 if value > 0 else 0, mode='1')
+    if method == 'threshold':
+        return gray.point(lambda value: 255 if value >= threshold else 0, mode='1')
+    raise ValueError("Unknown dithering method: " + str(method) + ".  Must be one of " + str(DITHER_METHODS))
+
+
+def fit_to_sign(image: Image.Image):
+    """
+    Scales an image to cover the sign and crops the overflow, keeping the centre of the image.
+
+    :param image: (PIL.Image) the image
+    :return: (PIL.Image) the image, SIGN_SIZE
+    """
+    if image.size == SIGN_SIZE:
+        return image
+    if image.mode in ('1', 'P'):
+        # resample in grayscale or colour so that scaling down averages rather than drops pixels
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    return ImageOps.fit(image, SIGN_SIZE, method=Image.Resampling.LANCZOS)
+
+
+def pack_image(image: Image.Image, method: str = 'floyd-steinberg', threshold: int = 128):
+    """
+    Converts an image to the packed form: fitted to the sign, 1-bit, one bit per pixel, rows padded to whole bytes.
+
+    :param image: (PIL.Image) the image
+    :param method: (str) the dithering method, see to_one_bit
+    :param threshold: (int) the threshold for the 'threshold' method
+    :return: (bytes) the packed image, PACKED_LENGTH bytes
+    """
+    return to_one_bit(fit_to_sign(image), method, threshold).tobytes()
+
+
+def unpack_image(packed: bytes):
+    """
+    Decodes a packed image.
+
+    :param packed: (bytes) the packed image
+    :return: (PIL.Image) the 1-bit image
+    """
+    return Image.frombytes('1', SIGN_SIZE, packed)
+
+
+def _source_stamp(path: str):
+    """
+    Identifies the version of a source image by its size and modification time, without reading it.
+
+    :param path: (str) the path of the image
+    :return: (list) [size, mtime_ns]
+    """
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _file_checksum(path: str):
+    """
+    :param path: (str) the path of the file
+    :return: (str) the sha256 hex digest of the file contents
+    """
+    checksum = sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def _conversion():
+    """
+    The configured conversion, which is part of the key of each packed image so that changing it packs images again.
+
+    :return: (tuple) the dithering method, threshold and conversion key
+    """
+    method = config.IMAGE_DITHER
+    threshold = config.IMAGE_THRESHOLD
+    return method, threshold, method + ("/" + str(threshold) if method == 'threshold' else "")
+
+
+def _convert(path: str, method: str, threshold: int):
+    """
+    Opens, validates and packs an image file.
+
+    :param path: (str) the path of the image
+    :param method: (str) the dithering method, see to_one_bit
+    :param threshold: (int) the threshold for the 'threshold' method
+    :return: (tuple) the packed image (bytes) or None, and the error (OPEN_ERROR) or None
+    """
+    try:
+        with Image.open(path) as image:
+            image.verify()
+        with Image.open(path) as image:
+            if image.size != SIGN_SIZE:
+                image_store_logger.info("Fitting image to the sign: " + path + " " + str(image.size))
+            return pack_image(image, method, threshold), None
+    except (UnidentifiedImageError, OSError, SyntaxError) as e:
+        image_store_logger.info("Unable to pack image " + path + " Error: " + str(e))
+        return None, OPEN_ERROR
+
+
+class PackedImageStore(object):
+    """
+    Images converted once into the packed 1-bit form and kept in a single data file of fixed-length slots, which is
+    memory-mapped for reading.  A small JSON index maps the checksum of each source image (and the conversion used) to
+    its slot, and each source path to its checksum along with the size and modification time of the file when it was
+    last checked.  A source which has changed is hashed again, and converted again only if its contents are new.  If
+    the files cannot be read or written the store carries on in memory.
+    """
+    def __init__(self, data_path: str, index_path: str):
+        """
+        Initializes the store.  The files are read on first use.
+
+        :param data_path: (str) the path of the packed image data
+        :param index_path: (str) the path of the index
+        """
+        self.data_path = data_path
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        self._index = None
+        self._map = None
+        self._slots = 0
+        self._memory = {}
+
+    def _load(self):
+        """
+        Reads the index from disk, if it has not already been read.
+
+        :return: (dict) 'packed': checksum/conversion -> {'slot': int or None, 'error': str or None},
+                 'sources': source path -> {'stamp': [size, mtime_ns], 'key': checksum/conversion}
+        """
+        if self._index is None:
+            self._index = {'packed': {}, 'sources': {}}
+            try:
+                with open(self.index_path, 'r') as f:
+                    index = json.load(f)
+                self._slots = os.path.getsize(self.data_path) // PACKED_LENGTH
+                # drop any entries whose slot is beyond the data file, e.g. after a crash while appending
+                packed = {key: entry for key, entry in index['packed'].items()
+                          if entry['slot'] is None or entry['slot'] < self._slots}
+                self._index = {'packed': packed, 'sources': {source: entry for source, entry in index['sources'].items()
+                                                             if entry['key'] in packed}}
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                image_store_logger.warning("Unable to read packed image index, images will be packed again.  Path: " +
+                                           self.index_path + " Error: " + str(e))
+        return self._index
+
+    def _read_slot(self, slot: int):
+        """
+        Reads a packed image from the data file, mapping it again if it has grown since it was mapped.
+
+        :param slot: (int) the slot number
+        :return: (bytes) the packed image
+        """
+        if slot in self._memory:
+            return self._memory[slot]
+        end = (slot + 1) * PACKED_LENGTH
+        if self._map is None or len(self._map) < end:
+            if self._map is not None:
+                self._map.close()
+            with open(self.data_path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[end - PACKED_LENGTH:end]
+
+    def _append(self, packed: bytes):
+        """
+        Appends a packed image to the data file.  Slots are never overwritten, so a mapped slot never changes.
+
+        :param packed: (bytes) the packed image
+        :return: (int) the slot number
+        """
+        slot = self._slots
+        try:
+            with open(self.data_path, 'ab') as f:
+                f.truncate(slot * PACKED_LENGTH)
+                f.write(packed)
+        except OSError as e:
+            image_store_logger.warning("Unable to save packed image.  Path: " + self.data_path + " Error: " + str(e))
+            self._memory[slot] = packed
+        self._slots += 1
+        return slot
+
+    def _save_index(self):
+        """
+        Writes the index to disk, via a temporary file so that a crash never leaves a partially written index.
+
+        :return: None
+        """
+        temp_path = self.index_path + ".tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(self._index, f)
+            os.replace(temp_path, self.index_path)
+        except OSError as e:
+            image_store_logger.warning("Unable to save packed image index.  Path: " + self.index_path + " Error: " +
+                                       str(e))
+
+    def get(self, image_path: pathlib.Path):
+        """
+        Gets the packed form of an image file, packing it first if its contents are new.
+
+        :param image_path: (pathlib.Path) the image file
+        :return: (tuple) the packed image (bytes) or None, and the error (OPEN_ERROR) or None.  Raises
+                 FileNotFoundError if the file does not exist.
+        """
+        source = os.path.abspath(image_path)
+        stamp = _source_stamp(source)
+        method, threshold, conversion = _conversion()
+
+        with self._lock:
+            index = self._load()
+            entry = index['sources'].get(source)
+            if entry is not None and entry['stamp'] == stamp and entry['key'].endswith("/" + conversion):
+                return self._entry_image(index['packed'][entry['key']])
+
+        key = _file_checksum(source) + "/" + conversion
+        with self._lock:
+            index = self._load()
+            if key in index['packed']:
+                index['sources'][source] = {'stamp': stamp, 'key': key}
+                self._save_index()
+                return self._entry_image(index['packed'][key])
+
+        packed, error = _convert(source, method, threshold)
+
+        with self._lock:
+            index = self._load()
+            slot = None if packed is None else self._append(packed)
+            index['packed'][key] = {'slot': slot, 'error': error}
+            index['sources'][source] = {'stamp': stamp, 'key': key}
+            self._save_index()
+        return packed, error
+
+    def _entry_image(self, entry: dict):
+        """
+        :param entry: (dict) the index entry of a packed image
+        :return: (tuple) the packed image (bytes) or None, and the error or None
+        """
+        if entry['slot'] is None:
+            return None, entry['error']
+        return self._read_slot(entry['slot']), None
+
+
+default_store = PackedImageStore(data_path=data_path, index_path=index_path)
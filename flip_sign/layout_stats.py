@@ -0,0 +1,221 @@
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+logger_name = 'flip_sign.layout_stats'
+layout_stats_logger = logging.getLogger(logger_name)
+
+UNATTRIBUTED = '(unattributed)'
+
+
+class LayoutStats(object):
+    """
+    Counts of the work done by the text layout pipeline for one message (or one batch layout job).
+    """
+    def __init__(self):
+        """
+        Initializes all counts to zero.
+        """
+        self.measurements = 0  # calls to text_bbox_size
+        self.canvas_sizes = Counter()  # sizes of the images allocated while measuring and drawing
+        self.wrap_attempts = 0  # calls to the text wrapping functions
+        self.fitted_indexes = []  # params_order index which fitted, per draw_text_best_parameters call (None if none)
+        self.draw_times = []  # wall time in seconds, per draw_text_best_parameters call
+
+    def merge(self, other):
+        """
+        Add the counts from another LayoutStats object to this one.
+
+        :param other: (LayoutStats) the counts to add
+        :return: None
+        """
+        self.measurements += other.measurements
+        self.canvas_sizes.update(other.canvas_sizes)
+        self.wrap_attempts += other.wrap_attempts
+        self.fitted_indexes.extend(other.fitted_indexes)
+        self.draw_times.extend(other.draw_times)
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+_local = threading.local()
+
+
+def _active():
+    """
+    The stack of LayoutStats objects collecting counts on the current thread.
+
+    :return: (list) the collecting LayoutStats objects, innermost last
+    """
+    try:
+        return _local.stack
+    except AttributeError:
+        _local.stack = []
+        return _local.stack
+
+
+def _current():
+    """
+    The LayoutStats object that counts on the current thread should be added to.  Counts made outside of any
+    attribute_to or collect block go to the UNATTRIBUTED entry.
+
+    :return: (LayoutStats) the innermost collecting object
+    """
+    stack = _active()
+    if stack:
+        return stack[-1]
+    return stats_for(UNATTRIBUTED)
+
+
+def stats_for(label: str):
+    """
+    Get (creating if necessary) the LayoutStats for a label.
+
+    :param label: (str) the label the counts are attributed to, usually str(message)
+    :return: (LayoutStats) the counts for the label
+    """
+    with _stats_lock:
+        if label not in _stats:
+            _stats[label] = LayoutStats()
+        return _stats[label]
+
+
+@contextmanager
+def attribute_to(label: str):
+    """
+    Context manager which attributes all layout counts made on this thread within the block to label.
+
+    :param label: (str) the label the counts are attributed to, usually str(message)
+    :return: (LayoutStats) the counts for the label, yielded to the block
+    """
+    stats = stats_for(label)
+    _active().append(stats)
+    try:
+        yield stats
+    finally:
+        _active().pop()
+
+
+@contextmanager
+def collect():
+    """
+    Context manager which collects the layout counts made on this thread within the block in a new LayoutStats object,
+    without attributing them to any label.  Used by batch layout workers so the counts can be sent back with the
+    results and merged into the right message with merge().
+
+    :return: (LayoutStats) the new counts object, yielded to the block
+    """
+    stats = LayoutStats()
+    _active().append(stats)
+    try:
+        yield stats
+    finally:
+        _active().pop()
+
+
+def merge(label: str, stats: LayoutStats):
+    """
+    Attribute counts collected elsewhere (e.g. in a batch layout worker process) to label.
+
+    :param label: (str) the label the counts are attributed to, usually str(message)
+    :param stats: (LayoutStats) the counts to add
+    :return: None
+    """
+    if stats is not None:
+        stats_for(label).merge(stats)
+
+
+def record_measurement():
+    """
+    Count a call to text_bbox_size.
+
+    :return: None
+    """
+    _current().measurements += 1
+
+
+def record_canvas(size: tuple):
+    """
+    Count an image allocated for measuring or drawing text.
+
+    :param size: (tuple) the size of the image
+    :return: None
+    """
+    _current().canvas_sizes[tuple(size)] += 1
+
+
+def record_wrap_attempt():
+    """
+    Count a call to a text wrapping function.
+
+    :return: None
+    """
+    _current().wrap_attempts += 1
+
+
+def record_draw(fitted_index, seconds: float):
+    """
+    Record the outcome of a draw_text_best_parameters call.
+
+    :param fitted_index: (int or None) the index in params_order which fitted, or None if no parameters fitted
+    :param seconds: (float) the wall time of the call
+    :return: None
+    """
+    stats = _current()
+    stats.fitted_indexes.append(fitted_index)
+    stats.draw_times.append(seconds)
+
+
+def summary():
+    """
+    Summarize the layout counts per label, most expensive (by total draw time) first.
+
+    :return: (list) a dict per label with keys label, draws, measurements, canvases, canvas_pixels, wrap_attempts,
+             fitted_indexes, no_fit (number of draws where no parameters fitted), total_time, max_time
+    """
+    with _stats_lock:
+        items = list(_stats.items())
+
+    rows = []
+    for label, stats in items:
+        rows.append({'label': label,
+                     'draws': len(stats.draw_times),
+                     'measurements': stats.measurements,
+                     'canvases': sum(stats.canvas_sizes.values()),
+                     'canvas_pixels': sum(w * h * n for (w, h), n in stats.canvas_sizes.items()),
+                     'wrap_attempts': stats.wrap_attempts,
+                     'fitted_indexes': list(stats.fitted_indexes),
+                     'no_fit': stats.fitted_indexes.count(None),
+                     'total_time': sum(stats.draw_times),
+                     'max_time': max(stats.draw_times, default=0.0)})
+
+    return sorted(rows, key=lambda row: row['total_time'], reverse=True)
+
+
+def log_summary(top: int = 10):
+    """
+    Write the most expensive labels from summary() to the log, and warn about any label where no parameters fitted.
+
+    :param top: (int) the number of labels to write
+    :return: None
+    """
+    rows = summary()
+    for row in rows[:top]:
+        layout_stats_logger.info("Layout: {total_time:.3f}s over {draws} draws (max {max_time:.3f}s), "
+                                 "{measurements} measurements, {canvases} canvases ({canvas_pixels} px), "
+                                 "{wrap_attempts} wrap attempts, fitted {fitted_indexes} - {label}".format(**row))
+    for row in rows:
+        if row['no_fit']:
+            layout_stats_logger.warning("Layout: no parameters fitted in {no_fit} of {draws} draws - {label}"
+                                        .format(**row))
+
+
+def reset():
+    """
+    Clear all layout counts.
+
+    :return: None
+    """
+    with _stats_lock:
+        _stats.clear()
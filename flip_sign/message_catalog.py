@@ -0,0 +1,96 @@
+import datetime
+import logging
+import os
+import pickle
+import threading
+from flip_sign.assets import root_dir
+
+logger_name = 'flip_sign.message_catalog'
+message_catalog_logger = logging.getLogger(logger_name)
+
+catalog_path = root_dir + "/cache/message_catalog.pickle"
+
+# bump when the layout of the catalog changes, so that old catalogs are ignored
+_FORMAT_VERSION = 1
+
+
+class MessageCatalog(object):
+    """
+    The last generated message list, saved to disk as the class and arguments each message was created with, so that
+    the sign can start showing messages at boot without waiting for the network.  Messages are created again from
+    their arguments when the catalog is loaded, so date countdowns and display chances are worked out afresh however
+    old the catalog is.
+    """
+    def __init__(self, path: str):
+        """
+        Initializes the catalog.
+
+        :param path: (str) the path of the catalog file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+    def save(self, messages: list):
+        """
+        Saves a message list.  Messages whose arguments cannot be saved are left out.  The file is written to a
+        temporary name and moved into place, so a crash never leaves a partially written catalog.
+
+        :param messages: (list) the Message objects
+        :return: (int) the number of messages saved
+        """
+        specs = []
+        for message in messages:
+            try:
+                specs.append(pickle.dumps((type(message), *message.init_args)))
+            except (pickle.PicklingError, AttributeError, TypeError) as e:
+                message_catalog_logger.debug("Message left out of catalog: " + str(message) + " Error: " + str(e))
+
+        with self._lock:
+            temp_path = self.path + ".tmp"
+            try:
+                with open(temp_path, 'wb') as f:
+                    pickle.dump({'format': _FORMAT_VERSION, 'saved_at': datetime.datetime.now(), 'messages': specs}, f)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                message_catalog_logger.warning("Unable to save message catalog.  Path: " + self.path + " Error: " +
+                                               str(e))
+                return 0
+
+        message_catalog_logger.info("Saved {} of {} messages to the catalog.".format(len(specs), len(messages)))
+        return len(specs)
+
+    def load(self):
+        """
+        Creates the messages in the catalog again.  Messages which cannot be created are left out.
+
+        :return: (list or None) the messages, or None if there is no usable catalog
+        """
+        with self._lock:
+            try:
+                with open(self.path, 'rb') as f:
+                    stored = pickle.load(f)
+                if stored['format'] != _FORMAT_VERSION:
+                    return None
+            except FileNotFoundError:
+                return None
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, KeyError, TypeError) as e:
+                message_catalog_logger.warning("Unable to read message catalog.  Path: " + self.path + " Error: " +
+                                               str(e))
+                return None
+
+        messages = []
+        for spec in stored['messages']:
+            try:
+                message_type, args, kwargs = pickle.loads(spec)
+                messages.append(message_type(*args, **kwargs))
+            except Exception as e:
+                message_catalog_logger.warning("Unable to create message from catalog.  Error: " + str(e))
+
+        message_catalog_logger.info("Loaded {} messages from the catalog saved at {}."
+                                    .format(len(messages), stored['saved_at'].isoformat()))
+        return messages
+
+
+default_catalog = MessageCatalog(path=catalog_path)
@@ -1,19 +1,28 @@
-from PIL import Image, UnidentifiedImageError
+from PIL import Image
 from pathlib import Path
 from typing import Union, Literal, Optional
 from itertools import zip_longest
 from flip_sign.assets import keys, fonts, root_dir
 from tzlocal import get_localzone_name
 from pytz import timezone
-from googleapiclient.discovery import build
 from operator import itemgetter
 from urllib.parse import quote
 from googleapiclient.errors import HttpError
 import ast
+import copy
+import heapq
+import queue
 import textwrap
+import threading
+import time
 import flip_sign.helpers as hlp
+import flip_sign.google_services as google_services
+import flip_sign.calendar_sync as calendar_sync
+import flip_sign.sheet_specs as sheet_specs
+import flip_sign.drive_sync as drive_sync
+import flip_sign.image_store as image_store
+import flip_sign.layout_stats as layout_stats
 import flip_sign.variable_date_functions as vdf
-import random
 import datetime
 import logging
 import flip_sign.config as config
@@ -29,16 +38,31 @@ LOCAL_TIMEZONE = timezone(get_localzone_name())
 
 class Message(object):
     """
-    A base message class for branching into subclasses.  Only the display randomization elements and get_image method
+    A base message class for branching into subclasses.  Only the display weighting elements and get_image method
     will live at this level.
     """
+    # how often the message is shown relative to others (see message_scheduler).  0 until set by __init__
+    weight = 0.0
+
+    def __new__(cls, *args, **kwargs):
+        """
+        Records the arguments each message is created with, so that it can be saved in the message catalog and created
+        again later (see message_catalog).
+
+        :return: (Message) the new, uninitialized message
+        """
+        message = super().__new__(cls)
+        message.init_args = (args, kwargs)
+        return message
+
     def __init__(self, frequency: float):
         """
-        Selects whether to display the image or not, based on provided frequency.
+        Sets the display weight of the message from the provided frequency.
 
-        :param frequency: (float) a float between 0 and 1 indicating the probability this message will display
+        :param frequency: (float) a float between 0 and 1, the share of cycles in which this message is shown
         """
-        self.display = random.random() < frequency
+        self.display = True
+        self.weight = frequency
         self.image = None
         self.init_failure = False
 
@@ -46,9 +70,18 @@ class Message(object):
         """
         Message display will be tested using this built-in method.  "if Message:"
 
-        :return: (boolean) whether the message displays.
+        :return: (boolean) whether the message displays: it initialized successfully and has a weight above 0
+        """
+        return self.display and self.weight > 0
+
+    def reweight(self):
+        """
+        Recalculates the display weight, for messages whose frequency changes over time (e.g. as an event approaches).
+        The weight of the base message is fixed.
+
+        :return: (float) the weight
         """
-        return self.display
+        return self.weight
 
     def __str__(self):
         """
@@ -103,19 +136,25 @@ def linear_decline_frequency_image_message(image_argument: Union[Path, Image.Ima
 
 class ImageMessage(Message):
     """
-    A message composed of a single static image, the same size as the sign (168 x 21).
+    A message composed of a single static image, the same size as the sign (168 x 21).  Image files are validated,
+    fitted to the sign and converted to 1-bit once per version of the file, and kept packed in the image store until
+    displayed.  Images passed directly must already be the size of the sign.
     """
     def __init__(self, image: Union[Path, Image.Image],
                  frequency: Union[float, callable] = linear_decline_frequency_image_message):
         """
         Initializes the message.
 
-        :param image: (pathlib.Path or PIL.Image) the image to display
+        :param image: (pathlib.Path or PIL.Image) the image to display.  Image files of any size are scaled and cropped
+                      to fit the sign
         :param frequency: (callable or float)  a float probability to display or callable to generate said probability
                            if callable, must accept the companion image parameter as a single argument
         """
 
         self.string_rep = "ImageMessage: image=" + str(image)
+        self._packed = None
+        self.frequency = frequency
+        self.image_argument = image
 
         if callable(frequency):
             try:
@@ -133,13 +172,15 @@ class ImageMessage(Message):
             return
 
         if isinstance(image, Path):
+            # packed once per version of the file (see image_store), decoded when first needed
             try:
-                Image.open(image).verify()
-                self.image = Image.open(image)
-            except (FileNotFoundError, UnidentifiedImageError) as e:
+                self._packed, error = image_store.default_store.get(image)
+            except FileNotFoundError as e:
+                error = image_store.OPEN_ERROR
+                message_gen_logger.info("Error Details:" + str(e))
+            if error == image_store.OPEN_ERROR:
                 self.display = False
                 message_gen_logger.warning("Error opening image. Image:" + str(image))
-                message_gen_logger.info("Error Details:" + str(e))
                 return
         elif isinstance(image, Image.Image):
             self.image = image
@@ -149,23 +190,48 @@ class ImageMessage(Message):
             message_gen_logger.warning("Invalid image passed, must be Image or Path. Passed:" + str(image))
             return
 
-        # if image is the wrong size
-        if self.image.width != 168 or self.image.height != 21:
-            self.display = False  # do not display this image
-            message_gen_logger.warning("Image is the wrong size.  Image:" + str(image))  # log it
-            return
+        if self.image is not None:
+            # if image is the wrong size
+            if self.image.width != 168 or self.image.height != 21:
+                self.display = False  # do not display this image
+                message_gen_logger.warning("Image is the wrong size.  Image:" + str(image))  # log it
+                return
 
-        # convert image to black-and-white
-        if self.image.mode != '1':
-            self.image = self.image.convert(mode='1')
+            # convert image to black-and-white
+            if self.image.mode != '1':
+                self.image = self.image.convert(mode='1')
 
     def render(self):
         """
-        Nothing needed here, since the image is already saved.  Does nothing, returns None.
+        Decodes the image, if it was loaded from the image store.
 
         :return: None
         """
-        pass
+        self.get_image()
+
+    def reweight(self):
+        """
+        Recalculates the display weight from the frequency function, as the image file ages.
+
+        :return: (float) the weight
+        """
+        if callable(self.frequency):
+            try:
+                self.weight = self.frequency(self.image_argument)
+            except FileNotFoundError as e:
+                message_gen_logger.warning("Error calculating frequency. Image:" + str(self.image_argument))
+                message_gen_logger.info("Error Details:" + str(e))
+        return self.weight
+
+    def get_image(self):
+        """
+        Gets the image, decoding it from its packed form on first use.
+
+        :return: (PIL.Image) the image
+        """
+        if self.image is None and self._packed is not None:
+            self.image = image_store.unpack_image(self._packed)
+        return self.image
 
 
 def linear_decline_frequency_date_message(days: float):
@@ -201,18 +267,18 @@ class DateMessage(Message):
         """
 
         self.final_message_wrapped = None
+        self.frequency = frequency
 
         if isinstance(frequency, float):
             super().__init__(frequency)
         elif callable(frequency):
             try:
-                next_start, _, _ = self.next_occurrence()
+                days = self.days_to_next_start()
             except TypeError as e:
                 self.display = False
                 message_gen_logger.warning("Error generating next occurrence.  Description:" + self.description)
                 message_gen_logger.warning("Full error description:" + str(e))
                 return
-            days = (next_start - datetime.datetime.now().replace(tzinfo=LOCAL_TIMEZONE)).days
             super().__init__(frequency(days))
         else:
             self.display = False
@@ -228,6 +294,31 @@ class DateMessage(Message):
 
         raise NotImplementedError
 
+    def days_to_next_start(self):
+        """
+        :return: (int) the number of whole days until the next occurrence starts
+        """
+        next_start, _, _ = self.next_occurrence()
+        return (next_start - datetime.datetime.now().replace(tzinfo=LOCAL_TIMEZONE)).days
+
+    def reweight(self):
+        """
+        Recalculates the display weight from the frequency function, as the next occurrence approaches.  Once the
+        event has ended (e.g. a calendar event from a message list still in use), the weight is 0.
+
+        :return: (float) the weight
+        """
+        try:
+            _, next_end, _ = self.next_occurrence()
+            if next_end < datetime.datetime.now().replace(tzinfo=LOCAL_TIMEZONE):
+                self.weight = 0.0
+            elif callable(self.frequency):
+                self.weight = self.frequency(self.days_to_next_start())
+        except TypeError as e:
+            message_gen_logger.warning("Error generating next occurrence.  Description:" + self.description)
+            message_gen_logger.warning("Full error description:" + str(e))
+        return self.weight
+
     def render(self):
         """
         Prepare the message for display.  Calculate actual time to event start, format and prepare the image.
@@ -460,6 +551,7 @@ class BasicTextMessage(Message):
         self.draw_text_kwargs = kwargs
         self.applied_spacing = None
         self.applied_params = None
+        self.layout = None
         self.string_rep = "BasicTextMessage: text=" + str(self.text)
 
         try:
@@ -487,13 +579,39 @@ class BasicTextMessage(Message):
             self.log_render()
         else:
             pass
-        image, params, spacing = hlp.draw_text_best_parameters(params_order=self.font_parameters,
-                                                               bbox_size=(168, 21), text=self.text,
-                                                               **self.draw_text_kwargs)
+
+        # use the layout from a batch if one was applied, otherwise lay out the text now
+        if self.layout is not None:
+            image, params, spacing = hlp.unpack_text_layout(self.layout), self.layout.params, self.layout.spacing
+        else:
+            image, params, spacing = hlp.draw_text_best_parameters(params_order=self.font_parameters,
+                                                                   bbox_size=(168, 21), text=self.text,
+                                                                   **self.draw_text_kwargs)
         self.image = image
         self.applied_params = params
         self.applied_spacing = spacing
 
+    def layout_job(self):
+        """
+        The text layout job for this message, so many messages can be laid out at once with
+        hlp.draw_text_best_parameters_batch.
+
+        :return: (hlp.text_layout_job or None): the layout job, or None if the text is not known before render
+        """
+        return hlp.text_layout_job(text=self.text, params_order=self.font_parameters, bbox_size=(168, 21),
+                                   options=self.draw_text_kwargs)
+
+    def apply_layout(self, layout: hlp.packed_text_layout):
+        """
+        Store a layout produced by hlp.draw_text_best_parameters_batch and attribute its layout counts to this message.
+        The layout is unpacked when the message is rendered.
+
+        :param layout: (hlp.packed_text_layout): the packed image, parameters and spacing for this message's text
+        :return: None
+        """
+        self.layout = layout
+        layout_stats.merge(str(self), layout.stats)
+
 
 date_match_wrap_params = hlp.wrap_parameter_set(font_path=press_start_path, font_size=9, min_spacing=1,
                                                 split_words=False, truncate=True, wrap_kwargs={'placeholder': '{}'})
@@ -516,6 +634,21 @@ class DateMatchTextMessage(BasicTextMessage):
         self.string_rep = "DateMatchTextMessage: text=" + str(text)
 
 
+def accuweather_forecast_request(location: dict):
+    """
+    The 5-day forecast request for a location, as made when weather messages are rendered.
+
+    :param location: (dict) a location response from the accuweather API
+    :return: (tuple) ordered pieces of the url to request, see hlp.accuweather_api_request
+    """
+    return ('http://dataservice.accuweather.com/forecasts/v1/daily/5day/',
+            location['Key'],
+            '?apikey=',
+            keys['AccuweatherAPI'],
+            '&details=true',
+            '&metric=true')
+
+
 class AccuweatherDescription(BasicTextMessage):
     """
     A class to display the text description of the weather from the AccuWeather API
@@ -523,7 +656,7 @@ class AccuweatherDescription(BasicTextMessage):
     def __init__(self, location: dict, description: Optional[str] = None, headline: bool = True,
                  date: Union[datetime.datetime, datetime.date] = None, day_or_night: Literal['day', 'night'] = 'day',
                  font_parameters: Union[tuple, list] = basic_text_default_wrap_params,
-                 frequency: float = 1.0, **kwargs):
+                 frequency: float = 1.0, priority: Literal['high', 'normal', 'low'] = 'normal', **kwargs):
         """
         Initializes the message.
 
@@ -534,12 +667,14 @@ class AccuweatherDescription(BasicTextMessage):
         :param day_or_night: ('day' or 'night'): whether the description should be for day or night weather
         :param font_parameters: (tuple or list): a list or tuple of hlp.wrap_parameter_set objects, in preference order
         :param frequency: (float): the probability that the message will display
+        :param priority: ('high', 'normal' or 'low'): the priority of the forecast request against the API budget
         :param kwargs: kwargs: (captured as dict): passed to draw_text_best_parameters
         """
 
         self.init_failure = True
         self.location = location.copy()
         self.headline = headline
+        self.priority = priority
         # standardize type to datetime.date
         # use attribute of hour to determine if date was passed as datetime
         if hasattr(date, 'hour'):
@@ -573,13 +708,10 @@ class AccuweatherDescription(BasicTextMessage):
         :return: None
         """
         self.log_render()
-        api_request = ('http://dataservice.accuweather.com/forecasts/v1/daily/5day/',
-                       self.location['Key'],
-                       '?apikey=',
-                       keys['AccuweatherAPI'],
-                       '&details=true',
-                       '&metric=true')
-        response = hlp.accuweather_api_request(api_request)  # no try/except here since errors should be handled above
+        # the message may be rendered again in a later cycle - start from blank text so a missing date is detected
+        self.text = ''
+        # no try/except here since errors should be handled above
+        response = hlp.accuweather_api_request(accuweather_forecast_request(self.location), priority=self.priority)
 
         if self.headline:
             self.text = self.description + ":" + response['Headline']['Text']
@@ -608,6 +740,14 @@ class AccuweatherDescription(BasicTextMessage):
 
         super().render(log_render=False)
 
+    def layout_job(self):
+        """
+        The weather text is only known after the API request in render, so it cannot be laid out ahead of time.
+
+        :return: None
+        """
+        return None
+
 
 weather_stub_default_wrap_params = (
     hlp.wrap_parameter_set(font_path=press_start_path, font_size=16, min_spacing=1, split_words=False, truncate=False,
@@ -637,7 +777,8 @@ class AccuweatherDashboard(Message):
     """
     def __init__(self, location: dict, description: Optional[str] = None,
                  start_date: Union[datetime.datetime, datetime.date] = None,
-                 language: Literal["english", "portugues"] = "english", frequency: float = 1.0):
+                 language: Literal["english", "portugues"] = "english", frequency: float = 1.0,
+                 priority: Literal['high', 'normal', 'low'] = 'normal'):
         """
         Initializes the message.
 
@@ -646,11 +787,13 @@ class AccuweatherDashboard(Message):
         :param start_date: (datetime.datetime or datetime.date) the first day to display forecast.  default today
         :param language: (str) the language for weekday display, currently only "english" and "portugues"
         :param frequency: (float): the probability that the message will display
+        :param priority: ('high', 'normal' or 'low'): the priority of the forecast request against the API budget
         """
 
         self.init_failure = True
         self.location = location.copy()
         self.language = language
+        self.priority = priority
         # standardize type to datetime.date
         if hasattr(start_date, 'hour'):  # use attribute of hour to determine if date was passed as datetime
             start_date = start_date.date()
@@ -695,14 +838,8 @@ class AccuweatherDashboard(Message):
         dashboard_rendered = Image.new(mode="1", size=(168, 21), color=0)
 
         # make API call
-        api_request = ('http://dataservice.accuweather.com/forecasts/v1/daily/5day/',
-                       self.location['Key'],
-                       '?apikey=',
-                       keys['AccuweatherAPI'],
-                       '&details=true',
-                       '&metric=true')
-
-        response = hlp.accuweather_api_request(api_request)  # no try/except here since errors should be handled above
+        # no try/except here since errors should be handled above
+        response = hlp.accuweather_api_request(accuweather_forecast_request(self.location), priority=self.priority)
 
         # wrap description text and add to output
         weather_stub_size = (58, 21)
@@ -765,6 +902,9 @@ class GoogleCalendarMessageFactory(MessageFactory):
     Events are only turned into EphemeralDateMessages if they are colored red ("tomato") in the Google Calendar UI.
     Weather messages are generated if the event is within the 5-day forecast window and is outside of 100 miles
     from the home location.
+
+    Events are kept in a local store which is brought up to date with only the changes since the last sync (see
+    calendar_sync).
     """
     def __init__(self, calendar_id: str):
         """
@@ -785,63 +925,52 @@ class GoogleCalendarMessageFactory(MessageFactory):
 
         self.log_message_gen()
 
-        google_calendar_service = build('calendar', 'v3', credentials=hlp.get_credentials())
-        now = datetime.datetime.utcnow().isoformat() + 'Z'  # 'Z' indicates UTC time
-        end_time = (datetime.datetime.utcnow() + datetime.timedelta(days=max_days_in_future)).isoformat() + "Z"
+        # bring the local copy of the calendar up to date, then read the events from now until max_days_in_future
+        calendar_sync.sync(google_services.service('calendar', 'v3'), self.calendar_id)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        events = calendar_sync.default_store.events(self.calendar_id, end_after=now,
+                                                    start_before=now + datetime.timedelta(days=max_days_in_future))
 
-        calendar_responses = []
+        # keep only events color-tagged red (colorId 11)
+        red_events = [event for event in events if ('colorId', '11') in event.items()]
 
-        events_request = google_calendar_service.events().list(calendarId=self.calendar_id, timeMin=now,
-                                                               timeMax=end_time, singleEvents=True,
-                                                               orderBy='startTime')
-        # make requests to google calendar
-        while events_request is not None:
-            events_result = events_request.execute()
-            events = events_result.get('items', [])
-            calendar_responses.append(events)
-            events_request = google_calendar_service.events().list_next(events_request, events_result)
+        # geocode every event location (and the home location, once) in one batch.  the home location is looked up
+        # here rather than at import so that it is not resolved before the user has input it
+        event_locations = [event['location'] for event in red_events if 'location' in event.keys()]
+        if event_locations:
+            lat_longs = hlp.geocode_many(event_locations + [config.HOME_LOCATION])
+            home_location = lat_longs[config.HOME_LOCATION]
+            if home_location is None:
+                message_gen_logger.warning("Unable to get lat/lng for home: " + config.HOME_LOCATION)
 
         # process responses
         messages_result = []
-        for page in calendar_responses:
-            for event in page:
-                if ('colorId', '11') in event.items():  # if the event is color-tagged red (colorId 11)
-                    # first add the EphemeralDateMessage
-                    all_day = 'date' in event['start'].keys() and 'date' in event['end'].keys()
-                    if all_day:
-                        start = datetime.datetime.fromisoformat(event['start']['date']).replace(tzinfo=LOCAL_TIMEZONE)
-                        end = datetime.datetime.fromisoformat(event['end']['date']).replace(tzinfo=LOCAL_TIMEZONE)
-                        end -= datetime.timedelta(days=1)  # remove 1 day from all-day events (handling convention)
-                    else:  # if not all-day event
-                        start = datetime.datetime.fromisoformat(event['start']['dateTime'])  # expect time-zone-aware
-                        end = datetime.datetime.fromisoformat(event['end']['dateTime'])  # expect time-zone aware
-
-                    messages_result.append(EphemeralDateMessage(description=event['summary'], start=start, end=end,
-                                                                all_day=all_day))
-
-                    # next add the accuweather message factory, if necessary
-                    if 'location' in event.keys():  # if the event has a location
-                        # get event location lat-long
-                        try:
-                            lat, lng = itemgetter('lat', 'lng')(hlp.geocode_to_lat_long(event['location']))
-                        except ValueError:  # google api was unable to find a location
-                            message_gen_logger.warning("Unable to get lat/lng for event location: " + event['location'])
-                            continue  # do not add a location
-
-                        # get the home location lat-long (inefficient in general, but its cached)
-                        # if getting at the top there is the potential to set a lat-long before the user has input
-                        try:
-                            home_lat, home_lng = itemgetter('lat', 'lng')(hlp.geocode_to_lat_long(config.HOME_LOCATION))
-                        except ValueError:
-                            message_gen_logger.warning("Unable to get lat/lng for home: " + config.HOME_LOCATION)
-                            continue
-
-                        # only add weather if location is more than 160 km away
-                        if hlp.great_circle_distance(lat, lng, home_lat, home_lng) > 160:
-                            # get start date as a datetime object
-                            start_date = start.date()
-                            messages_result.append(AccuweatherAPIMessageFactory(location_description=event['location'],
-                                                                                start_date=start_date))
+        for event in red_events:
+            # first add the EphemeralDateMessage
+            start, end, all_day = calendar_sync.event_times(event)
+            messages_result.append(EphemeralDateMessage(description=event['summary'], start=start, end=end,
+                                                        all_day=all_day))
+
+            # next add the accuweather message factory, if necessary
+            if 'location' in event.keys():  # if the event has a location
+                event_location = lat_longs[event['location']]
+                if event_location is None:  # google api was unable to find a location
+                    message_gen_logger.warning("Unable to get lat/lng for event location: " + event['location'])
+                    continue  # do not add a location
+
+                if home_location is None:
+                    continue
+
+                lat, lng = itemgetter('lat', 'lng')(event_location)
+                home_lat, home_lng = itemgetter('lat', 'lng')(home_location)
+
+                # only add weather if location is more than 160 km away
+                if hlp.great_circle_distance(lat, lng, home_lat, home_lng) > 160:
+                    # get start date as a datetime object
+                    start_date = start.date()
+                    # distant events are least important against the weather API budget
+                    messages_result.append(AccuweatherAPIMessageFactory(location_description=event['location'],
+                                                                        start_date=start_date, priority='low'))
 
         return messages_result
 
@@ -852,7 +981,8 @@ class AccuweatherAPIMessageFactory(MessageFactory):
     """
     def __init__(self, location_description: str, headline: bool = False, description: Optional[str] = None,
                  weather_descriptions: bool = False, weather_dashboard: bool = True,
-                 start_date: Optional[datetime.date] = None, frequency: float = 1.0):
+                 start_date: Optional[datetime.date] = None, frequency: float = 1.0,
+                 priority: Optional[Literal['high', 'normal', 'low']] = None):
         """
         Initializes the factory - saves variables to be ready for the generate_messages call.
 
@@ -863,6 +993,8 @@ class AccuweatherAPIMessageFactory(MessageFactory):
         :param weather_dashboard: (bool) whether to create the dashboard message
         :param start_date: (datetime.date) the first date of interest for the forecasts
         :param frequency: (float): the probability that the message will display
+        :param priority: ('high', 'normal' or 'low') the priority of the weather requests against the API budget.
+                         default 'high' for the home location, otherwise 'normal'
         """
 
         self.location_description = location_description
@@ -875,6 +1007,7 @@ class AccuweatherAPIMessageFactory(MessageFactory):
         else:
             self.start_date = start_date
         self.frequency = frequency
+        self.priority = priority
 
         self.logging_str = "AccuweatherMessageFactory: " + location_description
 
@@ -886,6 +1019,13 @@ class AccuweatherAPIMessageFactory(MessageFactory):
         """
         self.log_message_gen()
 
+        # the home location is resolved here rather than at construction, since it is input after startup
+        priority = self.priority
+        if priority is None:
+            is_home = hlp.normalize_location(self.location_description).lower() == \
+                hlp.normalize_location(config.HOME_LOCATION).lower()
+            priority = 'high' if is_home else 'normal'
+
         try:
             lat, lng = itemgetter('lat', 'lng')(hlp.geocode_to_lat_long(self.location_description))
         except ValueError:
@@ -895,28 +1035,31 @@ class AccuweatherAPIMessageFactory(MessageFactory):
                "apikey=", keys['AccuweatherAPI'],
                "&q=", quote(str(lat) + "," + str(lng)))
 
-        location_response = hlp.accuweather_api_request(url)
+        location_response = hlp.accuweather_api_request(url, priority=priority)
 
         # create objects as requested (dashboard, headline, description)
         messages_out = []
         if self.weather_dashboard:
             messages_out.append(AccuweatherDashboard(location=location_response, description=self.description,
                                                      start_date=self.start_date, language=config.WEATHER_LANGUAGE,
-                                                     frequency=self.frequency))
+                                                     frequency=self.frequency, priority=priority))
         if self.weather_descriptions:
             messages_out.append(AccuweatherDescription(location=location_response, description=self.description,
                                                        date=self.start_date, day_or_night='day',
-                                                       frequency=self.frequency, headline=False))
+                                                       frequency=self.frequency, headline=False,
+                                                       priority=priority))
             messages_out.append(AccuweatherDescription(location=location_response, description=self.description,
                                                        date=self.start_date, day_or_night='night',
-                                                       frequency=self.frequency, headline=False))
+                                                       frequency=self.frequency, headline=False,
+                                                       priority=priority))
             messages_out.append(AccuweatherDescription(location=location_response, description=self.description,
                                                        date=self.start_date + datetime.timedelta(days=1),
-                                                       day_or_night='day', frequency=self.frequency, headline=False))
+                                                       day_or_night='day', frequency=self.frequency, headline=False,
+                                                       priority=priority))
 
         if self.headline:
             messages_out.append(AccuweatherDescription(location=location_response, description=self.description,
-                                                       headline=True, frequency=self.frequency))
+                                                       headline=True, frequency=self.frequency, priority=priority))
 
         return messages_out
 
@@ -933,35 +1076,24 @@ class GoogleDriveImageMessageFactory(MessageFactory):
     def generate_messages(self):
         """
         Checks the drive folder contents against local cache, downloads any new or updated images, and
-        generates the ImageMessage objects for the images on the drive (ignoring any extra locally).
+        generates the ImageMessage objects for the images on the drive (ignoring any extra locally).  The folder
+        listing is kept up to date from the drive changes feed, and local images unchanged since they were last
+        checked are known from the manifest without reading them (see drive_sync).
 
         :return: (list): a list of ImageMessage objects from the images in the folder
         """
 
         self.log_message_gen()
 
-        # get list of files in google drive
-        drive_service = build('drive', 'v3', credentials=hlp.get_credentials())
+        # get list of files in google drive - after the first cycle, only the changes since the last
+        files = drive_sync.list_folder(google_services.service('drive', 'v3'), self.drive_folder)
+        file_paths = [Path(drive_sync.images_dir + "/" + file['name']) for file in files]
 
-        files_request = drive_service.files().list(q=self.drive_folder,
-                                                   fields="nextPageToken, files(id, name, sha256Checksum, trashed)")
+        # download new and changed images (all at once) before the messages open them
+        drive_sync.download_files([(file, file_path) for file, file_path in zip(files, file_paths)
+                                   if not drive_sync.is_current(file, file_path)])
 
-        pages = []
-        while files_request is not None:
-            files_result = files_request.execute()
-            pages.append(files_result.get('files', []))
-            files_request = drive_service.files().list_next(files_request, files_result)
-
-        messages_out = []
-        for page in pages:
-            for file in page:
-                if not file['trashed']:
-                    file_path = Path(root_dir + "/cache/google_drive_images/" + file['name'])
-                    if not hlp.sha256_with_default(file_path) == file['sha256Checksum']:
-                        hlp.download_file_google_drive(file_id=file['id'], out_path=file_path,
-                                                       drive_service=drive_service)
-                    messages_out.append(ImageMessage(file_path))
-        return messages_out
+        return [ImageMessage(file_path) for file_path in file_paths]
 
 
 message_objects_ref = {
@@ -985,6 +1117,9 @@ message_objects_ref = {
 class GoogleSheetMessageFactory(MessageFactory):
     """
     A message factory for generating messages in a formatted google sheet.
+
+    The parsed rows are kept (see sheet_specs) along with the sheet's version, so an unchanged sheet costs one
+    metadata request and no parsing.
     """
     def __init__(self, sheet_id: str):
         """
@@ -996,70 +1131,296 @@ class GoogleSheetMessageFactory(MessageFactory):
 
         self.logging_str = "Google SheetMessageFactory: " + self.sheet_id
 
-    def generate_messages(self):
+    def sheet_version(self):
         """
-        Accesses the API, processes the result, and returns a list of messages and message factories.
+        Requests the version of the sheet from the google drive API.  The version increases whenever the sheet changes.
 
-        :return: (list): the messages and message factories as defined in the google sheet
+        :return: (str or None) the version, or None if it could not be read
         """
-
-        self.log_message_gen()
-
-        sheets_service = build('sheets', 'v4', credentials=hlp.get_credentials())
+        drive_service = google_services.service('drive', 'v3')
         try:
-            sheets_request = sheets_service.spreadsheets().values().get(spreadsheetId=self.sheet_id, range="Messages!A:C")
-            rows = sheets_request.execute()['values']
-        except HttpError as e:
-            message_gen_logger.warning("Error generating messages from google sheet.  Sheet id: " + self.sheet_id)
-            message_gen_logger.warning("Full error: " + str(e))
-            return [BasicTextMessage("Error generating messages from google sheet.  Sheet id: " + self.sheet_id)]
+            return drive_service.files().get(fileId=self.sheet_id, fields='version').execute()['version']
+        except (HttpError, KeyError) as e:
+            message_gen_logger.info("Unable to read google sheet version, checking the values instead.  Sheet id: " +
+                                    self.sheet_id + " Error: " + str(e))
+            return None
 
-        messages_out = []
+    @staticmethod
+    def compile_rows(rows: list):
+        """
+        Parses the rows of the messages sheet into specs for the messages and message factories they describe.
+
+        :param rows: (list) the rows of values from the sheet, including the header row
+        :return: (list) sheet_specs.sheet_row_spec namedtuples
+        """
+        specs = []
         for row in rows[1:]:  # skip first row, which is headers
-            if row[0] in message_objects_ref.keys():
-                message_obj = message_objects_ref[row[0]]
-            else:
-                message_gen_logger.warning("Message/factory type not found for row: " + str(row))
-                messages_out.append(BasicTextMessage("Message/Factory type not found.  Type:" + str(row[0])))
-                continue
             kwargs_out = {}  # initialize kwargs_out as an empty dict, then fill if necessary
+            references = []
             if len(row) == 3:  # if row contains the 3rd **kwargs object
                 for key, item in ast.literal_eval(row[2]).items():  # 3rd object must be a dictionary
-                    # replace reference with object if exists in reference dictionary
-                    if item in message_objects_ref.keys():
-                        kwargs_out[key] = message_objects_ref[item]
-                    else:
-                        kwargs_out[key] = item
+                    kwargs_out[key] = item
+                    # note references to objects in the reference dictionary, replaced when the message is created
+                    if isinstance(item, str) and item in message_objects_ref.keys():
+                        references.append(key)
 
             args_out = []
             if not row[1] == '':
                 args_out.append(row[1])
 
-            messages_out.append(message_obj(*args_out, **kwargs_out))  # no try/except as __init__ must not throw error
+            specs.append(sheet_specs.sheet_row_spec(type_name=row[0], args=tuple(args_out), kwargs=kwargs_out,
+                                                    references=tuple(references)))
 
-        return messages_out
+        return specs
+
+    @staticmethod
+    def create(spec: sheet_specs.sheet_row_spec):
+        """
+        Creates the message or message factory described by a spec.
 
+        :param spec: (sheet_specs.sheet_row_spec) the parsed row
+        :return: (Message or MessageFactory) the new object
+        """
+        if spec.type_name not in message_objects_ref.keys():
+            message_gen_logger.warning("Message/factory type not found for row: " + str(spec))
+            return BasicTextMessage("Message/Factory type not found.  Type:" + str(spec.type_name))
+
+        kwargs_out = {key: message_objects_ref[item] if key in spec.references else copy.deepcopy(item)
+                      for key, item in spec.kwargs.items()}
+        return message_objects_ref[spec.type_name](*spec.args, **kwargs_out)  # __init__ must not throw error
+
+    def generate_messages(self):
+        """
+        Accesses the API, processes the result, and returns a list of messages and message factories.  The sheet is
+        only parsed again if its version and values have changed.
 
-def recursive_message_generate(to_be_processed):
+        :return: (list): the messages and message factories as defined in the google sheet
+        """
+
+        self.log_message_gen()
+
+        compiled = sheet_specs.default_store.get(self.sheet_id)
+        version = self.sheet_version()
+        if compiled is None or version is None or version != compiled.version:
+            sheets_service = google_services.service('sheets', 'v4')
+            try:
+                sheets_request = sheets_service.spreadsheets().values().get(spreadsheetId=self.sheet_id,
+                                                                            range="Messages!A:C")
+                rows = sheets_request.execute()['values']
+            except HttpError as e:
+                message_gen_logger.warning("Error generating messages from google sheet.  Sheet id: " + self.sheet_id)
+                message_gen_logger.warning("Full error: " + str(e))
+                return [BasicTextMessage("Error generating messages from google sheet.  Sheet id: " + self.sheet_id)]
+
+            # the sheet version also changes with edits outside the messages range - only parse if the values differ
+            values_hash = sheet_specs.content_hash(rows)
+            if compiled is None or values_hash != compiled.content_hash:
+                message_gen_logger.debug("Parsing google sheet.  Sheet id: " + self.sheet_id)
+                compiled = sheet_specs.compiled_sheet(version=version, content_hash=values_hash,
+                                                      specs=self.compile_rows(rows))
+            else:
+                compiled = compiled._replace(version=version)
+            sheet_specs.default_store.set(self.sheet_id, compiled)
+
+        return [self.create(spec) for spec in compiled.specs]
+
+
+class _FactoryWorkers(object):
+    """
+    Long-lived threads which run message factories for stream_message_generate.  Threads are kept between generations,
+    so that each reuses the Google service objects google_services keeps per thread instead of building them again
+    every cycle.  A thread is only started when every existing thread is busy, so there are never more threads than
+    factories have ever run at once (the concurrency limit, plus any factories abandoned after timing out).  Daemon
+    threads, so that an abandoned factory does not keep the process alive.
     """
-    Recursively processes the Message and MessageFactory objects in to_be_processed until all MessageFactory objects
-    have been called.  Returns a list of purely Message objects.
+    def __init__(self):
+        """
+        Initializes the workers.  Threads are started as needed.
+        """
+        self._tasks = queue.Queue()
+        self._lock = threading.Lock()
+        self._idle = 0
+        self.threads_started = 0
+
+    def submit(self, function: callable, *args):
+        """
+        Runs a function on an idle worker thread, starting a new thread if none is idle.
+
+        :param function: (callable) the function to run.  must not raise
+        :param args: the arguments for the function
+        :return: None
+        """
+        with self._lock:
+            if self._idle > 0:
+                self._idle -= 1
+            else:
+                self.threads_started += 1
+                threading.Thread(target=self._work, name="message-factory-" + str(self.threads_started),
+                                 daemon=True).start()
+        self._tasks.put((function, args))
+
+    def _work(self):
+        """
+        Runs submitted functions, in a worker thread, for the life of the process.
+
+        :return: None
+        """
+        while True:
+            function, args = self._tasks.get()
+            function(*args)
+            with self._lock:
+                self._idle += 1
+
+
+_factory_workers = _FactoryWorkers()
+
+
+def _run_factory(path: tuple, factory: MessageFactory, finished: queue.Queue):
+    """
+    Runs a factory's generate_messages on a worker thread, passing the result (or the error raised) back to
+    stream_message_generate.
+
+    :param path: (tuple) the position of the factory in the depth-first order of the output
+    :param factory: (MessageFactory) the factory to run
+    :param finished: (queue.Queue) receives (path, generated objects, error) when the factory completes
+    :return: None
+    """
+    try:
+        finished.put((path, factory.generate_messages(), None))
+    except BaseException as e:
+        finished.put((path, None, e))
+
+
+def stream_message_generate(to_be_processed, max_workers: int = None, timeout: float = None):
+    """
+    Processes the Message and MessageFactory objects in to_be_processed until all MessageFactory objects (including
+    those created by other factories) have been called, yielding Message objects as soon as they are available.
+    Messages are yielded in the depth-first order of the factories' outputs - each factory replaced by the messages it
+    generates - so a message is yielded once every factory before it has finished.
+
+    Factories run concurrently on up to max_workers threads, which are kept for later generations (see
+    _FactoryWorkers).  When more factories are waiting than there are workers, the earliest in the depth-first order
+    runs first, so max_workers=1 calls them in exactly the depth-first order.  A factory which has not finished after
+    timeout seconds is abandoned and its messages are left out (the thread cannot be stopped, so it is left to finish
+    in the background).  Errors raised by factories are passed on.
+
+    :param to_be_processed: (list) a list of Message and/or MessageFactory objects
+    :param max_workers: (int, default config.FACTORY_WORKERS) the maximum number of factories to run at once
+    :param timeout: (float, default config.FACTORY_TIMEOUT) seconds to wait for each factory.  None for no limit when
+                    config.FACTORY_TIMEOUT is None
+    :return: (generator) yields Message objects
+    """
+    if max_workers is None:
+        max_workers = config.FACTORY_WORKERS
+    if timeout is None:
+        timeout = config.FACTORY_TIMEOUT
+
+    # factories are identified by their path: their index in to_be_processed, then their index in the output of each
+    # factory above them.  sorting paths gives the depth-first order
+    generated = {}  # path -> list of objects the factory at path generated, until they are added to the worklist
+    waiting = []  # heap of (path, factory) for factories not yet started
+    running = {}  # path -> (deadline, factory)
+    finished = queue.Queue()
+
+    def add_factories(parent_path, objects):
+        for i, obj in enumerate(objects):
+            if not hasattr(obj, "display"):  # use display attribute to test if obj is a Message
+                heapq.heappush(waiting, (parent_path + (i,), obj))
+
+    # the worklist of objects still to be output, next object last
+    worklist = [((i,), obj) for i, obj in reversed(list(enumerate(to_be_processed)))]
+    add_factories((), to_be_processed)
+
+    while True:
+        # output everything up to the first factory which has not finished, replacing finished factories with their
+        # output
+        while worklist:
+            path, obj = worklist[-1]
+            if hasattr(obj, "display"):
+                worklist.pop()
+                yield obj
+            elif path in generated:
+                worklist.pop()
+                worklist.extend((path + (i,), child) for i, child in reversed(list(enumerate(generated.pop(path)))))
+            else:
+                break
+
+        if not worklist:
+            return
+
+        while waiting and len(running) < max_workers:
+            path, factory = heapq.heappop(waiting)
+            deadline = time.monotonic() + timeout if timeout is not None else float('inf')
+            running[path] = (deadline, factory)
+            _factory_workers.submit(_run_factory, path, factory, finished)
+
+        next_deadline = min(deadline for deadline, _ in running.values())
+        try:
+            path, objects, error = finished.get(timeout=max(0, next_deadline - time.monotonic())
+                                                if next_deadline != float('inf') else None)
+        except queue.Empty:
+            now = time.monotonic()
+            for path, (deadline, factory) in list(running.items()):
+                if now >= deadline:
+                    message_gen_logger.warning("Message generation timed out after " + str(timeout) +
+                                               " seconds, skipping messages for " + str(factory.logging_str))
+                    del running[path]
+                    generated[path] = []
+            continue
+
+        if path not in running:  # finished after timing out - already skipped
+            continue
+        del running[path]
+        if error is not None:
+            raise error
+        generated[path] = objects
+        add_factories(path, objects)
+
+
+def recursive_message_generate(to_be_processed, max_workers: int = None, timeout: float = None):
+    """
+    Processes the Message and MessageFactory objects in to_be_processed until all MessageFactory objects have been
+    called.  Returns a list of purely Message objects.  See stream_message_generate, which yields the messages as
+    they become available.
 
     :param to_be_processed: (list) a list of Message and/or MessageFactory objects
+    :param max_workers: (int, default config.FACTORY_WORKERS) the maximum number of factories to run at once
+    :param timeout: (float, default config.FACTORY_TIMEOUT) seconds to wait for each factory
     :return: (list) a list of Message objects
     """
+    return list(stream_message_generate(to_be_processed, max_workers=max_workers, timeout=timeout))
 
-    # end recursion condition - length 1 and is a message
-    if len(to_be_processed) == 1:
-        if hasattr(to_be_processed[0], "display"):  # use display attribute to test if obj is a Message
-            return to_be_processed
-        else:  # must be a message factory - continue recursion using output of message factory
-            return recursive_message_generate(to_be_processed[0].generate_messages())
 
-    else:
-        # continue recursion - for message objects prepend them to the return and process the rest
-        if hasattr(to_be_processed[0], "display"):
-            return [to_be_processed[0]] + recursive_message_generate(to_be_processed[1:])
-        # for message factory objects generate their messages and process those along with the remainder
-        else:
-            return recursive_message_generate(to_be_processed[0].generate_messages() + to_be_processed[1:])
+def prerender_text_messages(messages: list, processes: int = None):
+    """
+    Lays out the text of all displayable text messages at once, spread across a pool of processes, and applies the
+    results so the messages render without laying out their text again.  Messages which already have a layout (e.g.
+    from an earlier cycle) are skipped.  Messages whose layout fails are left alone and will be laid out (and their
+    errors handled) when they are rendered.
+
+    :param messages: (list) a list of Message objects
+    :param processes: (int, default None) number of worker processes.  None for one per core, 1 to run serially
+    :return: (int) the number of messages laid out
+    """
+
+    to_layout = []
+    for message in messages:
+        # messages laid out in an earlier cycle keep their layout
+        if message and isinstance(message, BasicTextMessage) and message.layout is None:
+            job = message.layout_job()
+            if job is not None:
+                to_layout.append((message, job))
+
+    if not to_layout:
+        return 0
+
+    layouts = hlp.draw_text_best_parameters_batch([job for _, job in to_layout], processes=processes)
+
+    n_laid_out = 0
+    for (message, _), layout in zip(to_layout, layouts):
+        if layout is not None:
+            message.apply_layout(layout)
+            n_laid_out += 1
+
+    message_gen_logger.info("Laid out {} of {} text messages ahead of display.".format(n_laid_out, len(to_layout)))
+    return n_laid_out
@@ -0,0 +1,150 @@
+import logging
+import random
+import threading
+import time
+from google.auth.exceptions import TransportError
+from urllib.error import URLError
+from socket import timeout as SocketTimeoutError
+from flip_sign.message_generation import stream_message_generate
+
+logger_name = 'flip_sign.message_refresh'
+message_refresh_logger = logging.getLogger(logger_name)
+
+# errors expected while the internet is down
+NETWORK_ERRORS = (TransportError, URLError, SocketTimeoutError, ConnectionError)
+
+
+class MessageRefresher(object):
+    """
+    Keeps the last good message list and generates new ones in the background, so the sign keeps showing messages
+    while a new list is generated or the internet is down.  A new list replaces the last good one only once it is
+    complete.  Errors are collected for the sign to report rather than raised.
+    """
+    def __init__(self, make_factories: callable, max_retry_wait: float = 300, catalog=None,
+                 messages: list = None):
+        """
+        Initializes the refresher.  Nothing is generated until refresh is called.
+
+        :param make_factories: (callable) returns the list of messages and message factories to generate from
+        :param max_retry_wait: (float) the longest wait, in seconds, between attempts before there is any message list
+        :param catalog: (message_catalog.MessageCatalog) where to save each new message list.  None to not save them
+        :param messages: (list) a message list to fall back on before the first is generated, e.g. from the catalog
+        """
+        self.make_factories = make_factories
+        self.max_retry_wait = max_retry_wait
+        self.catalog = catalog
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._messages = messages
+        self._fresh = False
+        self._preview = None
+        self._preview_offered = False
+        self._errors = []
+
+    @property
+    def messages(self):
+        """
+        :return: (list or None) the last good message list, or None if no list has been generated yet
+        """
+        with self._lock:
+            return self._messages
+
+    def refresh(self):
+        """
+        Starts generating a new message list in the background, unless one is already being generated.
+
+        :return: (bool) whether a new generation was started
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._thread = threading.Thread(target=self._generate, name="message-refresh", daemon=True)
+            self._thread.start()
+            return True
+
+    def _generate(self):
+        """
+        Generates a message list, in the background thread.  Until there is a good list to fall back on, failed
+        attempts are retried with exponential backoff.  Once there is one, a failed attempt is only reported and the
+        next refresh tries again.
+
+        :return: None
+        """
+        n_fails = 0
+        while True:
+            message_refresh_logger.info("Attempting update.  n_fails: " + str(n_fails))
+            try:
+                messages = []
+                for message in stream_message_generate(self.make_factories()):
+                    messages.append(message)
+                    # make the first displayable message available while slower factories are still running
+                    if message and not self._preview_offered:
+                        with self._lock:
+                            self._preview = message
+                            self._preview_offered = True
+                random.shuffle(messages)
+            except Exception as e:
+                if isinstance(e, NETWORK_ERRORS):
+                    message_refresh_logger.warning("Internet error generating messages.  Error details: " + str(e))
+                else:
+                    message_refresh_logger.exception("Unexpected error generating messages.")
+                with self._lock:
+                    self._errors.append(e)
+                    if self._messages is not None:
+                        return
+                time.sleep(min(2 * (2 ** n_fails), self.max_retry_wait))
+                n_fails += 1
+                continue
+
+            with self._lock:
+                self._messages = messages
+                self._fresh = True
+            self.ready.set()
+            message_refresh_logger.info("Message list update complete.")
+            if self.catalog is not None:
+                self.catalog.save(messages)
+            return
+
+    def wait(self, timeout: float = None):
+        """
+        Waits for a new message list to be ready.
+
+        :param timeout: (float) the longest time to wait, in seconds.  None to wait indefinitely
+        :return: (bool) whether a new list is ready
+        """
+        return self.ready.wait(timeout)
+
+    def take(self):
+        """
+        Takes the new message list, if one has been generated since the last was taken.
+
+        :return: (list or None) the new message list, or None if there is no new list
+        """
+        with self._lock:
+            if not self._fresh:
+                return None
+            self._fresh = False
+            self.ready.clear()
+            return self._messages
+
+    def take_preview(self):
+        """
+        Takes the first displayable message generated, for the sign to show before the first list is ready.  It is
+        only returned once.
+
+        :return: (Message or None) the message, or None if there is none yet (or it has already been taken)
+        """
+        with self._lock:
+            preview, self._preview = self._preview, None
+            return preview
+
+    def take_errors(self):
+        """
+        Takes the errors from failed generations since the errors were last taken.
+
+        :return: (list) the errors, oldest first
+        """
+        with self._lock:
+            errors, self._errors = self._errors, []
+            return errors
@@ -0,0 +1,110 @@
+import logging
+import random
+
+logger_name = 'flip_sign.message_scheduler'
+message_scheduler_logger = logging.getLogger(logger_name)
+
+
+def _message_key(message):
+    """
+    Identifies a message across message lists.  Each generation creates new message objects, so messages are matched
+    on their type and description (e.g. the text or image shown) rather than on the object.
+
+    :param message: (Message) the message
+    :return: (tuple) the key
+    """
+    string_rep = getattr(message, 'string_rep', None)
+    return (type(message).__name__, string_rep) if string_rep is not None else (None, id(message))
+
+
+class MessageScheduler(object):
+    """
+    Chooses the order in which messages are shown, by smooth weighted round-robin over the weights of the messages
+    (see Message.reweight): each message is shown in proportion to its weight, spread evenly through the sequence
+    rather than in clumps.  The sequence is produced one message at a time, so the weights can be recalculated or the
+    message list replaced without creating the messages again.  Ties are broken at random, so that messages of equal
+    weight do not always appear in the same order.
+    """
+    def __init__(self, messages: list = None):
+        """
+        Initializes the scheduler.
+
+        :param messages: (list) the messages to schedule.  None to start with no messages
+        """
+        self._messages = []
+        self._weights = []
+        self._credits = []
+        if messages is not None:
+            self.set_messages(messages)
+
+    def set_messages(self, messages: list):
+        """
+        Replaces the messages to schedule.  Messages which were already scheduled (the same message, even if it has been
+        generated again) keep their place in the sequence.
+
+        :param messages: (list) the messages to schedule
+        :return: None
+        """
+        credits = {}
+        for message, credit in zip(self._messages, self._credits):
+            credits.setdefault(_message_key(message), []).append(credit)
+        self._messages = list(messages)
+        self._credits = []
+        for message in self._messages:
+            previous = credits.get(_message_key(message))
+            self._credits.append(previous.pop(0) if previous else 0.0)
+        self.reweight()
+
+    def reweight(self):
+        """
+        Recalculates the weight of each message, e.g. once a day for messages whose frequency changes as an event
+        approaches.  Messages which failed to initialize have no weight.
+
+        :return: (float) the total weight
+        """
+        self._weights = [max(0.0, message.reweight()) if message.display else 0.0 for message in self._messages]
+        self._credits = [credit if weight > 0 else 0.0 for credit, weight in zip(self._credits, self._weights)]
+        total_weight = self.total_weight()
+        message_scheduler_logger.info("Scheduling {} messages, total weight {:.2f}."
+                                      .format(sum(weight > 0 for weight in self._weights), total_weight))
+        return total_weight
+
+    def total_weight(self):
+        """
+        :return: (float) the sum of the weights of the scheduled messages
+        """
+        return sum(self._weights)
+
+    def next(self):
+        """
+        Chooses the next message to show: every message gains credit equal to its weight, and the message with the
+        most credit is shown and gives up credit equal to the total weight.
+
+        :return: (Message or None) the next message, or None if no message has any weight
+        """
+        total_weight = self.total_weight()
+        if total_weight <= 0:
+            return None
+
+        # visit the messages in a random order, so that ties go to a random one of them
+        best = None
+        for i in random.sample(range(len(self._weights)), len(self._weights)):
+            weight = self._weights[i]
+            if weight > 0:
+                self._credits[i] += weight
+                if best is None or self._credits[i] > self._credits[best]:
+                    best = i
+        self._credits[best] -= total_weight
+        return self._messages[best]
+
+    def cycle(self):
+        """
+        The messages for one cycle through the list: as many as the total weight (at least one), so that on average
+        each message is shown as often as its frequency.
+
+        :return: (list) the messages, in order.  Empty if no message has any weight
+        """
+        total_weight = self.total_weight()
+        if total_weight <= 0:
+            return []
+        return [self.next() for _ in range(max(1, round(total_weight)))]
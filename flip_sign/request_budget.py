@@ -0,0 +1,148 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import namedtuple, deque
+from urllib.error import URLError
+
+logger_name = 'flip_sign.request_budget'
+request_budget_logger = logging.getLogger(logger_name)
+
+# request priorities, most important first.  each may use up to its share of the limit, so that the last of the budget
+# is kept for the more important requests
+PRIORITY_SHARES = {'high': 1.0, 'normal': 0.9, 'low': 0.7}
+
+# usage statistics: requests made and refused within the window, and the limit
+budget_info = namedtuple('budget_info', ['used', 'limit', 'refused'])
+
+
+class BudgetExceededError(URLError):
+    """
+    Raised instead of making a request which the budget does not allow.  A URLError, so it is handled wherever a
+    failed request is: a stale cached response is served if there is one, and otherwise the render fails.
+    """
+    def __init__(self, priority: str, used: int, limit: int):
+        super().__init__("request budget exhausted for {} priority requests: {} of {} used"
+                         .format(priority, used, limit))
+
+
+class RequestBudget(object):
+    """
+    Tracks the requests made to a rate-limited API in a rolling window (e.g. a daily quota), stored in SQLite so the
+    count survives restarts.  The database is read once and the count kept in memory, so checking the budget never
+    touches the disk; it is only written when a request is made.  Requests are allowed by priority: lower priority
+    requests stop first, keeping the rest of the budget for the more important ones.  If the database cannot be used
+    the budget carries on in memory.
+    """
+    def __init__(self, path: str, limit: int, window: float = 24 * 60 * 60, max_ttl_stretch: float = 4.0,
+                 timer: callable = time.time):
+        """
+        Initializes the budget.  The database is opened on first use.
+
+        :param path: (str) the path of the SQLite database file
+        :param limit: (int) the number of requests allowed within the window
+        :param window: (float) the length of the rolling window, in seconds
+        :param max_ttl_stretch: (float) the factor by which cache lifetimes are stretched when the budget is spent
+        :param timer: (callable) returns the current time as a unix timestamp
+        """
+        self.path = path
+        self.limit = limit
+        self.window = window
+        self.max_ttl_stretch = max_ttl_stretch
+        self.timer = timer
+        self.refused = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        self._database_failed = False
+        self._memory = None  # times of the requests within the window, oldest first.  read on first use
+
+    def _execute(self, sql: str, parameters: tuple = ()):
+        """
+        Executes a statement against the database, opening it if necessary.  Database errors are logged and the budget
+        continues in memory only.
+
+        :param sql: (str) the statement
+        :param parameters: (tuple) the statement parameters
+        :return: (list or None) the rows returned, or None if the database is unavailable
+        """
+        if self._database_failed:
+            return None
+        try:
+            if self._connection is None:
+                self._connection = sqlite3.connect(self.path, check_same_thread=False)
+                self._connection.execute("CREATE TABLE IF NOT EXISTS requests (made REAL NOT NULL)")
+            with self._connection:
+                return self._connection.execute(sql, parameters).fetchall()
+        except sqlite3.Error as e:
+            request_budget_logger.warning("Request budget database unavailable, counting in memory only.  Path: " +
+                                          self.path + " Error: " + str(e))
+            self._database_failed = True
+            return None
+
+    def _used(self, now: float):
+        """
+        Counts the requests made within the window, forgetting older ones, in memory only.  The requests are read from
+        the database on first use.  Must be called with the lock held.
+
+        :param now: (float) the current time, as a unix timestamp
+        :return: (int) the number of requests made within the window
+        """
+        if self._memory is None:
+            rows = self._execute("SELECT made FROM requests WHERE made > ? ORDER BY made", (now - self.window,))
+            self._memory = deque(made for made, in rows or ())
+        while self._memory and self._memory[0] <= now - self.window:
+            self._memory.popleft()
+        return len(self._memory)
+
+    def used(self):
+        """
+        :return: (int) the number of requests made within the window
+        """
+        with self._lock:
+            return self._used(self.timer())
+
+    def allows(self, priority: str = 'normal', requests: int = 1):
+        """
+        Checks whether requests of a priority would be allowed now, without recording anything.
+
+        :param priority: (str) 'high', 'normal' or 'low'
+        :param requests: (int) the number of requests
+        :return: (bool) whether the requests would be allowed
+        """
+        with self._lock:
+            return self._used(self.timer()) + requests <= self.limit * PRIORITY_SHARES[priority]
+
+    def acquire(self, priority: str = 'normal'):
+        """
+        Records a request if the budget allows it at this priority, otherwise raises BudgetExceededError.
+
+        :param priority: (str) 'high', 'normal' or 'low'
+        :return: None
+        """
+        with self._lock:
+            now = self.timer()
+            used = self._used(now)
+            if used + 1 > self.limit * PRIORITY_SHARES[priority]:
+                self.refused += 1
+                request_budget_logger.warning("Request budget exhausted for {} priority requests: {} of {} used."
+                                              .format(priority, used, self.limit))
+                raise BudgetExceededError(priority, used, self.limit)
+            self._memory.append(now)
+            self._execute("DELETE FROM requests WHERE made <= ?", (now - self.window,))
+            self._execute("INSERT INTO requests (made) VALUES (?)", (now,))
+
+    def ttl_stretch(self):
+        """
+        The factor by which to stretch the lifetime of cached responses, so that fewer requests are made as the budget
+        runs down: 1 until half the budget is used, rising linearly to max_ttl_stretch when it is all used.
+
+        :return: (float) the factor, at least 1
+        """
+        fraction_used = self.used() / self.limit
+        return 1 + (self.max_ttl_stretch - 1) * min(1.0, max(0.0, (fraction_used - 0.5) / 0.5))
+
+    def info(self):
+        """
+        :return: (budget_info) requests used within the window, the limit, and requests refused since startup
+        """
+        return budget_info(used=self.used(), limit=self.limit, refused=self.refused)
@@ -0,0 +1,224 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+logger_name = 'flip_sign.response_cache'
+response_cache_logger = logging.getLogger(logger_name)
+
+# a cached response and when it was fetched / expires, as unix timestamps
+cache_entry = namedtuple('cache_entry', ['value', 'fetched', 'expires'])
+# hit/miss statistics.  stale_hits are expired responses served because the request failed, coalesced are requests
+# which waited for an identical request already in flight instead of making their own
+cache_info = namedtuple('cache_info', ['hits', 'misses', 'stale_hits', 'errors', 'coalesced', 'currsize'])
+
+
+class _InFlightRequest(object):
+    """
+    A fetch in progress, shared by every caller requesting the same key until it completes.
+    """
+    def __init__(self):
+        """
+        Initializes the request as not yet complete.
+        """
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def result(self):
+        """
+        Waits for the fetch to complete.
+
+        :return: the parsed response, or raises the error the fetch raised
+        """
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class PersistentResponseCache(object):
+    """
+    A cache of JSON API responses stored in SQLite, so it survives restarts and has no entry limit.  Parsed responses
+    are also kept in memory once read.  Expired entries are kept until they are replaced, so that they can be served
+    when the API cannot be reached.  If the database cannot be used the cache carries on in memory only.
+    """
+    def __init__(self, path: str, timer: callable = time.time):
+        """
+        Initializes the cache.  The database is opened on first use.
+
+        :param path: (str) the path of the SQLite database file
+        :param timer: (callable) returns the current time as a unix timestamp.  wall clock time is used (rather than
+                      a monotonic clock) since expiry times are persisted across restarts
+        """
+        self.path = path
+        self.timer = timer
+        self._lock = threading.RLock()
+        self._connection = None
+        self._database_failed = False
+        self._memory = {}
+        self._in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.errors = 0
+        self.coalesced = 0
+
+    def _execute(self, sql: str, parameters: tuple = ()):
+        """
+        Executes a statement against the database, opening it if necessary.  Database errors are logged and the cache
+        continues in memory only.
+
+        :param sql: (str) the statement
+        :param parameters: (tuple) the statement parameters
+        :return: (list or None) the rows returned, or None if the database is unavailable
+        """
+        if self._database_failed:
+            return None
+        try:
+            if self._connection is None:
+                self._connection = sqlite3.connect(self.path, check_same_thread=False)
+                self._connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, "
+                                         "response TEXT NOT NULL, fetched REAL NOT NULL, expires REAL NOT NULL)")
+            with self._connection:
+                return self._connection.execute(sql, parameters).fetchall()
+        except sqlite3.Error as e:
+            response_cache_logger.warning("Response cache database unavailable, caching in memory only.  Path: "
+                                          + self.path + " Error: " + str(e))
+            self._database_failed = True
+            return None
+
+    def get(self, key: str):
+        """
+        Looks up a response, whether or not it has expired.
+
+        :param key: (str) the cache key
+        :return: (cache_entry or None) the cached response, or None if there is none
+        """
+        with self._lock:
+            try:
+                return self._memory[key]
+            except KeyError:
+                pass
+
+            rows = self._execute("SELECT response, fetched, expires FROM responses WHERE key = ?", (key,))
+            if not rows:
+                return None
+            response, fetched, expires = rows[0]
+            entry = cache_entry(value=json.loads(response), fetched=fetched, expires=expires)
+            self._memory[key] = entry
+            return entry
+
+    def set(self, key: str, value, fetched: float, expires: float):
+        """
+        Stores a response, replacing any previous response for the key.
+
+        :param key: (str) the cache key
+        :param value: (JSON-serializable) the parsed response
+        :param fetched: (float) when the response was fetched, as a unix timestamp
+        :param expires: (float) when the response expires, as a unix timestamp
+        :return: None
+        """
+        with self._lock:
+            self._execute("INSERT OR REPLACE INTO responses (key, response, fetched, expires) VALUES (?, ?, ?, ?)",
+                          (key, json.dumps(value), fetched, expires))
+            self._memory[key] = cache_entry(value=value, fetched=fetched, expires=expires)
+
+    def get_or_fetch(self, key: str, fetch: callable, expiry: callable, is_fresh: callable = None):
+        """
+        Returns the cached response if it has not expired, otherwise fetches and caches a new one.  If the fetch fails
+        and an expired response is cached, the expired response is returned instead of raising.  Concurrent calls for
+        the same key share a single fetch: the first caller makes the request and the others wait for its result.
+
+        :param key: (str) the cache key
+        :param fetch: (callable) makes the request and returns the parsed response
+        :param expiry: (callable) given (response, now), returns when the response expires
+        :param is_fresh: (callable) given (cache_entry, now), returns whether the cached response can be used.  default
+                         until it expires
+        :return: the parsed response
+        """
+        with self._lock:
+            now = self.timer()
+            entry = self.get(key)
+            if entry is not None and (now < entry.expires if is_fresh is None else is_fresh(entry, now)):
+                self.hits += 1
+                return entry.value
+
+            flight = self._in_flight.get(key)
+            if flight is not None:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                leader_flight = self._in_flight[key] = _InFlightRequest()
+
+        if flight is not None:
+            return flight.result()
+
+        try:
+            leader_flight.value = self._fetch(key, entry, fetch, expiry, now)
+        except BaseException as e:
+            leader_flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            leader_flight.done.set()
+
+        return leader_flight.value
+
+    def _fetch(self, key: str, entry: cache_entry, fetch: callable, expiry: callable, now: float):
+        """
+        Fetches and caches a response, falling back to the expired entry (if any) when the fetch fails.
+
+        :param key: (str) the cache key
+        :param entry: (cache_entry or None) the expired entry for the key, if there is one
+        :param fetch: (callable) makes the request and returns the parsed response
+        :param expiry: (callable) given (response, now), returns when the response expires
+        :param now: (float) the current time, as a unix timestamp
+        :return: the parsed response
+        """
+        try:
+            value = fetch()
+        except (OSError, ValueError) as e:
+            with self._lock:
+                self.errors += 1
+                if entry is not None:
+                    self.stale_hits += 1
+            if entry is None:
+                raise
+            response_cache_logger.warning("Request failed, serving stale response from " +
+                                          time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry.fetched)) +
+                                          ".  Key: " + key + " Error: " + str(e))
+            return entry.value
+
+        self.set(key, value, fetched=now, expires=expiry(value, now))
+        return value
+
+    def clear(self):
+        """
+        Removes all cached responses.
+
+        :return: None
+        """
+        with self._lock:
+            self._execute("DELETE FROM responses")
+            self._memory.clear()
+
+    def __len__(self):
+        """
+        :return: (int) the number of cached responses, including expired ones
+        """
+        with self._lock:
+            rows = self._execute("SELECT COUNT(*) FROM responses")
+            return rows[0][0] if rows is not None else len(self._memory)
+
+    def info(self):
+        """
+        Hit/miss statistics for the cache.
+
+        :return: (cache_info) hits, misses, stale_hits, errors, coalesced and the current number of entries
+        """
+        return cache_info(hits=self.hits, misses=self.misses, stale_hits=self.stale_hits, errors=self.errors,
+                          coalesced=self.coalesced, currsize=len(self))
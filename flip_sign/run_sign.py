@@ -1,13 +1,18 @@
 from flip_sign.displays import FlipDotDisplay
-from flip_sign.message_generation import GoogleSheetMessageFactory, recursive_message_generate, BasicTextMessage
+from flip_sign.message_generation import GoogleSheetMessageFactory, BasicTextMessage
+from flip_sign.message_refresh import MessageRefresher
+from flip_sign.weather_prefetch import WeatherPrefetcher
+from flip_sign.message_scheduler import MessageScheduler
+import flip_sign.message_catalog as message_catalog
+import flip_sign.message_generation as msg_gen
+import flip_sign.helpers as hlp
+import flip_sign.glyph_atlas as glyph_atlas
+import flip_sign.asset_bundle as asset_bundle
+import flip_sign.layout_stats as layout_stats
 from flip_sign.assets import root_dir
 import serial
 import datetime
-import random
 from flip_sign.assets import keys
-from google.auth.exceptions import TransportError
-from urllib.error import URLError
-from socket import timeout as SocketTimeoutError
 import flip_sign.config as config
 import time
 import logging
@@ -30,6 +35,22 @@ def run_sign():
     logging.getLogger('').addHandler(fh)
     logging.getLogger('').addHandler(ch)
 
+    # map the packed asset bundle, rebuilding it first if it is missing or out of date with the loose files
+    standard_wrap_params = (msg_gen.basic_text_default_wrap_params + msg_gen.weather_stub_default_wrap_params +
+                            (msg_gen.date_message_wrap_params, msg_gen.date_match_wrap_params))
+    if not asset_bundle.load():
+        try:
+            asset_bundle.build(standard_wrap_params)
+            asset_bundle.load()
+        except OSError as e:
+            run_sign_logger.warning("Unable to build asset bundle, using loose asset files.  Error: " + str(e))
+
+    # rasterize the glyphs for the standard fonts and sizes up front (only those not already in the bundle)
+    glyph_atlas.preload(standard_wrap_params)
+
+    # load the weather dashboard images into memory so dashboards render without reading from disk
+    hlp.preload_weather_sprites()
+
     # base variables and objects
     config.HOME_LOCATION = input("Enter zip code for home location:")
 
@@ -38,35 +59,57 @@ def run_sign():
                                      timeout=1, stopbits=serial.STOPBITS_ONE)
     display = FlipDotDisplay(serial_interface=serial_interface)
 
+    # message lists are generated in the background, and the last good list shown until a new one is ready.  at
+    # startup, the list saved in the catalog is shown while the first is generated
+    messages = message_catalog.default_catalog.load() or None
+    refresher = MessageRefresher(lambda: [GoogleSheetMessageFactory(sheet_id=keys['GoogleSheet'])],
+                                 catalog=message_catalog.default_catalog, messages=messages)
+
+    # keep the forecasts for the weather messages in the list warm, so that they render without waiting on the network
+    prefetcher = WeatherPrefetcher()
+    if messages is not None:
+        prefetcher.watch(messages)
+    prefetcher.start()
+
+    # messages are shown in proportion to their frequency, spread evenly through each cycle
+    scheduler = MessageScheduler(messages)
+
     # main "event" loop
     while True:
-        # update message list
-        updated = False
-        n_fails = 0
-        while not updated:
-            run_sign_logger.info("Attempting update.  n_fails: " + str(n_fails))
-            try:
-                messages = recursive_message_generate([GoogleSheetMessageFactory(sheet_id=keys['GoogleSheet'])])
-                random.shuffle(messages)
-                updated = True
-            except (TransportError, URLError, SocketTimeoutError) as e:
-                run_sign_logger.warning("Internet error generating messages.  Error details: " + str(e))
-                wait_time = 2 * (2 ** n_fails)
-                retry_time = datetime.datetime.now() + datetime.timedelta(seconds=wait_time)
-                display.update(BasicTextMessage("Internet error generating messages.  Trying again at " +
-                                                retry_time.isoformat()))
-                time.sleep(wait_time)
-            except Exception as e:
-                display.update(BasicTextMessage("Unexpected error generating messages.  Stopping.  Error: " + str(e)))
-                raise
-
-        run_sign_logger.info("Message list update complete.")
-
-        n_messages = len(messages)
+        # update message list - use the list generated in the background during the last cycle if it is ready, and
+        # start generating the next one
+        new_messages = refresher.take()
+        refresher.refresh()
+        while messages is None and new_messages is None:
+            # nothing to show yet - put the first displayable message on the sign while slower factories are still
+            # running, and report errors while waiting
+            refresher.wait(timeout=1)
+            preview = refresher.take_preview()
+            if preview is not None:
+                display.update(preview)
+            for e in refresher.take_errors():
+                display.update(BasicTextMessage("Error generating messages, trying again.  Error: " + str(e)))
+            new_messages = refresher.take()
+
+        if new_messages is not None:
+            messages = new_messages
+            prefetcher.watch(messages)
+            scheduler.set_messages(messages)
+        else:
+            # frequencies change over time (e.g. as events approach), so weigh the messages again
+            scheduler.reweight()
+            run_sign_logger.info("New message list not ready, showing the last message list again.")
+
+        message_init_fails = sum(1 for message in messages if not message.display and message.init_failure)
+        cycle_messages = scheduler.cycle()
+
+        # lay out the text messages for the whole cycle at once, using all cores
+        msg_gen.prerender_text_messages(list(dict.fromkeys(cycle_messages)), processes=config.LAYOUT_PROCESSES)
+
+        n_messages = len(cycle_messages)
         message_render_fails = 0
-        message_init_fails = 0
-        # run through generated messages
-        for i, message in enumerate(messages):
+        # run through the messages scheduled for this cycle
+        for i, message in enumerate(cycle_messages):
             # observe quiet hours
             if datetime.datetime.now().time() > config.END_TIME:  # if after end time, use tomorrow start
                 next_start = datetime.datetime.combine(datetime.date.today() + datetime.timedelta(days=1),
@@ -78,12 +121,6 @@ def run_sign():
                 time.sleep((next_start - datetime.datetime.now()).total_seconds())
                 break  # break display loop to force message list update
 
-            # skip messages with display=False and increment init failure if applicable
-            if not message:
-                if message.init_failure:
-                    message_init_fails += 1
-                continue
-
             # attempt to update display until successful, counting number of failures
             update_successful = display.update(message)
             if not update_successful:
@@ -101,6 +138,20 @@ def run_sign():
             display.update(BasicTextMessage(cycle_message, wrap_text=False))
             time.sleep(config.WAIT_TIME.total_seconds())
 
+        generation_errors = refresher.take_errors()
+        if generation_errors:
+            display.update(BasicTextMessage("Error generating messages, showing the last messages.  Error: " +
+                                            str(generation_errors[-1])))
+            time.sleep(config.WAIT_TIME.total_seconds())
+
+        # end of cycle - log which messages were expensive to lay out, then start counting afresh
+        layout_stats.log_summary()
+        layout_stats.reset()
+        run_sign_logger.info("Forecast tile cache: " + str(hlp.render_day.cache_info()))
+        run_sign_logger.info("AccuWeather response cache: " + str(hlp.accuweather_cache_info()))
+        run_sign_logger.info("AccuWeather request budget: " + str(hlp.accuweather_budget_info()))
+        run_sign_logger.info("Geocoding cache: " + str(hlp.geocoding_cache_info()))
+
         # end of cycle flip all yellow then all black
         display.cycle_dots()
 
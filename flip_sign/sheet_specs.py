@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+import pickle
+import threading
+from collections import namedtuple
+from hashlib import sha256
+from flip_sign.assets import root_dir
+
+logger_name = 'flip_sign.sheet_specs'
+sheet_specs_logger = logging.getLogger(logger_name)
+
+spec_store_path = root_dir + "/cache/sheet_specs.pickle"
+
+# bump when the layout of sheet_row_spec / compiled_sheet changes, so that stored specs are compiled again
+_FORMAT_VERSION = 1
+
+# one row of the messages sheet, parsed: the message/factory type name, the positional arguments, the keyword arguments
+# (evaluated from their literals) and the names of the keyword arguments whose values refer to objects in
+# message_generation.message_objects_ref
+sheet_row_spec = namedtuple('sheet_row_spec', ['type_name', 'args', 'kwargs', 'references'])
+# the parsed rows of a sheet, with the drive file version and the hash of the values they were parsed from
+compiled_sheet = namedtuple('compiled_sheet', ['version', 'content_hash', 'specs'])
+
+
+def content_hash(rows: list):
+    """
+    Hashes the values of a sheet, to detect whether they have changed.
+
+    :param rows: (list) the rows of values returned by the sheets API
+    :return: (str) hex digest of the values
+    """
+    return sha256(json.dumps(rows, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class SheetSpecStore(object):
+    """
+    Keeps the compiled form of each google sheet, saved to disk so that the sheets are not parsed again after a
+    restart.  If the file cannot be read or written the store carries on in memory.
+    """
+    def __init__(self, path: str):
+        """
+        Initializes the store.  The file is read on first use.
+
+        :param path: (str) the path of the file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._sheets = None
+
+    def _load(self):
+        """
+        Reads the stored sheets from disk, if they have not already been read.
+
+        :return: (dict) sheet id -> compiled_sheet
+        """
+        if self._sheets is None:
+            self._sheets = {}
+            try:
+                with open(self.path, 'rb') as f:
+                    stored = pickle.load(f)
+                if stored['format'] == _FORMAT_VERSION:
+                    self._sheets = stored['sheets']
+            except FileNotFoundError:
+                pass
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, KeyError, TypeError) as e:
+                sheet_specs_logger.warning("Unable to read stored sheet specs, sheets will be parsed again.  Path: " +
+                                           self.path + " Error: " + str(e))
+        return self._sheets
+
+    def get(self, sheet_id: str):
+        """
+        :param sheet_id: (str) the id of the google sheet
+        :return: (compiled_sheet or None) the compiled sheet, or None if it has not been compiled
+        """
+        with self._lock:
+            return self._load().get(sheet_id)
+
+    def set(self, sheet_id: str, compiled: compiled_sheet):
+        """
+        Stores a compiled sheet and saves the store to disk.  The file is written to a temporary name and moved into
+        place, so a crash never leaves a partially written file.
+
+        :param sheet_id: (str) the id of the google sheet
+        :param compiled: (compiled_sheet) the compiled sheet
+        :return: None
+        """
+        with self._lock:
+            sheets = self._load()
+            sheets[sheet_id] = compiled
+            temp_path = self.path + ".tmp"
+            try:
+                with open(temp_path, 'wb') as f:
+                    pickle.dump({'format': _FORMAT_VERSION, 'sheets': sheets}, f)
+                os.replace(temp_path, self.path)
+            except (OSError, pickle.PicklingError) as e:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                sheet_specs_logger.warning("Unable to save sheet specs.  Path: " + self.path + " Error: " + str(e))
+
+
+default_store = SheetSpecStore(path=spec_store_path)
@@ -0,0 +1,109 @@
+import logging
+import threading
+from flip_sign.message_generation import AccuweatherDashboard, AccuweatherDescription, accuweather_forecast_request
+from flip_sign.message_refresh import NETWORK_ERRORS
+import flip_sign.helpers as hlp
+import flip_sign.config as config
+
+logger_name = 'flip_sign.weather_prefetch'
+weather_prefetch_logger = logging.getLogger(logger_name)
+
+
+class WeatherPrefetcher(object):
+    """
+    Keeps the forecasts for the weather messages in the current message list warm in the accuweather cache: shortly
+    before a cached forecast expires it is requested again in the background, so that rendering the message does not
+    wait on the network.  Prefetches are low priority requests against the daily budget, so they stop first as the
+    budget runs down and the forecast is then requested when the message is rendered, as before.
+    """
+    def __init__(self, lead: float = None, interval: float = None, priority: str = 'low'):
+        """
+        Initializes the prefetcher.  Nothing is requested until messages are watched.
+
+        :param lead: (float) how long before a forecast expires to request it again, in seconds.  default
+                     config.WEATHER_PREFETCH_LEAD
+        :param interval: (float) the time between checks of the forecasts, in seconds, when running in the background.
+                         default config.WEATHER_PREFETCH_INTERVAL
+        :param priority: ('high', 'normal' or 'low') the priority of prefetch requests against the budget
+        """
+        self.lead = config.WEATHER_PREFETCH_LEAD if lead is None else lead
+        self.interval = config.WEATHER_PREFETCH_INTERVAL if interval is None else interval
+        self.priority = priority
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def watch(self, messages: list):
+        """
+        Sets the messages whose forecasts are kept warm, replacing those watched before.  Each location is only
+        requested once, however many messages show it.
+
+        :param messages: (list) the current message list
+        :return: None
+        """
+        requests = {}
+        for message in messages:
+            if isinstance(message, (AccuweatherDashboard, AccuweatherDescription)) and not message.init_failure:
+                requests.setdefault(message.location['Key'], accuweather_forecast_request(message.location))
+        with self._lock:
+            self._requests = requests
+        weather_prefetch_logger.info("Watching forecasts for {} weather locations.".format(len(requests)))
+
+    def prefetch(self):
+        """
+        Requests again each watched forecast which is not cached or expires within the lead time.  Errors are logged,
+        not raised.
+
+        :return: (int) the number of requests made
+        """
+        with self._lock:
+            requests = list(self._requests.items())
+
+        n_requests = 0
+        for location_key, url in requests:
+            try:
+                if hlp.accuweather_prefetch(url, lead=self.lead, priority=self.priority):
+                    n_requests += 1
+            except NETWORK_ERRORS + (ValueError,) as e:
+                weather_prefetch_logger.warning("Unable to prefetch forecast for location " + location_key +
+                                                ".  Error: " + str(e))
+        if n_requests:
+            weather_prefetch_logger.info("Prefetched {} forecasts.".format(n_requests))
+        return n_requests
+
+    def start(self):
+        """
+        Starts prefetching in the background, checking the watched forecasts every interval, unless already started.
+
+        :return: (bool) whether the background thread was started
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="weather-prefetch", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """
+        Stops prefetching in the background, waiting for a prefetch in progress to finish.
+
+        :return: None
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        """
+        Prefetches every interval until stopped, in the background thread.
+
+        :return: None
+        """
+        while not self._stop.is_set():
+            try:
+                self.prefetch()
+            except Exception:
+                weather_prefetch_logger.exception("Unexpected error prefetching forecasts.")
+            self._stop.wait(self.interval)
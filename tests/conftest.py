@@ -0,0 +1,19 @@
+import flip_sign.image_store as image_store
+import flip_sign.helpers as hlp
+from flip_sign.request_budget import RequestBudget
+import tempfile
+import shutil
+
+
+# images packed during the tests (including by messages created when test modules are imported) go to a temporary
+# store rather than the sign's cache, and accuweather requests are counted against a temporary budget
+def pytest_configure(config):
+    config.cache_dir = tempfile.mkdtemp()
+    image_store.default_store = image_store.PackedImageStore(data_path=config.cache_dir + "/packed_images.bin",
+                                                             index_path=config.cache_dir + "/packed_images.json")
+    hlp._accuweather_budget = RequestBudget(path=config.cache_dir + "/accuweather_budget.sqlite3",
+                                            limit=hlp._accuweather_budget.limit)
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(config.cache_dir, ignore_errors=True)
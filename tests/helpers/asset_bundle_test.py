@@ -0,0 +1,100 @@
+import flip_sign.asset_bundle as asset_bundle
+import flip_sign.glyph_atlas as glyph_atlas
+from tests.helpers.draw_text_test import default_wrap_parameters
+from PIL import ImageFont
+import shutil
+import mmap
+import os
+import struct
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def unload_bundle():
+    yield
+    asset_bundle.unload()
+
+
+def test_bundle_weather_images(tmp_path):
+    path = str(tmp_path / "assets.bundle")
+    asset_bundle.build([], path=path)
+    assert asset_bundle.load(path)
+
+    for relative_path, inverted in asset_bundle.weather_image_names():
+        from_bundle = asset_bundle.weather_image(relative_path, inverted)
+        from_file = asset_bundle.load_weather_image(relative_path, inverted)
+        assert from_bundle.mode == '1'
+        assert from_bundle.size == from_file.size
+        assert from_bundle.tobytes() == from_file.tobytes()
+
+
+def test_bundle_missing_or_stale(tmp_path, monkeypatch):
+    # work on a copy of the weather images so they can be modified
+    weather_copy = tmp_path / "weather_images"
+    shutil.copytree(asset_bundle.weather_images_dir, weather_copy)
+    monkeypatch.setattr(asset_bundle, 'weather_images_dir', str(weather_copy))
+
+    path = str(tmp_path / "assets.bundle")
+    assert not asset_bundle.load(path)
+
+    asset_bundle.build([], path=path)
+    assert asset_bundle.load(path)
+    asset_bundle.unload()
+
+    # changing a source file makes the bundle stale
+    changed = weather_copy / "numbers" / "5.png"
+    stat = os.stat(changed)
+    os.utime(changed, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert not asset_bundle.load(path)
+    # loose files are used instead
+    assert asset_bundle.weather_image("numbers/5.png").tobytes() == \
+        asset_bundle.load_weather_image("numbers/5.png").tobytes()
+
+    # a file which is not a bundle is ignored
+    with open(path, 'wb') as f:
+        f.write(b'not a bundle at all')
+    assert not asset_bundle.load(path)
+
+
+def test_bundle_unmapped(tmp_path, monkeypatch):
+    maps = []
+
+    class RecordingMap(mmap.mmap):
+        def __init__(self, *args, **kwargs):
+            super().__init__()
+            maps.append(self)
+
+    monkeypatch.setattr(mmap, 'mmap', RecordingMap)
+
+    # unloading the bundle unmaps it
+    path = str(tmp_path / "assets.bundle")
+    asset_bundle.build([], path=path)
+    assert asset_bundle.load(path)
+    asset_bundle.unload()
+    assert len(maps) == 1 and maps[0].closed
+
+    # so does failing to read the index
+    index = b'{"weather": '
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<8sI', b'FLIPSGN\x01', len(index)) + index)
+    assert not asset_bundle.load(path)
+    assert len(maps) == 2 and maps[1].closed
+
+
+def test_bundle_glyphs(tmp_path):
+    path = str(tmp_path / "assets.bundle")
+    asset_bundle.build(default_wrap_parameters, path=path)
+    assert asset_bundle.load(path)
+
+    for font_path, font_size in {(params.font_path, params.font_size) for params in default_wrap_parameters}:
+        font = ImageFont.truetype(font_path, size=font_size, layout_engine=ImageFont.LAYOUT_BASIC)
+        glyph_atlas._atlases.pop((font.path, font.size, font.index, font.layout_engine), None)
+
+        bundled = glyph_atlas.get_atlas(font)
+        rasterized = glyph_atlas.GlyphAtlas(font)
+        rasterized.preload()
+
+        assert bundled.glyphs == rasterized.glyphs
+        assert bundled.ascender == rasterized.ascender
+        assert bundled.line_height == rasterized.line_height
+        glyph_atlas._atlases.pop((font.path, font.size, font.index, font.layout_engine))
@@ -0,0 +1,217 @@
+import flip_sign.calendar_sync as calendar_sync
+import flip_sign.message_generation as msg_gen
+from flip_sign.calendar_sync import CalendarEventStore
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from unittest.mock import patch
+import datetime
+import threading
+import httplib2
+import json
+import pytest
+
+calendar_id = "test@group.calendar.google.com"
+today = datetime.date.today()
+
+
+def all_day_event(event_id, summary, start_date, days=1, color_id='11'):
+    return {'id': event_id, 'summary': summary, 'colorId': color_id, 'start': {'date': start_date.isoformat()},
+            'end': {'date': (start_date + datetime.timedelta(days=days)).isoformat()}}
+
+
+def timed_event(event_id, summary, start, hours=2, color_id='11'):
+    return {'id': event_id, 'summary': summary, 'colorId': color_id, 'start': {'dateTime': start.isoformat()},
+            'end': {'dateTime': (start + datetime.timedelta(hours=hours)).isoformat()}}
+
+
+class CalendarAPIHandler(BaseHTTPRequestHandler):
+    """
+    A stand-in for the google calendar events.list API, with paging and sync tokens.
+    """
+    page_size = 2
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        split_url = urlsplit(self.path)
+        query = {name: values[0] for name, values in parse_qs(split_url.query).items()}
+        calendar = self.server.calendar
+        with calendar.lock:
+            calendar.requests.append(query)
+            if split_url.path != "/calendar/v3/calendars/" + calendar_id.replace("@", "%40") + "/events":
+                self.send_json(404, {'error': {'code': 404, 'message': 'Not Found'}})
+                return
+
+            if 'syncToken' in query:
+                since = int(query['syncToken'].split('-')[1])
+                if since < calendar.oldest_valid_token:
+                    self.send_json(410, {'error': {'code': 410, 'message': 'Sync token is no longer valid.'}})
+                    return
+                items = [event for version, event in calendar.changes if version > since]
+            else:
+                items = [event for event in calendar.events.values() if event.get('status') != 'cancelled']
+
+            offset = int(query.get('pageToken', 0))
+            body = {'items': items[offset:offset + self.page_size]}
+            if offset + self.page_size < len(items):
+                body['nextPageToken'] = str(offset + self.page_size)
+            else:
+                body['nextSyncToken'] = "sync-" + str(calendar.version)
+            self.send_json(200, body)
+
+
+class StandInCalendar(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = {}
+        self.changes = []
+        self.version = 0
+        self.oldest_valid_token = 0
+        self.requests = []
+
+    def put(self, event):
+        with self.lock:
+            self.version += 1
+            self.events[event['id']] = event
+            self.changes.append((self.version, event))
+
+    def cancel(self, event_id):
+        self.put({'id': event_id, 'status': 'cancelled'})
+
+
+@pytest.fixture
+def calendar():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), CalendarAPIHandler)
+    httpd.calendar = StandInCalendar()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.calendar.service = build_from_document(
+        get_static_doc('calendar', 'v3'), http=httplib2.Http(),
+        client_options={'api_endpoint': "http://127.0.0.1:" + str(httpd.server_address[1]) + "/calendar/v3/"})
+    yield httpd.calendar
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CalendarEventStore(path=str(tmp_path / "calendar_events.sqlite3"))
+
+
+def stored_ids(store):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return [event['id'] for event in store.events(calendar_id, end_after=now,
+                                                  start_before=now + datetime.timedelta(days=270))]
+
+
+def add_events(calendar):
+    now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+    calendar.put(all_day_event("trip", "Paris Trip", today + datetime.timedelta(days=10), days=3))
+    calendar.put(timed_event("party", "Birthday Party", now + datetime.timedelta(days=2)))
+    calendar.put(all_day_event("dentist", "Dentist", today + datetime.timedelta(days=5), color_id='2'))
+    calendar.put(all_day_event("past", "Last Month", today - datetime.timedelta(days=30)))
+    calendar.put(all_day_event("far", "Next Year", today + datetime.timedelta(days=400)))
+
+
+def test_full_then_incremental_sync(calendar, store):
+    add_events(calendar)
+
+    assert calendar_sync.sync(calendar.service, calendar_id, store=store) == 5
+    # fetched page by page, every event expanded
+    assert len(calendar.requests) == 3
+    assert all(request['singleEvents'] == 'true' for request in calendar.requests)
+    assert stored_ids(store) == ["party", "dentist", "trip"]
+
+    # nothing changed - one request, nothing received
+    calendar.requests.clear()
+    assert calendar_sync.sync(calendar.service, calendar_id, store=store) == 0
+    assert [request['syncToken'] for request in calendar.requests] == ["sync-5"]
+
+    # only the changes are fetched
+    calendar.put(all_day_event("trip", "Paris Trip (Moved)", today + datetime.timedelta(days=1)))
+    calendar.cancel("party")
+    calendar.put(all_day_event("visit", "Friends Visit", today + datetime.timedelta(days=20), days=6))
+    calendar.requests.clear()
+    assert calendar_sync.sync(calendar.service, calendar_id, store=store) == 3
+    assert all(request['syncToken'] == "sync-5" for request in calendar.requests)
+    assert stored_ids(store) == ["trip", "dentist", "visit"]
+    now = datetime.datetime.now(datetime.timezone.utc)
+    assert store.events(calendar_id, end_after=now, start_before=now + datetime.timedelta(days=2))[0]['summary'] == \
+        "Paris Trip (Moved)"
+
+    # the store survives a restart
+    restarted_store = CalendarEventStore(path=store.path)
+    assert restarted_store.sync_token(calendar_id) == "sync-8"
+    assert stored_ids(restarted_store) == ["trip", "dentist", "visit"]
+
+
+def test_expired_sync_token(calendar, store):
+    add_events(calendar)
+    calendar_sync.sync(calendar.service, calendar_id, store=store)
+
+    # the server forgets the changes - the old token is rejected and the calendar is synced in full
+    calendar.cancel("dentist")
+    calendar.put(all_day_event("visit", "Friends Visit", today + datetime.timedelta(days=20)))
+    calendar.oldest_valid_token = calendar.version
+    calendar.requests.clear()
+
+    assert calendar_sync.sync(calendar.service, calendar_id, store=store) == 5
+    assert calendar.requests[0]['syncToken'] == "sync-5"
+    assert 'syncToken' not in calendar.requests[1]
+    assert stored_ids(store) == ["party", "trip", "visit"]
+    assert store.sync_token(calendar_id) == "sync-7"
+
+
+def test_ended_events_dropped(calendar, store):
+    add_events(calendar)
+    calendar_sync.sync(calendar.service, calendar_id, store=store)
+
+    def all_stored_ids():
+        with store._lock:
+            rows = store._connect().execute("SELECT event_id FROM events WHERE calendar_id = ? ORDER BY event_id",
+                                            (calendar_id,)).fetchall()
+        return [event_id for event_id, in rows]
+
+    # the full sync receives the past event, but does not keep it
+    assert all_stored_ids() == ["dentist", "far", "party", "trip"]
+
+    # an event which has ended since it was stored is dropped at the next sync
+    now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+    calendar.put(timed_event("party", "Birthday Party", now - datetime.timedelta(hours=3)))
+    calendar.put(timed_event("meeting", "Meeting", now - datetime.timedelta(days=1)))
+    assert calendar_sync.sync(calendar.service, calendar_id, store=store) == 2
+    assert all_stored_ids() == ["dentist", "far", "trip"]
+
+
+def test_sync_errors_passed_on(calendar, store):
+    with pytest.raises(HttpError):
+        calendar_sync.sync(calendar.service, "not-a-calendar", store=store)
+    assert store.sync_token("not-a-calendar") is None
+
+
+def test_calendar_factory_incremental(calendar, store):
+    add_events(calendar)
+
+    with patch('flip_sign.message_generation.google_services.service') as service_mock:
+        with patch.object(calendar_sync, 'default_store', store):
+            service_mock.return_value = calendar.service
+            messages = msg_gen.GoogleCalendarMessageFactory(calendar_id).generate_messages()
+            assert [message.description for message in messages] == ["Birthday Party", "Paris Trip"]
+
+            calendar.put(all_day_event("visit", "Friends Visit", today + datetime.timedelta(days=20)))
+            calendar.requests.clear()
+            messages = msg_gen.GoogleCalendarMessageFactory(calendar_id).generate_messages()
+            assert [message.description for message in messages] == ["Birthday Party", "Paris Trip", "Friends Visit"]
+            assert len(calendar.requests) == 1
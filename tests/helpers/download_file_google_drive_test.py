@@ -2,10 +2,11 @@ from flip_sign.helpers import download_file_google_drive
 from unittest.mock import patch, MagicMock
 from pathlib import Path
 from googleapiclient.http import MediaDownloadProgress
+import pytest
 
 
 def test_download_file():
-    with patch('flip_sign.helpers.MediaIoBaseDownload') as download_mock:
+    with patch('flip_sign.helpers.MediaIoBaseDownload') as download_mock, patch('flip_sign.helpers.os') as os_mock:
         with patch('flip_sign.helpers.io') as io_mock:
             test_progress = MediaDownloadProgress(5, 10)
             build_mock = MagicMock()
@@ -13,21 +14,24 @@ def test_download_file():
 
             # mock so download finishes in 1 chunk
             download_mock.return_value.next_chunk.return_value = (test_progress, True)
-            io_mock.FileIO.return_value = "dummy file handler"
+            file_handler = MagicMock()
+            io_mock.FileIO.return_value = file_handler
 
             download_file_google_drive(file_id="yyz", out_path="/blurgh/test.png", drive_service=build_mock)
 
-            # confirm proper filename used in download
-            io_mock.FileIO.assert_called_with("/blurgh/test.png", mode='wb')
+            # confirm proper filename used in download - written alongside, then moved into place
+            io_mock.FileIO.assert_called_with("/blurgh/test.png.part", mode='wb')
+            file_handler.close.assert_called_once()
+            os_mock.replace.assert_called_once_with("/blurgh/test.png.part", "/blurgh/test.png")
 
             build_mock.files.return_value.get_media.assert_called_once_with(fileId="yyz")
 
             # confirm request object properly passed in
-            download_mock.assert_called_once_with(fd="dummy file handler", request='dummy request object')
+            download_mock.assert_called_once_with(fd=file_handler, request='dummy request object')
 
 
 def test_download_file_path():
-    with patch('flip_sign.helpers.MediaIoBaseDownload') as download_mock:
+    with patch('flip_sign.helpers.MediaIoBaseDownload') as download_mock, patch('flip_sign.helpers.os') as os_mock:
         with patch('flip_sign.helpers.io') as io_mock:
             test_progress = MediaDownloadProgress(5, 10)
             build_mock = MagicMock()
@@ -35,14 +39,35 @@ def test_download_file_path():
 
             # mock so download finishes in 1 chunk
             download_mock.return_value.next_chunk.return_value = (test_progress, True)
-            io_mock.FileIO.return_value = "dummy file handler"
+            file_handler = MagicMock()
+            io_mock.FileIO.return_value = file_handler
 
             download_file_google_drive(file_id="yyz", out_path=Path("/blurgh/test.png"), drive_service=build_mock)
 
-            # confirm proper filename used in download
-            io_mock.FileIO.assert_called_with("/blurgh/test.png", mode='wb')
+            # confirm proper filename used in download - written alongside, then moved into place
+            io_mock.FileIO.assert_called_with("/blurgh/test.png.part", mode='wb')
+            file_handler.close.assert_called_once()
+            os_mock.replace.assert_called_once_with("/blurgh/test.png.part", "/blurgh/test.png")
 
             build_mock.files.return_value.get_media.assert_called_once_with(fileId="yyz")
 
             # confirm request object properly passed in
-            download_mock.assert_called_once_with(fd="dummy file handler", request='dummy request object')
+            download_mock.assert_called_once_with(fd=file_handler, request='dummy request object')
+
+
+def test_failed_download_keeps_existing_file(tmp_path):
+    out_path = tmp_path / "test.png"
+    out_path.write_bytes(b"good image")
+
+    def next_chunk():
+        # write part of the file, then fail
+        download_mock.call_args.kwargs['fd'].write(b"partial")
+        raise ConnectionResetError("connection lost")
+
+    with patch('flip_sign.helpers.MediaIoBaseDownload') as download_mock:
+        download_mock.return_value.next_chunk.side_effect = next_chunk
+        with pytest.raises(ConnectionResetError):
+            download_file_google_drive(file_id="yyz", out_path=out_path, drive_service=MagicMock())
+
+    assert out_path.read_bytes() == b"good image"
+    assert list(tmp_path.iterdir()) == [out_path]
@@ -1,6 +1,7 @@
 import flip_sign.helpers as hlp
-from PIL import Image
+from PIL import Image, ImageFont
 import hashlib
+import math
 import pytest
 
 press_start_path = r'../flip_sign/assets/fonts/PressStart2P.ttf'
@@ -258,3 +259,100 @@ def test_text_list_wrap_text_true():
         _ = hlp.draw_text_best_parameters(params_order=default_wrap_parameters, bbox_size=full_sign_size, text=text,
                                           vertical_align='center', horizontal_align='center', text_align='center',
                                           fixed_spacing=None, wrap_text=True)
+
+
+def brute_force_layout(params_order, bbox_size, text, text_align):
+    """
+    Lays out wrapped text as draw_text_best_parameters does, but searches for the expanded line spacing one pixel at a
+    time from zero rather than starting from the closed-form answer.
+
+    :return: image, params, spacing, as draw_text_best_parameters (with centered alignment)
+    """
+    for params in params_order:
+        bbox_func = hlp.bbox_text_truncation if params.truncate else hlp.bbox_text_no_truncation
+        font = ImageFont.truetype(params.font_path, size=params.font_size, layout_engine=ImageFont.LAYOUT_BASIC)
+        fits, wrapped = bbox_func(bbox_size=bbox_size, line_spacing=params.min_spacing, text=text,
+                                  split_words=params.split_words, font=font, align=text_align, **params.wrap_kwargs)
+        if fits:
+            break
+    assert fits
+    if isinstance(wrapped, list):
+        wrapped = "\n".join(wrapped)
+
+    spacing = params.min_spacing
+    min_size, min_target = hlp.text_bbox_size(font=font, text=wrapped, line_spacing=spacing, align=text_align)
+    text_size, draw_target = min_size, min_target
+    num_gaps = wrapped.count("\n")
+    extra_lines = bbox_size[1] - min_size[1]
+    if num_gaps > 0 and extra_lines / (num_gaps + 2) >= 1:
+        new_whitespace_within = math.ceil(extra_lines / (num_gaps + 2) * num_gaps)
+        for i in range(extra_lines):
+            size, target = hlp.text_bbox_size(font=font, text=wrapped, line_spacing=params.min_spacing + i,
+                                              align=text_align)
+            if size[1] - min_size[1] >= new_whitespace_within:
+                if size[1] <= bbox_size[1]:
+                    spacing, text_size, draw_target = params.min_spacing + i, size, target
+                break
+
+    xy = (draw_target[0] + (bbox_size[0] - text_size[0]) // 2, draw_target[1] + (bbox_size[1] - text_size[1]) // 2)
+    image = hlp.draw_multiline_text(size=bbox_size, xy=xy, text=wrapped, font=font, spacing=spacing, align=text_align)
+    return image, params, spacing
+
+
+dat_dot_wrap_parameters = (hlp.wrap_parameter_set(dat_dot_path, 8, -2, False, False, {}),
+                           hlp.wrap_parameter_set(dat_dot_path, 8, -2, True, True, {}))
+
+
+@pytest.mark.parametrize("text, bbox_size, params_order, text_align", [
+    ("Boulder", (58, 21), default_wrap_parameters, 'left'),
+    ("Rio de Janeiro", (58, 21), default_wrap_parameters, 'center'),
+    ("You wrote a note with chalk on my door", (168, 21), default_wrap_parameters, 'center'),
+    ("a message I'd known long before", (168, 42), default_wrap_parameters, 'left'),
+    ("I call it a bargain, the best I ever had", (84, 42), default_wrap_parameters, 'right'),
+    ("Friends Visit", (58, 21), dat_dot_wrap_parameters, 'center'),
+    ("Retorno às Aulas em cinco dias", (84, 42), dat_dot_wrap_parameters, 'center'),
+])
+def test_line_spacing_matches_brute_force(text, bbox_size, params_order, text_align):
+    image, params, spacing = hlp.draw_text_best_parameters(params_order=params_order, bbox_size=bbox_size, text=text,
+                                                           text_align=text_align)
+    expected_image, expected_params, expected_spacing = brute_force_layout(params_order, bbox_size, text, text_align)
+
+    assert params == expected_params
+    assert spacing == expected_spacing
+    assert image_equal(image, expected_image)
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_draw_text_best_parameters_batch(processes):
+    full_sign_size = (168, 21)
+    jobs = [("You wrote a note with chalk on my door", default_wrap_parameters, full_sign_size, {}),
+            (['Retorno às    5d ', 'Aulas Day     16h'], default_wrap_parameters, full_sign_size,
+             {'fixed_spacing': 1, 'wrap_text': False}),
+            ("a message I'd known long before", default_wrap_parameters, full_sign_size, {'text_align': 'left'}),
+            # invalid job - a list with wrap_text=True - returns None instead of raising
+            (["I call it a bargain:", "the best I ever had"], default_wrap_parameters, full_sign_size, {})]
+
+    results = hlp.draw_text_best_parameters_batch(jobs, processes=processes)
+
+    assert len(results) == len(jobs)
+    assert results[-1] is None
+    for (text, params_order, bbox_size, options), result in zip(jobs[:-1], results[:-1]):
+        image, params, spacing = hlp.draw_text_best_parameters(params_order=params_order, bbox_size=bbox_size,
+                                                               text=text, **options)
+        # the same pixel values as the serial path, not only the same packed bytes
+        assert list(image.getdata()) == list(hlp.unpack_text_layout(result).getdata())
+        assert result.params == params
+        assert result.spacing == spacing
+
+
+def test_draw_text_best_parameters_batch_reuses_pool():
+    jobs = [("You wrote a note with chalk on my door", default_wrap_parameters, (168, 21), {}),
+            ("a message I'd known long before", default_wrap_parameters, (168, 21), {})]
+
+    first = hlp.draw_text_best_parameters_batch(jobs, processes=2)
+    executor = hlp._layout_executor
+    second = hlp.draw_text_best_parameters_batch(jobs, processes=2)
+
+    assert executor is not None
+    assert hlp._layout_executor is executor
+    assert [result.data for result in first] == [result.data for result in second]
@@ -0,0 +1,324 @@
+import flip_sign.drive_sync as drive_sync
+import flip_sign.message_generation as msg_gen
+from flip_sign.drive_sync import DriveManifest, DriveListingStore
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from hashlib import sha256
+from unittest.mock import patch
+import threading
+import httplib2
+import json
+import time
+import os
+import pytest
+
+folder_id = "drawings-folder"
+folder_query = "'" + folder_id + "' in parents"
+
+
+def drive_file(file_id, name, content):
+    return {'id': file_id, 'name': name, 'sha256Checksum': sha256(content).hexdigest(), 'trashed': False}
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    return DriveManifest(path=str(tmp_path / "manifest.json"))
+
+
+def test_unchanged_files_not_hashed(tmp_path, manifest):
+    image_path = tmp_path / "drawing.png"
+    image_path.write_bytes(b"drawing")
+    file = drive_file("id1", "drawing.png", b"drawing")
+
+    with patch('flip_sign.drive_sync.hlp.sha256_with_default', wraps=drive_sync.hlp.sha256_with_default) as hash_mock:
+        # not yet in the manifest - hashed once, then recorded
+        assert drive_sync.is_current(file, image_path, manifest)
+        assert hash_mock.call_count == 1
+        manifest.save()
+
+        # recorded (including after a restart) - not hashed
+        assert drive_sync.is_current(file, image_path, manifest)
+        assert drive_sync.is_current(file, image_path, DriveManifest(path=manifest.path))
+        assert hash_mock.call_count == 1
+
+        # new version on drive
+        assert not drive_sync.is_current(drive_file("id1", "drawing.png", b"new drawing"), image_path, manifest)
+
+        # local copy modified - hashed again
+        image_path.write_bytes(b"scribbled")
+        stat = os.stat(image_path)
+        os.utime(image_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        assert not drive_sync.is_current(file, image_path, manifest)
+
+        # local copy missing
+        image_path.unlink()
+        assert not drive_sync.is_current(file, image_path, manifest)
+
+
+def test_concurrent_downloads(tmp_path, manifest):
+    contents = {"id" + str(i): ("drawing " + str(i)).encode() for i in range(6)}
+    files = [drive_file(file_id, file_id + ".png", content) for file_id, content in contents.items()]
+    active = []
+    most_active = []
+    lock = threading.Lock()
+
+    def download(file_id, out_path, drive_service):
+        with lock:
+            active.append(file_id)
+            most_active.append(len(active))
+        time.sleep(0.1)
+        out_path.write_bytes(contents[file_id])
+        with lock:
+            active.remove(file_id)
+
+    with patch('flip_sign.drive_sync.hlp.download_file_google_drive', side_effect=download), \
+            patch('flip_sign.drive_sync.google_services.service'):
+        drive_sync.download_files([(file, tmp_path / file['name']) for file in files], manifest=manifest,
+                                  max_workers=3)
+
+    assert max(most_active) == 3
+    for file in files:
+        assert (tmp_path / file['name']).read_bytes() == contents[file['id']]
+        assert manifest.get(file['name'])['sha256'] == file['sha256Checksum']
+
+    # recorded, so no hashing needed to confirm they are current
+    with patch('flip_sign.drive_sync.hlp.sha256_with_default') as hash_mock:
+        assert all(drive_sync.is_current(file, tmp_path / file['name'], DriveManifest(path=manifest.path))
+                   for file in files)
+        hash_mock.assert_not_called()
+
+
+def test_download_threads_reused(tmp_path, manifest):
+    threads = set()
+
+    def download(file_id, out_path, drive_service):
+        threads.add(threading.current_thread())
+        out_path.write_bytes(b"drawing")
+
+    # a second sync runs on the same threads, so the drive service each thread built is used again
+    with patch('flip_sign.drive_sync.hlp.download_file_google_drive', side_effect=download), \
+            patch('flip_sign.drive_sync.google_services.service'):
+        for sync in range(2):
+            files = [drive_file("id" + str(sync) + str(i), str(sync) + str(i) + ".png", b"drawing") for i in range(4)]
+            drive_sync.download_files([(file, tmp_path / file['name']) for file in files], manifest=manifest,
+                                      max_workers=2)
+
+    assert len(threads) <= 2
+
+
+def test_failed_download(tmp_path, manifest):
+    files = [drive_file("good", "good.png", b"good"), drive_file("bad", "bad.png", b"bad")]
+
+    def download(file_id, out_path, drive_service):
+        if file_id == "bad":
+            raise ConnectionResetError("connection lost")
+        out_path.write_bytes(b"good")
+
+    with patch('flip_sign.drive_sync.hlp.download_file_google_drive', side_effect=download), \
+            patch('flip_sign.drive_sync.google_services.service'):
+        with pytest.raises(ConnectionResetError):
+            drive_sync.download_files([(file, tmp_path / file['name']) for file in files], manifest=manifest)
+
+    # the successful download is kept and recorded
+    assert manifest.get("good.png") is not None
+    assert manifest.get("bad.png") is None
+    assert DriveManifest(path=manifest.path).get("good.png") is not None
+
+
+class DriveAPIHandler(BaseHTTPRequestHandler):
+    """
+    A stand-in for the google drive files.list and changes APIs, with paging.
+    """
+    page_size = 2
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_page(self, items, offset, name, final):
+        body = {name: items[offset:offset + self.page_size]}
+        if offset + self.page_size < len(items):
+            body['nextPageToken'] = str(offset + self.page_size)
+        else:
+            body.update(final)
+        self.send_json(200, body)
+
+    def do_GET(self):
+        split_url = urlsplit(self.path)
+        query = {name: values[0] for name, values in parse_qs(split_url.query).items()}
+        drive = self.server.drive
+        with drive.lock:
+            drive.requests.append((split_url.path, query))
+            if split_url.path == "/drive/v3/changes/startPageToken":
+                self.send_json(200, {'startPageToken': str(drive.version)})
+            elif split_url.path == "/drive/v3/changes":
+                # page tokens are "<version>" to start from, "<version>:<offset>" within a page sequence
+                since, _, offset = query['pageToken'].partition(":")
+                if int(since) < drive.oldest_valid_token:
+                    self.send_json(404, {'error': {'code': 404, 'message': 'Invalid page token.'}})
+                    return
+                changes = [change for version, change in drive.changes if version > int(since)]
+                body = {'changes': changes[int(offset or 0):int(offset or 0) + self.page_size]}
+                if int(offset or 0) + self.page_size < len(changes):
+                    body['nextPageToken'] = since + ":" + str(int(offset or 0) + self.page_size)
+                else:
+                    body['newStartPageToken'] = str(drive.version)
+                self.send_json(200, body)
+            elif split_url.path == "/drive/v3/files" and query['q'].startswith(folder_query):
+                files = [{key: value for key, value in file.items() if key != 'parents'}
+                         for file in drive.files.values() if folder_id in file['parents']]
+                self.send_page(files, int(query.get('pageToken', 0)), 'files', {})
+            else:
+                self.send_json(404, {'error': {'code': 404, 'message': 'Not Found'}})
+
+
+class StandInDrive(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files = {}
+        self.contents = {}
+        self.changes = []
+        self.version = 1
+        self.oldest_valid_token = 0
+        self.requests = []
+
+    def put(self, file_id, name, content, parents=(folder_id,), trashed=False):
+        with self.lock:
+            self.version += 1
+            file = dict(drive_file(file_id, name, content), trashed=trashed, parents=list(parents))
+            self.files[file_id] = file
+            self.contents[file_id] = content
+            self.changes.append((self.version, {'fileId': file_id, 'removed': False, 'file': file}))
+
+    def delete(self, file_id):
+        with self.lock:
+            self.version += 1
+            del self.files[file_id]
+            self.changes.append((self.version, {'fileId': file_id, 'removed': True}))
+
+
+@pytest.fixture
+def drive():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), DriveAPIHandler)
+    httpd.drive = StandInDrive()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.drive.service = build_from_document(
+        get_static_doc('drive', 'v3'), http=httplib2.Http(),
+        client_options={'api_endpoint': "http://127.0.0.1:" + str(httpd.server_address[1]) + "/drive/v3/"})
+    yield httpd.drive
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def listing_store(tmp_path):
+    return DriveListingStore(path=str(tmp_path / "google_drive_listing.json"))
+
+
+def listed_names(drive, listing_store):
+    return sorted(file['name'] for file in drive_sync.list_folder(drive.service, folder_query, store=listing_store))
+
+
+def add_drawings(drive):
+    for i in range(5):
+        drive.put("id" + str(i), "drawing_" + str(i) + ".png", b"drawing " + str(i).encode())
+    drive.put("old", "old.png", b"old", trashed=True)
+    drive.put("elsewhere", "elsewhere.png", b"elsewhere", parents=("other-folder",))
+
+
+def test_changes_feed_listing(drive, listing_store):
+    add_drawings(drive)
+
+    # first seen - listed in full, page by page
+    assert listed_names(drive, listing_store) == ["drawing_" + str(i) + ".png" for i in range(5)]
+    assert [path for path, query in drive.requests] == ["/drive/v3/changes/startPageToken"] + ["/drive/v3/files"] * 3
+
+    # nothing changed - one small request
+    drive.requests.clear()
+    assert listed_names(drive, listing_store) == ["drawing_" + str(i) + ".png" for i in range(5)]
+    assert [path for path, query in drive.requests] == ["/drive/v3/changes"]
+    assert drive.requests[0][1]['pageToken'] == str(drive.version)
+
+    # added, changed, trashed, deleted, moved out, and changes elsewhere on the drive
+    drive.put("new", "new.png", b"new")
+    drive.put("id0", "drawing_0.png", b"drawing 0, coloured in")
+    drive.put("id1", "drawing_1.png", b"drawing 1", trashed=True)
+    drive.delete("id2")
+    drive.put("id3", "drawing_3.png", b"drawing 3", parents=("other-folder",))
+    drive.put("elsewhere", "elsewhere.png", b"elsewhere, changed", parents=("other-folder",))
+    drive.requests.clear()
+    assert listed_names(drive, listing_store) == ["drawing_0.png", "drawing_4.png", "new.png"]
+    assert {path for path, query in drive.requests} == {"/drive/v3/changes"}
+    files = {file['id']: file for file in drive_sync.list_folder(drive.service, folder_query, store=listing_store)}
+    assert files['id0']['sha256Checksum'] == sha256(b"drawing 0, coloured in").hexdigest()
+
+    # the listing survives a restart
+    drive.requests.clear()
+    assert listed_names(drive, DriveListingStore(path=listing_store.path)) == \
+        ["drawing_0.png", "drawing_4.png", "new.png"]
+    assert len(drive.requests) == 1
+
+
+def test_expired_page_token(drive, listing_store):
+    add_drawings(drive)
+    listed_names(drive, listing_store)
+
+    # the server forgets the changes - the old token is rejected and the folder is listed in full
+    drive.delete("id4")
+    drive.oldest_valid_token = drive.version
+    drive.requests.clear()
+
+    assert listed_names(drive, listing_store) == ["drawing_" + str(i) + ".png" for i in range(4)]
+    assert drive.requests[0][0] == "/drive/v3/changes"
+    assert drive.requests[1][0] == "/drive/v3/changes/startPageToken"
+    assert listing_store.get(folder_query)['page_token'] == str(drive.version)
+
+
+def test_other_queries_listed_in_full(drive, listing_store):
+    add_drawings(drive)
+    query = folder_query + " and mimeType = 'image/png'"
+
+    for _ in range(2):
+        assert len(drive_sync.list_folder(drive.service, query, store=listing_store)) == 5
+    assert {path for path, query in drive.requests} == {"/drive/v3/files"}
+    assert listing_store.get(query) is None
+
+
+def test_drive_factory_changes(drive, listing_store, manifest, tmp_path, monkeypatch):
+    add_drawings(drive)
+    downloaded = []
+
+    def download(file_id, out_path, drive_service):
+        downloaded.append(file_id)
+        out_path.write_bytes(drive.contents[file_id])
+
+    monkeypatch.setattr(drive_sync, 'images_dir', str(tmp_path))
+    monkeypatch.setattr(drive_sync, 'default_manifest', manifest)
+    monkeypatch.setattr(drive_sync, 'default_listing_store', listing_store)
+
+    with patch('flip_sign.drive_sync.hlp.download_file_google_drive', side_effect=download), \
+            patch('flip_sign.message_generation.ImageMessage') as image_mock, \
+            patch('flip_sign.drive_sync.google_services.service'), \
+            patch('flip_sign.message_generation.google_services.service', return_value=drive.service):
+        msg_gen.GoogleDriveImageMessageFactory(folder_query).generate_messages()
+        assert sorted(downloaded) == ["id" + str(i) for i in range(5)]
+
+        # only the coloured-in drawing is fetched again, and only the changes are listed
+        drive.put("id0", "drawing_0.png", b"drawing 0, coloured in")
+        downloaded.clear()
+        drive.requests.clear()
+        msg_gen.GoogleDriveImageMessageFactory(folder_query).generate_messages()
+        assert downloaded == ["id0"]
+        assert [path for path, query in drive.requests] == ["/drive/v3/changes"]
+        assert sorted(call.args[0].name for call in image_mock.call_args_list[5:]) == \
+            ["drawing_" + str(i) + ".png" for i in range(5)]
@@ -0,0 +1,84 @@
+import flip_sign.helpers as hlp
+import flip_sign.glyph_atlas as glyph_atlas
+import flip_sign.config as config
+from PIL import Image, ImageDraw, ImageFont
+from tests.helpers.draw_text_test import image_equal, default_wrap_parameters, press_start_path, dat_dot_path
+from unittest.mock import patch
+import pytest
+
+texts = ["A doo-da-ee!!",
+         "I call it a bargain:\nthe best I ever had",
+         "Retorno às    5d \nAulas Day     16h",
+         "all lowercase 8mo\nmess          16d",
+         "'On any given day you'll find me gone'",
+         "O mar ta bonito ta cheio\nde caminho pedala",
+         "Boul\nder"]
+
+fonts = [(press_start_path, 16), (press_start_path, 12), (press_start_path, 9), (press_start_path, 8),
+         (dat_dot_path, 8)]
+
+
+@pytest.mark.parametrize("font_path, font_size", fonts)
+def test_atlas_matches_freetype(font_path, font_size):
+    font = ImageFont.truetype(font_path, size=font_size, layout_engine=ImageFont.LAYOUT_BASIC)
+    atlas = glyph_atlas.get_atlas(font)
+
+    for text in texts:
+        assert atlas.supports(text)
+        for align in ['left', 'center', 'right']:
+            for spacing in [-2, 1, 3]:
+                for xy in [(0, 0), (3, 1), (-2, -3), (10, 10)]:
+                    answer = Image.new('1', (168, 42), 0)
+                    ImageDraw.Draw(answer).multiline_text(xy, text=text, font=font, spacing=spacing, align=align,
+                                                          fill=1, anchor='la')
+                    test = atlas.draw_multiline_text(size=(168, 42), xy=xy, text=text, spacing=spacing, align=align)
+                    assert image_equal(answer, test)
+                    # the same pixel values too, not only the same packed bytes
+                    assert list(answer.getdata()) == list(test.getdata())
+
+                with patch.object(config, 'TEXT_RENDERER', 'freetype'):
+                    answer = hlp.text_bbox_size(font=font, text=text, line_spacing=spacing, align=align)
+                assert atlas.text_bbox_size(text=text, line_spacing=spacing, align=align) == answer
+
+
+def test_draw_text_best_parameters_renderers_match():
+    for text in texts:
+        for wrap_text in [True, False]:
+            kwargs = {'params_order': default_wrap_parameters, 'bbox_size': (168, 21), 'text': text,
+                      'wrap_text': wrap_text}
+            with patch.object(config, 'TEXT_RENDERER', 'freetype'):
+                answer = hlp.draw_text_best_parameters(**kwargs)
+            with patch.object(config, 'TEXT_RENDERER', 'atlas'):
+                test = hlp.draw_text_best_parameters(**kwargs)
+
+            assert image_equal(answer[0], test[0])
+            assert list(answer[0].getdata()) == list(test[0].getdata())
+            assert answer[1:] == test[1:]
+
+
+def test_unsupported_text_falls_back():
+    font = ImageFont.truetype(press_start_path, size=9, layout_engine=ImageFont.LAYOUT_BASIC)
+    atlas = glyph_atlas.get_atlas(font)
+    atlas.glyphs['~'] = atlas.glyph('~')._replace(valid=False)
+
+    assert not atlas.supports("tilde ~")
+
+    answer = Image.new('1', (168, 21), 0)
+    ImageDraw.Draw(answer).multiline_text((2, 2), text="tilde ~", font=font, spacing=1, align='left', fill=1,
+                                          anchor='la')
+    with patch.object(config, 'TEXT_RENDERER', 'atlas'):
+        test = hlp.draw_multiline_text(size=(168, 21), xy=(2, 2), text="tilde ~", font=font, spacing=1,
+                                       align='left')
+    assert image_equal(answer, test)
+
+    del atlas.glyphs['~']
+
+
+def test_rows_to_image_pixel_values():
+    rows = [0b101, 0, 0b1000000001]
+    answer = Image.new('1', (10, 3), 0)
+    ImageDraw.Draw(answer).point([(0, 0), (2, 0), (0, 2), (9, 2)], fill=1)
+
+    test = glyph_atlas.rows_to_image(rows, (10, 3))
+    assert image_equal(answer, test)
+    assert list(answer.getdata()) == list(test.getdata())
@@ -1,6 +1,7 @@
 from flip_sign.assets import root_dir
 from unittest.mock import patch
 import flip_sign.helpers as hlp
+from flip_sign.response_cache import PersistentResponseCache
 import pytest
 
 responses = []
@@ -17,9 +18,17 @@ answers = [{'lat': 48.856614, 'lng': 2.3522219},
 tests = ["Paris, France", "38585", "22241-125", "SE1 2UP", "94327u1fda is not a place"]
 
 
-@patch('flip_sign.helpers.urlopen')
-def test_geocode_to_lat_long(urlopen_mock):
-    urlopen_mock.return_value.read.side_effect = responses
+# use a fresh on-disk cache for each test
+@pytest.fixture(autouse=True)
+def geocoding_cache(tmp_path, monkeypatch):
+    cache = PersistentResponseCache(path=str(tmp_path / "geocoding_cache.sqlite3"))
+    monkeypatch.setattr(hlp, '_google_geocoding_cache', cache)
+    return cache
+
+
+@patch('flip_sign.helpers.http_client.get')
+def test_geocode_to_lat_long(http_get_mock):
+    http_get_mock.side_effect = responses
 
     for test, answer in zip(tests[:-1], answers[:-1]):
         result = hlp.geocode_to_lat_long(test)
@@ -29,12 +38,70 @@ def test_geocode_to_lat_long(urlopen_mock):
         _ = hlp.geocode_to_lat_long(tests[-1])
 
     # confirm results cached
-    urlopen_mock.reset_mock()
-    urlopen_mock.read.side_effect = responses
+    http_get_mock.reset_mock()
+    http_get_mock.side_effect = responses
     for test, answer in zip(tests[:-1], answers[:-1]):
         result = hlp.geocode_to_lat_long(test)
         assert result == answer
 
-    urlopen_mock.assert_not_called()
+    http_get_mock.assert_not_called()
+
+
+
+
+@patch('flip_sign.helpers.http_client.get')
+def test_geocode_persistent(http_get_mock, geocoding_cache, tmp_path, monkeypatch):
+    http_get_mock.side_effect = responses
+    assert hlp.geocode_to_lat_long(tests[0]) == answers[0]
+
+    # a new cache on the same file (e.g. after a restart) does not repeat the request
+    monkeypatch.setattr(hlp, '_google_geocoding_cache',
+                        PersistentResponseCache(path=str(tmp_path / "geocoding_cache.sqlite3")))
+    http_get_mock.reset_mock()
+    assert hlp.geocode_to_lat_long(tests[0]) == answers[0]
+    # locations differing only in whitespace and case share the cached result
+    assert hlp.geocode_to_lat_long("  paris,   FRANCE ") == answers[0]
+    http_get_mock.assert_not_called()
+
+
+@patch('flip_sign.helpers.http_client.get')
+def test_geocode_not_found_cached(http_get_mock):
+    http_get_mock.return_value = responses[-1]
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            hlp.geocode_to_lat_long(tests[-1])
+
+    http_get_mock.assert_called_once()
+
+
+@patch('flip_sign.helpers.http_client.get')
+def test_geocode_many(http_get_mock):
+    by_location = dict(zip(tests, responses))
+
+    def get(url):
+        for location, response in by_location.items():
+            if url.startswith('https://maps.googleapis.com/maps/api/geocode/json?address=' + hlp.quote(location) + '&'):
+                return response
+        raise AssertionError("Unexpected URL: " + url)
+
+    http_get_mock.side_effect = get
+
+    # 100 events at the same few locations, written inconsistently
+    locations = [["Paris, France", "paris, france ", "38585", "SE1  2UP", "94327u1fda is not a place"][i % 5]
+                 for i in range(100)]
+    results = hlp.geocode_many(locations)
 
+    assert results["Paris, France"] == answers[0]
+    assert results["paris, france "] == answers[0]
+    assert results["38585"] == answers[1]
+    assert results["SE1  2UP"] == answers[3]
+    assert results["94327u1fda is not a place"] is None
+    # one request per unique location
+    assert http_get_mock.call_count == 4
 
+    # everything is cached now
+    http_get_mock.reset_mock()
+    assert hlp.geocode_many(locations) == results
+    assert hlp.geocode_many([]) == {}
+    http_get_mock.assert_not_called()
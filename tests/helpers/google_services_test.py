@@ -0,0 +1,111 @@
+from flip_sign.google_services import GoogleServiceProvider
+import flip_sign.message_generation as msg_gen
+from flip_sign.assets import keys
+from google.oauth2.credentials import Credentials
+from googleapiclient.errors import UnknownApiNameOrVersion
+from unittest.mock import MagicMock
+import datetime
+import threading
+import time
+import pytest
+
+
+def test_services_shared():
+    get_credentials = MagicMock(return_value=Credentials(token='test-token'))
+    provider = GoogleServiceProvider(get_credentials=get_credentials)
+
+    calendar_service = provider.service('calendar', 'v3')
+    assert provider.service('calendar', 'v3') is calendar_service
+    sheets_service = provider.service('sheets', 'v4')
+    assert sheets_service is not calendar_service
+    assert provider.service('sheets', 'v4') is sheets_service
+
+    # built from the static discovery documents - no requests made
+    request = calendar_service.events().list(calendarId='primary')
+    assert request.uri.startswith('https://www.googleapis.com/calendar/v3/calendars/primary/events')
+
+    # other threads get their own service objects, but share the credentials
+    thread_services = []
+    threads = [threading.Thread(target=lambda: thread_services.append(provider.service('calendar', 'v3')))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(thread_service) for thread_service in thread_services + [calendar_service]}) == 5
+    assert all(thread_service._http.credentials is provider.credentials() for thread_service in thread_services)
+    assert provider.services_built == 6
+    get_credentials.assert_called_once()
+
+
+def test_expired_credentials_refreshed(tmp_path, monkeypatch):
+    token_path = tmp_path / "token.json"
+    monkeypatch.setitem(keys, 'GOOGLE_TOKEN_PATH', str(token_path))
+
+    credentials = Credentials(token='old-token', refresh_token='refresh-token',
+                              expiry=datetime.datetime.utcnow() + datetime.timedelta(hours=1))
+    get_credentials = MagicMock(return_value=credentials)
+    provider = GoogleServiceProvider(get_credentials=get_credentials)
+    service = provider.service('drive', 'v3')
+
+    def refresh(request):
+        credentials.token = 'new-token'
+        credentials.expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+    credentials.expiry = datetime.datetime.utcnow() - datetime.timedelta(minutes=1)
+    monkeypatch.setattr(credentials, 'refresh', MagicMock(side_effect=refresh))
+
+    # refreshed in place - the credentials are not reloaded and the service is not rebuilt
+    assert provider.service('drive', 'v3') is service
+    credentials.refresh.assert_called_once()
+    assert 'new-token' in token_path.read_text()
+    get_credentials.assert_called_once()
+
+
+def test_invalid_credentials_reloaded():
+    first_credentials = Credentials(token=None)  # no token, cannot be refreshed
+    get_credentials = MagicMock(side_effect=[first_credentials, Credentials(token='test-token')])
+    provider = GoogleServiceProvider(get_credentials=get_credentials)
+
+    service = provider.service('drive', 'v3')
+    assert service._http.credentials is first_credentials
+
+    # the replacement credentials are used to build a new service
+    new_service = provider.service('drive', 'v3')
+    assert new_service is not service
+    assert new_service._http.credentials.token == 'test-token'
+    assert get_credentials.call_count == 2
+
+
+def test_unknown_api():
+    provider = GoogleServiceProvider(get_credentials=MagicMock(return_value=Credentials(token='test-token')))
+    with pytest.raises(UnknownApiNameOrVersion):
+        provider.service('not-an-api', 'v0')
+
+
+class ServiceFactory(msg_gen.MessageFactory):
+    """
+    A stand-in factory which uses a calendar service, as the google factories do, and generates nothing.
+    """
+    def __init__(self, provider):
+        super().__init__()
+        self.logging_str = "ServiceFactory"
+        self.provider = provider
+
+    def generate_messages(self):
+        self.provider.service('calendar', 'v3')
+        time.sleep(0.05)
+        return []
+
+
+def test_services_reused_across_generations():
+    provider = GoogleServiceProvider(get_credentials=MagicMock(return_value=Credentials(token='test-token')))
+
+    # factories run on long-lived threads, so later generations use the services built in the first
+    list(msg_gen.stream_message_generate([ServiceFactory(provider) for _ in range(4)], max_workers=2))
+    services_built = provider.services_built
+    assert 1 <= services_built <= msg_gen._factory_workers.threads_started
+    for _ in range(3):
+        list(msg_gen.stream_message_generate([ServiceFactory(provider) for _ in range(4)], max_workers=2))
+    assert provider.services_built == services_built
@@ -0,0 +1,143 @@
+from flip_sign.http_client import HTTPClient
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError, URLError
+import threading
+import gzip
+import json
+import time
+import pytest
+
+test_body = json.dumps({'Key': '335689', 'LocalizedName': 'Nameless'}).encode('utf-8')
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    A stand-in for the weather and geocoding APIs.  Speaks HTTP/1.1 so connections are kept alive.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.client_address[1]))
+        if self.path.startswith('/json'):
+            if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                self.send_body(200, gzip.compress(test_body), [('Content-Encoding', 'gzip')])
+            else:
+                self.send_body(200, test_body)
+        elif self.path.startswith('/moved'):
+            # a relative redirect, to the same host
+            self.send_body(int(self.path.split('/')[2]), b'Moved', [('Location', '/json?q=moved')])
+        elif self.path == '/loop':
+            self.send_body(302, b'', [('Location', '/loop')])
+        elif self.path == '/not-modified':
+            self.send_response(304)
+            self.end_headers()
+        elif self.path == '/missing':
+            self.send_body(404, b'{"Code": "ResourceNotFound"}')
+        elif self.path == '/slow':
+            time.sleep(1)
+            self.send_body(200, test_body)
+        elif self.path == '/drop':
+            # respond as if keeping the connection alive, then close it - as a server does with idle connections
+            self.send_body(200, test_body)
+            self.close_connection = True
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def base_url(server):
+    return "http://127.0.0.1:" + str(server.server_address[1])
+
+
+def test_keep_alive_and_gzip(server):
+    client = HTTPClient()
+    for i in range(3):
+        assert json.loads(client.get(base_url(server) + "/json?q=" + str(i))) == json.loads(test_body)
+
+    # one connection (same client port) served every request
+    assert client.connections_opened == 1
+    assert len({port for _, port in server.requests}) == 1
+    assert [path for path, _ in server.requests] == ["/json?q=0", "/json?q=1", "/json?q=2"]
+    client.close()
+
+
+def test_http_error(server):
+    client = HTTPClient()
+    with pytest.raises(HTTPError) as error:
+        client.get(base_url(server) + "/missing")
+    assert error.value.code == 404
+    assert json.loads(error.value.read()) == {"Code": "ResourceNotFound"}
+
+    # the connection is still usable after an error response
+    client.get(base_url(server) + "/json")
+    assert client.connections_opened == 1
+    client.close()
+
+
+@pytest.mark.parametrize("status", [301, 302, 303, 307, 308])
+def test_redirect_followed(server, status):
+    client = HTTPClient()
+    assert json.loads(client.get(base_url(server) + "/moved/" + str(status))) == json.loads(test_body)
+    assert [path for path, _ in server.requests] == ["/moved/" + str(status), "/json?q=moved"]
+    client.close()
+
+
+def test_redirect_loop_and_other_statuses(server):
+    client = HTTPClient()
+    with pytest.raises(HTTPError) as error:
+        client.get(base_url(server) + "/loop")
+    assert error.value.code == 302
+    assert len(server.requests) == 11
+
+    # anything else which is not a success is an error, not a response body
+    with pytest.raises(HTTPError) as error:
+        client.get(base_url(server) + "/not-modified")
+    assert error.value.code == 304
+    client.close()
+
+
+def test_read_timeout(server):
+    client = HTTPClient(read_timeout=0.2)
+    with pytest.raises(URLError):
+        client.get(base_url(server) + "/slow")
+    client.close()
+
+
+def test_connect_error():
+    client = HTTPClient(connect_timeout=0.5)
+    # nothing listening on the port
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    port = httpd.server_address[1]
+    httpd.server_close()
+    with pytest.raises(URLError):
+        client.get("http://127.0.0.1:" + str(port) + "/json")
+
+
+def test_reconnect_after_server_closes_idle_connection(server):
+    client = HTTPClient()
+    client.get(base_url(server) + "/drop")
+    time.sleep(0.1)  # let the server close the connection
+
+    # the pooled connection is dead - the client retries once on a new connection
+    assert json.loads(client.get(base_url(server) + "/json")) == json.loads(test_body)
+    assert client.connections_opened == 2
+    client.close()
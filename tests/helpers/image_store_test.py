@@ -0,0 +1,166 @@
+import flip_sign.image_store as image_store
+from flip_sign.image_store import PackedImageStore
+from flip_sign.message_generation import ImageMessage
+from tests.helpers.draw_text_test import image_equal
+from PIL import Image
+from pathlib import Path
+from unittest.mock import patch
+import shutil
+import os
+import pytest
+
+test_01_path = Path("./helpers/test_assets/Test_01.png")
+rickroll_path = Path("./helpers/test_assets/rickroll.jpeg")
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = PackedImageStore(data_path=str(tmp_path / "packed_images.bin"),
+                             index_path=str(tmp_path / "packed_images.json"))
+    monkeypatch.setattr(image_store, 'default_store', store)
+    return store
+
+
+def touch(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_packed_once(tmp_path, store):
+    image_path = tmp_path / "Test_01.png"
+    shutil.copy(test_01_path, image_path)
+    with Image.open(test_01_path) as image:
+        flipped_image = image.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+
+    with patch('flip_sign.image_store.Image.open', wraps=Image.open) as open_mock:
+        packed, error = store.get(image_path)
+        assert error is None
+        assert len(packed) == image_store.PACKED_LENGTH == 441
+        opened = open_mock.call_count
+
+        # unchanged - read from the store, also after a restart
+        assert store.get(image_path) == (packed, None)
+        assert PackedImageStore(data_path=store.data_path, index_path=store.index_path).get(image_path) == \
+            (packed, None)
+        assert open_mock.call_count == opened
+
+        # a touched file is hashed again, but its contents are unchanged so it is not converted again
+        touch(image_path)
+        assert store.get(image_path) == (packed, None)
+        assert open_mock.call_count == opened
+
+        # a changed file is converted again
+        flipped_image.save(image_path)
+        flipped, error = store.get(image_path)
+        assert error is None and flipped != packed
+        assert open_mock.call_count == opened * 2
+
+    with Image.open(test_01_path) as answer:
+        assert image_equal(image_store.unpack_image(packed), answer.convert(mode='1'))
+
+
+def test_invalid_images_recorded(tmp_path, store):
+    not_image_path = Path("./helpers/test_assets/nameless_tn_location_resp.txt")
+    with patch('flip_sign.image_store.Image.open', wraps=Image.open) as open_mock:
+        assert store.get(not_image_path) == (None, image_store.OPEN_ERROR)
+        opened = open_mock.call_count
+        assert store.get(not_image_path) == (None, image_store.OPEN_ERROR)
+        assert open_mock.call_count == opened
+
+    with pytest.raises(FileNotFoundError):
+        store.get(tmp_path / "not_a_real_file.png")
+
+
+def test_many_images(tmp_path, store):
+    images = []
+    for i in range(50):
+        image = Image.effect_noise((168, 21), 64 + i).convert(mode='1')
+        image.save(tmp_path / (str(i) + ".png"))
+        images.append(image)
+
+    # read back while the data file grows, and from a fresh mapping
+    for i, image in enumerate(images):
+        assert image_store.unpack_image(store.get(tmp_path / (str(i) + ".png"))[0]).tobytes() == image.tobytes()
+        assert image_store.unpack_image(store.get(tmp_path / "0.png")[0]).tobytes() == images[0].tobytes()
+    restarted = PackedImageStore(data_path=store.data_path, index_path=store.index_path)
+    for i, image in enumerate(images):
+        assert image_store.unpack_image(restarted.get(tmp_path / (str(i) + ".png"))[0]).tobytes() == image.tobytes()
+    assert os.path.getsize(store.data_path) == 50 * image_store.PACKED_LENGTH
+
+
+def test_image_message_decoded_lazily(store):
+    with patch('flip_sign.image_store.unpack_image', wraps=image_store.unpack_image) as unpack_mock:
+        message = ImageMessage(test_01_path, 1.0)
+        assert message
+        unpack_mock.assert_not_called()
+
+        message.render()
+        with Image.open(test_01_path) as answer:
+            assert image_equal(message.get_image(), answer)
+        unpack_mock.assert_called_once()
+
+
+def test_converted_once_per_checksum(tmp_path, store, monkeypatch):
+    drawing_path = tmp_path / "drawing.jpeg"
+    shutil.copy(rickroll_path, drawing_path)
+
+    with patch('flip_sign.image_store.pack_image', wraps=image_store.pack_image) as pack_mock:
+        packed, error = store.get(drawing_path)
+        assert error is None and len(packed) == image_store.PACKED_LENGTH
+
+        # the same contents under another name, or downloaded again, are not converted again
+        shutil.copy(rickroll_path, tmp_path / "copy.jpeg")
+        assert store.get(tmp_path / "copy.jpeg") == (packed, None)
+        touch(drawing_path)
+        assert store.get(drawing_path) == (packed, None)
+        assert PackedImageStore(data_path=store.data_path, index_path=store.index_path).get(drawing_path) == \
+            (packed, None)
+        assert pack_mock.call_count == 1
+
+        # changing the conversion converts again
+        monkeypatch.setattr(image_store.config, 'IMAGE_DITHER', 'threshold')
+        thresholded, _ = store.get(drawing_path)
+        assert pack_mock.call_count == 2
+        assert thresholded != packed
+
+
+def test_fit_to_sign():
+    # a wide image is scaled to the sign's height and cropped at the sides, keeping the centre
+    wide = Image.new('L', (336 * 2, 21 * 2), 0)
+    wide.paste(255, (120, 0, 552, 42))
+    fitted = image_store.fit_to_sign(wide)
+    assert fitted.size == (168, 21)
+    assert fitted.getextrema() == (255, 255)
+
+    # a tall image is scaled to the sign's width and cropped at the top and bottom
+    tall = Image.new('RGB', (84, 84), (255, 255, 255))
+    tall.paste((0, 0, 0), (0, 0, 84, 30))
+    fitted = image_store.fit_to_sign(tall)
+    assert fitted.size == (168, 21)
+    assert fitted.convert('L').getextrema() == (255, 255)
+
+
+@pytest.mark.parametrize("method", image_store.DITHER_METHODS)
+def test_dither_methods(method):
+    # a horizontal gradient: dark on the left, light on the right
+    gradient = Image.linear_gradient('L').rotate(90).resize((168, 21))
+    one_bit = image_store.to_one_bit(gradient, method=method)
+    assert one_bit.mode == '1'
+    assert one_bit.size == (168, 21)
+
+    def fraction_set(box):
+        region = one_bit.crop(box)
+        return sum(1 for value in region.getdata() if value) / (region.width * region.height)
+
+    assert fraction_set((0, 0, 20, 21)) < 0.2
+    assert fraction_set((148, 0, 168, 21)) > 0.8
+    if method == 'threshold':
+        assert fraction_set((64, 0, 80, 21)) == 0.0 or fraction_set((88, 0, 104, 21)) == 1.0
+    else:
+        # the middle is a mix of set and unset pixels
+        assert 0.3 < fraction_set((76, 0, 92, 21)) < 0.7
+
+
+def test_unknown_dither_method():
+    with pytest.raises(ValueError):
+        image_store.to_one_bit(Image.new('L', (168, 21)), method='crosshatch')
@@ -0,0 +1,64 @@
+import flip_sign.helpers as hlp
+import flip_sign.layout_stats as layout_stats
+from tests.helpers.draw_text_test import default_wrap_parameters
+import logging
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def clear_layout_stats():
+    layout_stats.reset()
+    yield
+    layout_stats.reset()
+
+
+def test_counts_attributed_to_label():
+    with layout_stats.attribute_to("short"):
+        hlp.draw_text_best_parameters(params_order=default_wrap_parameters, bbox_size=(168, 21), text="You")
+    with layout_stats.attribute_to("long"):
+        hlp.draw_text_best_parameters(params_order=default_wrap_parameters, bbox_size=(168, 21),
+                                      text="You wrote a note with chalk on my door")
+
+    rows = {row['label']: row for row in layout_stats.summary()}
+    assert set(rows) == {"short", "long"}
+    assert rows["short"]['draws'] == 1
+    assert rows["short"]['fitted_indexes'] == [0]
+    assert len(rows["long"]['fitted_indexes']) == 1 and rows["long"]['fitted_indexes'][0] > 0
+    # the long message falls through more parameter sets, so it measures and wraps more
+    assert rows["long"]['measurements'] > rows["short"]['measurements'] > 0
+    assert rows["long"]['wrap_attempts'] > rows["short"]['wrap_attempts'] > 0
+    # at least the final drawing canvas is always allocated
+    assert rows["short"]['canvases'] >= 1
+    assert rows["short"]['total_time'] > 0
+
+
+def test_unattributed_and_no_fit(caplog):
+    caplog.set_level(logging.INFO)
+    hlp.draw_text_best_parameters(params_order=default_wrap_parameters[:1], bbox_size=(168, 21),
+                                  text="You wrote a note with chalk on my door")
+
+    row, = layout_stats.summary()
+    assert row['label'] == layout_stats.UNATTRIBUTED
+    assert row['no_fit'] == 1
+    assert row['fitted_indexes'] == [None]
+
+    layout_stats.log_summary()
+    assert caplog.records[-1].getMessage() == \
+        "Layout: no parameters fitted in 1 of 1 draws - " + layout_stats.UNATTRIBUTED
+
+
+def test_collect_and_merge():
+    with layout_stats.collect() as collected:
+        layout_stats.record_measurement()
+        layout_stats.record_canvas((1024, 1024))
+        layout_stats.record_wrap_attempt()
+        layout_stats.record_draw(fitted_index=3, seconds=0.5)
+
+    # collected counts are not attributed until merged
+    assert layout_stats.summary() == []
+
+    layout_stats.merge("message", collected)
+    layout_stats.merge("message", collected)
+    row, = layout_stats.summary()
+    assert row == {'label': "message", 'draws': 2, 'measurements': 2, 'canvases': 2, 'canvas_pixels': 2 * 1024 * 1024,
+                   'wrap_attempts': 2, 'fitted_indexes': [3, 3], 'no_fit': 0, 'total_time': 1.0, 'max_time': 0.5}
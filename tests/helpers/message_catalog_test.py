@@ -0,0 +1,88 @@
+import flip_sign.message_generation as msg_gen
+import flip_sign.variable_date_functions as vdf
+from flip_sign.message_catalog import MessageCatalog
+from flip_sign.message_refresh import MessageRefresher
+from tzlocal import get_localzone_name
+from pytz import timezone
+from PIL import Image
+from pathlib import Path
+import datetime
+import time
+import pytest
+
+LOCAL_TIMEZONE = timezone(get_localzone_name())
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    return MessageCatalog(path=str(tmp_path / "message_catalog.pickle"))
+
+
+def sample_messages():
+    now = datetime.datetime.now().replace(tzinfo=LOCAL_TIMEZONE)
+    return [
+        msg_gen.BasicTextMessage(text="Hello", frequency=1.0),
+        msg_gen.DateMatchTextMessage(text="It's a date"),
+        msg_gen.EphemeralDateMessage(description="Trip", start=now + datetime.timedelta(days=3),
+                                     end=now + datetime.timedelta(days=5), all_day=True),
+        msg_gen.RecurringFixedDateMessage(description="New Year", base_date_start="2000-01-01T00:00:00"),
+        msg_gen.RecurringVariableDateMessage(description="Thanksgiving", next_dates_func=vdf.thanksgiving,
+                                             all_day=True),
+        msg_gen.ImageMessage(image=Path("./helpers/test_assets/Test_01.png")),
+        msg_gen.ImageMessage(image=Image.new('1', (168, 21), 1), frequency=1.0),
+    ]
+
+
+def test_catalog_round_trip(catalog):
+    assert catalog.load() is None
+
+    messages = sample_messages()
+    assert catalog.save(messages) == len(messages)
+
+    loaded = MessageCatalog(path=catalog.path).load()
+    assert [type(message) for message in loaded] == [type(message) for message in messages]
+    assert [str(message) for message in loaded[:-1]] == [str(message) for message in messages[:-1]]
+    # created again, not restored - the display chances are drawn afresh
+    assert all(new is not old for new, old in zip(loaded, messages))
+    loaded[-1].render()
+    assert loaded[-1].get_image().tobytes() == messages[-1].get_image().tobytes()
+
+
+def test_messages_created_afresh(catalog):
+    now = datetime.datetime.now().replace(tzinfo=LOCAL_TIMEZONE)
+    soon = msg_gen.EphemeralDateMessage(description="Soon", start=now,
+                                        end=now + datetime.timedelta(seconds=0.2), all_day=False, frequency=1.0)
+    assert soon
+    catalog.save([soon])
+
+    # by the time the catalog is loaded the event is over, so the message is not displayed
+    time.sleep(0.3)
+    loaded = catalog.load()
+    assert len(loaded) == 1
+    assert not loaded[0]
+
+
+def test_unsaveable_messages_left_out(catalog):
+    messages = [msg_gen.BasicTextMessage(text="Saved"),
+                msg_gen.ImageMessage(image=Image.new('1', (168, 21)), frequency=lambda image: 1.0)]
+    assert catalog.save(messages) == 1
+    assert [message.text for message in catalog.load()] == ["Saved"]
+
+
+def test_unreadable_catalog(catalog):
+    with open(catalog.path, 'wb') as f:
+        f.write(b"not a catalog")
+    assert catalog.load() is None
+
+
+def test_refresher_saves_catalog(catalog):
+    fallback = [msg_gen.BasicTextMessage(text="From the catalog")]
+    refresher = MessageRefresher(lambda: [msg_gen.BasicTextMessage(text="Generated")], catalog=catalog,
+                                 messages=fallback)
+    assert refresher.messages is fallback
+    assert refresher.take() is None
+
+    refresher.refresh()
+    refresher._thread.join(timeout=10)
+    assert [message.text for message in refresher.take()] == ["Generated"]
+    assert [message.text for message in catalog.load()] == ["Generated"]
@@ -0,0 +1,95 @@
+import flip_sign.message_generation as msg_gen
+from flip_sign.message_refresh import MessageRefresher
+from urllib.error import URLError
+from unittest.mock import patch
+import threading
+
+
+class StandInFactory(msg_gen.MessageFactory):
+    """
+    A stand-in factory which returns the texts given, or raises the error given, once allowed to finish.
+    """
+    def __init__(self, outputs, finish=None):
+        super().__init__()
+        self.logging_str = "StandInFactory"
+        self.outputs = outputs
+        self.finish = finish
+
+    def generate_messages(self):
+        if self.finish is not None:
+            assert self.finish.wait(timeout=10)
+        output = self.outputs.pop(0)
+        if isinstance(output, Exception):
+            raise output
+        return [msg_gen.BasicTextMessage(text=text) for text in output]
+
+
+def texts(messages):
+    return sorted(message.text for message in messages)
+
+
+def test_last_good_list_kept():
+    finish = threading.Event()
+    factory = StandInFactory([["one", "two"], URLError("no internet"), ["three"]], finish=finish)
+    refresher = MessageRefresher(lambda: [factory])
+
+    assert refresher.refresh()
+    # already running
+    assert not refresher.refresh()
+    assert refresher.take() is None
+    finish.set()
+    assert refresher.wait(timeout=10)
+    assert texts(refresher.take()) == ["one", "two"]
+    assert refresher.take() is None
+
+    # a failed generation is reported, and the last good list kept
+    refresher.refresh()
+    refresher._thread.join(timeout=10)
+    assert refresher.take() is None
+    assert texts(refresher.messages) == ["one", "two"]
+    assert [str(e) for e in refresher.take_errors()] == ["<urlopen error no internet>"]
+    assert refresher.take_errors() == []
+
+    # the next generation swaps in a new list
+    refresher.refresh()
+    assert refresher.wait(timeout=10)
+    assert texts(refresher.take()) == ["three"]
+
+
+def test_first_list_retried():
+    factory = StandInFactory([URLError("no internet"), ConnectionResetError("connection lost"), ["one"]])
+    refresher = MessageRefresher(lambda: [factory], max_retry_wait=5)
+
+    with patch('flip_sign.message_refresh.time.sleep') as sleep_mock:
+        refresher.refresh()
+        assert refresher.wait(timeout=10)
+        # with nothing to show, failures are retried with backoff
+        assert [call.args[0] for call in sleep_mock.call_args_list] == [2, 4]
+
+    assert texts(refresher.take()) == ["one"]
+    assert len(refresher.take_errors()) == 2
+
+
+def test_preview():
+    finish = threading.Event()
+    refresher = MessageRefresher(lambda: [msg_gen.BasicTextMessage(text="quick", frequency=1.0),
+                                          StandInFactory([["slow"], ["slow"]], finish=finish)])
+
+    refresher.refresh()
+    # the quick message is available before the slow factory finishes
+    for _ in range(100):
+        preview = refresher.take_preview()
+        if preview is not None:
+            break
+        refresher.ready.wait(timeout=0.1)
+    assert preview.text == "quick"
+    assert refresher.take() is None
+    finish.set()
+    assert refresher.wait(timeout=10)
+    assert texts(refresher.take()) == ["quick", "slow"]
+
+    # only offered once
+    assert refresher.take_preview() is None
+    refresher.refresh()
+    refresher._thread.join(timeout=10)
+    assert refresher.take_preview() is None
@@ -0,0 +1,76 @@
+import flip_sign.message_generation as msg_gen
+from flip_sign.message_scheduler import MessageScheduler
+from collections import Counter
+import datetime
+
+
+def test_weighted_sequence():
+    often = msg_gen.BasicTextMessage(text="often", frequency=1.0)
+    sometimes = msg_gen.BasicTextMessage(text="sometimes", frequency=0.5)
+    rarely = msg_gen.BasicTextMessage(text="rarely", frequency=0.25)
+    never = msg_gen.BasicTextMessage(text="never", frequency=0.0)
+    failed = msg_gen.BasicTextMessage(text=["list", "text"], frequency=1.0)
+    scheduler = MessageScheduler([often, sometimes, rarely, never, failed])
+
+    assert scheduler.total_weight() == 1.75
+    sequence = [scheduler.next() for _ in range(70)]
+    assert Counter(message.text for message in sequence) == {"often": 40, "sometimes": 20, "rarely": 10}
+
+    # spread evenly - never twice in a row for a message with less than half the total weight
+    for first, second in zip(sequence, sequence[1:]):
+        assert first is not second or first is often
+
+    # a cycle is as long as the total weight
+    assert len(scheduler.cycle()) == 2
+
+
+def test_no_messages():
+    scheduler = MessageScheduler()
+    assert scheduler.next() is None
+    assert scheduler.cycle() == []
+
+    scheduler.set_messages([msg_gen.BasicTextMessage(text="never", frequency=0.0)])
+    assert scheduler.next() is None
+
+
+def test_reweight():
+    later = msg_gen.BasicTextMessage(text="later", frequency=0.1)
+    dates = [(datetime.datetime.now(tz=msg_gen.LOCAL_TIMEZONE) + datetime.timedelta(days=400),) * 2]
+    soon = msg_gen.RecurringVariableDateMessage(description="Soon", all_day=True, next_dates_func=lambda: dates[0])
+    scheduler = MessageScheduler([soon, later])
+    assert scheduler.total_weight() == 0.2
+
+    # the event approaches - shown more often, without creating the message again
+    dates[0] = (datetime.datetime.now(tz=msg_gen.LOCAL_TIMEZONE) + datetime.timedelta(days=10),) * 2
+    assert scheduler.reweight() == 1.1
+    sequence = [scheduler.next() for _ in range(11)]
+    assert sequence.count(soon) == 10
+
+
+def test_set_messages_keeps_credit():
+    first = msg_gen.BasicTextMessage(text="first", frequency=1.0)
+    second = msg_gen.BasicTextMessage(text="second", frequency=1.0)
+    scheduler = MessageScheduler([first, second])
+    shown = scheduler.next()
+
+    # the message not yet shown is next, even though the list has been generated again (new message objects) with a
+    # new message added
+    regenerated = {text: msg_gen.BasicTextMessage(text=text, frequency=1.0) for text in ["first", "second", "third"]}
+    scheduler.set_messages(list(regenerated.values()))
+    assert scheduler.next() is regenerated["second" if shown is first else "first"]
+
+
+def test_ended_event_not_scheduled():
+    now = datetime.datetime.now(tz=msg_gen.LOCAL_TIMEZONE)
+    event = msg_gen.EphemeralDateMessage(description="Meeting", start=now + datetime.timedelta(hours=1),
+                                         end=now + datetime.timedelta(hours=2), all_day=False)
+    other = msg_gen.BasicTextMessage(text="other", frequency=1.0)
+    scheduler = MessageScheduler([event, other])
+    assert scheduler.total_weight() == 2.0
+
+    # the list is still in use after the event has ended - it gets no weight, and is never scheduled
+    event.start, event.end = now - datetime.timedelta(hours=2), now - datetime.timedelta(hours=1)
+    assert event.reweight() == 0.0
+    assert not event
+    assert scheduler.reweight() == 1.0
+    assert all(scheduler.next() is other for _ in range(5))
@@ -1,7 +1,10 @@
-from flip_sign.helpers import render_day
+from flip_sign.helpers import render_day, preload_weather_sprites, weather_sprite
 from flip_sign.assets import root_dir
 from PIL import Image
 from tests.helpers.draw_text_test import image_equal
+from unittest.mock import patch
+from pathlib import Path
+import flip_sign.helpers
 
 
 def test_render_day():
@@ -51,4 +54,35 @@ def test_render_day_portugues():
         render_day(29, 25, 0.7, 3, "hot", "portugues").save(out_path)
 
         with Image.open(out_path) as test_result:
-            assert image_equal(answer, test_result)
\ No newline at end of file
+            assert image_equal(answer, test_result)
+
+def test_render_day_from_sprite_cache():
+    expected = render_day(-5, -7, 0.5, 3, "snow")
+
+    # after the warm-up, every weather image (and the inverted numbers) is in memory
+    n_sprites = preload_weather_sprites()
+    assert n_sprites == len(list(Path(root_dir + "/assets/weather_images").rglob("*.png"))) + 13
+    assert weather_sprite("numbers/5.png").mode == '1'
+
+    flip_sign.helpers._render_day_cache.clear()
+    with patch('flip_sign.helpers.Image.open', side_effect=AssertionError("render_day read from disk")):
+        assert image_equal(expected, render_day(-5, -7, 0.5, 3, "snow"))
+        assert image_equal(render_day(25, 10, 0.9, 4, "rain", "portugues"),
+                           render_day(25.4, 9.6, 0.9, 4, "rain", "portugues"))
+
+
+def test_render_day_memoized():
+    flip_sign.helpers._render_day_cache.clear()
+    start = render_day.cache_info()
+
+    first = render_day(39.8, 9.9, 0.0, 2, "sunny")
+    # same rounded temperatures and precipitation bucket - served from the cache
+    second = render_day(high=40.2, low=10.4, chance_precipitation=0.1, iso_weekday=2, icon_name="sunny")
+    assert second is first
+    # -0.3 rounds to the same digits as 0.3 but is drawn inverted, so must not share the tile
+    assert not image_equal(render_day(0.3, 5, 0.5, 2, "sunny"), render_day(-0.3, 5, 0.5, 2, "sunny"))
+
+    info = render_day.cache_info()
+    assert info.hits - start.hits == 1
+    assert info.misses - start.misses == 3
+    assert info.currsize == 3
@@ -0,0 +1,99 @@
+from flip_sign.request_budget import RequestBudget, BudgetExceededError
+from urllib.error import URLError
+import pytest
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1700000000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def budget(tmp_path, clock):
+    return RequestBudget(path=str(tmp_path / "budget.sqlite3"), limit=10, timer=clock)
+
+
+def test_priorities(budget):
+    # low priority requests stop at 70% of the limit, normal at 90%, high at the limit
+    for _ in range(7):
+        budget.acquire('low')
+    assert not budget.allows('low')
+    with pytest.raises(BudgetExceededError):
+        budget.acquire('low')
+
+    budget.acquire('normal')
+    budget.acquire('normal')
+    with pytest.raises(BudgetExceededError):
+        budget.acquire('normal')
+
+    assert budget.allows('high')
+    budget.acquire('high')
+    with pytest.raises(URLError):
+        budget.acquire('high')
+
+    assert budget.info() == (10, 10, 3)
+
+
+def test_rolling_window_and_restart(budget, clock):
+    for _ in range(5):
+        budget.acquire()
+        clock.now += 60 * 60
+
+    # the count survives a restart
+    restarted = RequestBudget(path=budget.path, limit=10, timer=clock)
+    assert restarted.used() == 5
+
+    # requests older than 24 hours no longer count
+    clock.now += 19 * 60 * 60 + 1
+    assert restarted.used() == 4
+    clock.now += 4 * 60 * 60
+    assert restarted.used() == 0
+
+
+def test_ttl_stretch(budget):
+    for _ in range(5):
+        assert budget.ttl_stretch() == 1
+        budget.acquire('high')
+    assert budget.ttl_stretch() == 1
+    budget.acquire('high')
+    assert budget.ttl_stretch() == pytest.approx(1.6)
+    for _ in range(4):
+        budget.acquire('high')
+    assert budget.ttl_stretch() == 4
+
+
+def test_database_unavailable(tmp_path, clock):
+    budget = RequestBudget(path=str(tmp_path / "missing_dir" / "budget.sqlite3"), limit=2, timer=clock)
+    budget.acquire('high')
+    budget.acquire('high')
+    with pytest.raises(BudgetExceededError):
+        budget.acquire('high')
+    clock.now += 24 * 60 * 60
+    assert budget.used() == 0
+
+
+def test_checks_do_not_touch_database(budget, clock):
+    budget.acquire()
+    statements = []
+    execute = budget._execute
+    budget._execute = lambda sql, parameters=(): statements.append(sql) or execute(sql, parameters)
+
+    # checking the budget (as every cache hit does) is counted in memory
+    clock.now += 25 * 60 * 60
+    assert budget.used() == 0
+    assert budget.allows('low')
+    assert budget.ttl_stretch() == 1
+    assert statements == []
+
+    # old requests are removed from the database when a request is made
+    budget.acquire()
+    assert [sql.split()[0] for sql in statements] == ["DELETE", "INSERT"]
+    assert RequestBudget(path=budget.path, limit=10, timer=clock).used() == 1
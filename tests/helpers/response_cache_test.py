@@ -0,0 +1,61 @@
+from flip_sign.response_cache import PersistentResponseCache
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import URLError
+import threading
+import time
+import pytest
+
+
+def test_concurrent_requests_coalesced(tmp_path):
+    cache = PersistentResponseCache(path=str(tmp_path / "cache.sqlite3"))
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(threading.current_thread().name)
+        release.wait(timeout=5)
+        return {'Key': '335689'}
+
+    n_requests = 8
+    with ThreadPoolExecutor(max_workers=n_requests) as executor:
+        futures = [executor.submit(cache.get_or_fetch, "forecast", fetch, lambda response, now: now + 60)
+                   for _ in range(n_requests)]
+        # wait until every request is either fetching or waiting on the request in flight
+        while cache.misses + cache.coalesced < n_requests:
+            time.sleep(0.001)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)  # one parsed result, shared
+    info = cache.info()
+    assert (info.misses, info.coalesced, info.hits) == (1, n_requests - 1, 0)
+
+    # later requests are plain cache hits
+    assert cache.get_or_fetch("forecast", fetch, lambda response, now: now + 60) == {'Key': '335689'}
+    assert len(calls) == 1
+
+
+def test_concurrent_requests_share_errors(tmp_path):
+    cache = PersistentResponseCache(path=str(tmp_path / "cache.sqlite3"))
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(timeout=5)
+        raise URLError("no network")
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(cache.get_or_fetch, "forecast", fetch, lambda response, now: now + 60)
+                   for _ in range(3)]
+        while cache.misses + cache.coalesced < 3:
+            time.sleep(0.001)
+        release.set()
+        for future in futures:
+            with pytest.raises(URLError):
+                future.result()
+
+    assert len(calls) == 1
+    # failures are not cached - the next request tries again
+    assert cache.get_or_fetch("forecast", lambda: {'Key': '1'}, lambda response, now: now + 60) == {'Key': '1'}
@@ -1,8 +1,28 @@
 import flip_sign.helpers
+from flip_sign.response_cache import PersistentResponseCache
+from flip_sign.request_budget import RequestBudget
 import time
+import pytest
 from unittest.mock import patch, MagicMock
-from urllib.request import Request
-from urllib.error import HTTPError
+import gzip
+from urllib.error import HTTPError, URLError
+
+
+# use a fresh on-disk cache for each test
+@pytest.fixture(autouse=True)
+def accuweather_cache(tmp_path, monkeypatch):
+    cache = PersistentResponseCache(path=str(tmp_path / "accuweather_cache.sqlite3"))
+    monkeypatch.setattr(flip_sign.helpers, '_accuweather_cache', cache)
+    return cache
+
+
+# and a fresh request budget
+@pytest.fixture(autouse=True)
+def accuweather_budget(tmp_path, monkeypatch):
+    budget = RequestBudget(path=str(tmp_path / "accuweather_budget.sqlite3"), limit=10)
+    monkeypatch.setattr(flip_sign.helpers, '_accuweather_budget', budget)
+    return budget
+
 
 # Tests the time-to-use (TTU) function for the accuweather cache
 def test_api_cache_ttu():
@@ -31,53 +51,156 @@ test_location = "36.252304,-85.710587" # Nameless, Tennessee
 weather_loc_base_url = 'http://dataservice.accuweather.com/locations/v1/cities/geoposition/search?'
 test_location_url_tuple = (weather_loc_base_url, "apikey=GRAIOUGRGH", "&q=", test_location)
 
-# test Nameless, TN
+# test Nameless, TN.  the saved response is gzipped, as sent by the API - the http client returns it decompressed
 f = open('./helpers/test_assets/nameless_tn_location_resp.txt', mode='rb')
-urlopen_result = f.read()
+http_get_result = gzip.decompress(f.read())
 f.close()
-urlopen_mock = MagicMock()
-req = Request(''.join(test_location_url_tuple), headers={"Accept-Encoding": "gzip, deflate"})
-urlopen_mock(req).read = MagicMock(return_value = urlopen_result)
+http_get_mock = MagicMock(return_value=http_get_result)
 
 # Tests that the correct value is returned from caching
-@patch('flip_sign.helpers.urlopen', urlopen_mock)
+@patch('flip_sign.helpers.http_client.get', http_get_mock)
 def test_api_requests_basic():
     resp = flip_sign.helpers.accuweather_api_request(test_location_url_tuple)
     assert resp['Key'] == '335689' # Ensure returns correct result
 
     resp = flip_sign.helpers.accuweather_api_request(test_location_url_tuple)
-    urlopen_mock(req).read.assert_called_once() # mock is only called once due to caching
+    http_get_mock.assert_called_once() # mock is only called once due to caching
 
 # Confirms that the method is called again after cache expires
-@patch('flip_sign.helpers.urlopen', urlopen_mock)
-def test_api_requests_cache_expiry():
-    urlopen_mock(req).read.reset_mock()
-    flip_sign.helpers._accuweather_cache.clear()
+@patch('flip_sign.helpers.http_client.get', http_get_mock)
+def test_api_requests_cache_expiry(accuweather_cache):
+    http_get_mock.reset_mock()
     resp = flip_sign.helpers.accuweather_api_request(test_location_url_tuple)
     resp = flip_sign.helpers.accuweather_api_request(test_location_url_tuple)
-    urlopen_mock(req).read.assert_called_once()  # mock is only called once due to caching
+    http_get_mock.assert_called_once()  # mock is only called once due to caching
 
-    flip_sign.helpers._accuweather_cache.expire(time=2e10) # simulate time expiry using the 'expire' method
+    accuweather_cache.timer = lambda: time.time() + 31 * 24 * 60 * 60  # simulate time expiry by moving the clock
     resp = flip_sign.helpers.accuweather_api_request(test_location_url_tuple)
-    assert len(urlopen_mock(req).read.mock_calls) == 2 # confirm mock is called again
+    assert len(http_get_mock.mock_calls) == 2 # confirm mock is called again
 
 
 # Confirm exceptions are not cached
-@patch('flip_sign.helpers.urlopen', urlopen_mock)
+@patch('flip_sign.helpers.http_client.get', http_get_mock)
 def test_api_requests_cache_exceptions():
     err = HTTPError(url=''.join(test_location_url_tuple), code=403, msg='Got an error', hdrs=None, fp=None)
-    urlopen_mock(req).read.configure_mock(side_effect=err)
-    flip_sign.helpers._accuweather_cache.clear()
+    http_get_mock.configure_mock(side_effect=err)
     try:
         resp = flip_sign.helpers.accuweather_api_request(test_location_url_tuple)
     except HTTPError:
         pass
 
     # make another request to confirm the exception was not cached
-    urlopen_mock(req).read.configure_mock(side_effect=None)
+    http_get_mock.configure_mock(side_effect=None)
     resp = flip_sign.helpers.accuweather_api_request(test_location_url_tuple)
     assert resp['Key'] == '335689'  # Ensure returns correct result
 
 # HTTP Errors:
 # 400 Bad Request
 # 403 Forbidden
+
+
+# Confirm the cache persists across restarts and ignores the API key
+@patch('flip_sign.helpers.http_client.get', http_get_mock)
+def test_api_requests_persistent(accuweather_cache):
+    http_get_mock.reset_mock()
+    resp = flip_sign.helpers.accuweather_api_request(test_location_url_tuple)
+
+    # a new cache on the same file (as after a restart) does not call the API, even with a different API key
+    restarted = PersistentResponseCache(path=accuweather_cache.path)
+    with patch('flip_sign.helpers._accuweather_cache', restarted):
+        other_key_url = (weather_loc_base_url, "apikey=SOMEOTHERKEY", "&q=", test_location)
+        resp = flip_sign.helpers.accuweather_api_request(other_key_url)
+    assert resp['Key'] == '335689'
+    http_get_mock.assert_called_once()
+    assert restarted.info().hits == 1
+
+    # the API key is never part of the cache key
+    assert "GRAIOUGRGH" not in flip_sign.helpers.accuweather_cache_key(test_location_url_tuple)
+    assert flip_sign.helpers.accuweather_cache_key(test_location_url_tuple) == \
+           flip_sign.helpers.accuweather_cache_key(other_key_url)
+
+
+# Confirm expired results are served when the API fails, and statistics are reported
+@patch('flip_sign.helpers.http_client.get', http_get_mock)
+def test_api_requests_stale_on_error(accuweather_cache):
+    http_get_mock.configure_mock(side_effect=None)
+    resp = flip_sign.helpers.accuweather_api_request(test_location_url_tuple)
+
+    accuweather_cache.timer = lambda: time.time() + 31 * 24 * 60 * 60
+    http_get_mock.configure_mock(side_effect=URLError("no network"))
+    resp = flip_sign.helpers.accuweather_api_request(test_location_url_tuple)
+    assert resp['Key'] == '335689'
+    http_get_mock.configure_mock(side_effect=None)
+
+    info = flip_sign.helpers.accuweather_cache_info()
+    assert (info.hits, info.misses, info.stale_hits, info.errors, info.currsize) == (0, 2, 1, 1, 1)
+
+
+# Confirm requests are counted against the budget, and that cached results last longer as it runs down
+@patch('flip_sign.helpers.http_client.get', http_get_mock)
+def test_api_requests_budget(accuweather_cache, accuweather_budget):
+    http_get_mock.reset_mock()
+    http_get_mock.configure_mock(side_effect=None)
+    resp = flip_sign.helpers.accuweather_api_request(test_location_url_tuple, priority='low')
+    assert accuweather_budget.used() == 1
+
+    # expired, with plenty of budget left - requested again
+    now = time.time()
+    accuweather_cache.timer = lambda: now + 31 * 24 * 60 * 60
+    resp = flip_sign.helpers.accuweather_api_request(test_location_url_tuple)
+    assert len(http_get_mock.mock_calls) == 2
+    assert accuweather_budget.used() == 2
+
+    # most of the budget used - the cached result lasts longer
+    for _ in range(6):
+        accuweather_budget.acquire()
+    accuweather_cache.timer = lambda: now + 2 * 31 * 24 * 60 * 60
+    resp = flip_sign.helpers.accuweather_api_request(test_location_url_tuple)
+    assert len(http_get_mock.mock_calls) == 2
+
+    # past its stretched lifetime, and no budget left for low priority requests - the stale result is served
+    accuweather_cache.timer = lambda: now + 6 * 31 * 24 * 60 * 60
+    resp = flip_sign.helpers.accuweather_api_request(test_location_url_tuple, priority='low')
+    assert resp['Key'] == '335689'
+    assert len(http_get_mock.mock_calls) == 2
+    assert accuweather_budget.info().refused == 1
+
+    # high priority requests are still made
+    resp = flip_sign.helpers.accuweather_api_request(test_location_url_tuple, priority='high')
+    assert len(http_get_mock.mock_calls) == 3
+
+
+# Confirm prefetching requests a result again shortly before it expires, and only within the budget
+@patch('flip_sign.helpers.http_client.get', http_get_mock)
+def test_api_prefetch(accuweather_cache, accuweather_budget):
+    http_get_mock.reset_mock()
+    http_get_mock.configure_mock(side_effect=None)
+    lead = 60 * 60
+
+    # not cached - requested
+    assert flip_sign.helpers.accuweather_prefetch(test_location_url_tuple, lead=lead)
+    resp = flip_sign.helpers.accuweather_api_request(test_location_url_tuple)
+    assert resp['Key'] == '335689'
+    assert len(http_get_mock.mock_calls) == 1
+
+    # well before expiry - nothing requested
+    now = time.time()
+    accuweather_cache.timer = lambda: now + 29 * 24 * 60 * 60
+    assert not flip_sign.helpers.accuweather_prefetch(test_location_url_tuple, lead=lead)
+    assert len(http_get_mock.mock_calls) == 1
+
+    # within the lead time of expiry - requested again, and the next request is served from the cache
+    accuweather_cache.timer = lambda: now + 30 * 24 * 60 * 60 - lead / 2
+    assert flip_sign.helpers.accuweather_prefetch(test_location_url_tuple, lead=lead)
+    assert len(http_get_mock.mock_calls) == 2
+    accuweather_cache.timer = lambda: now + 30 * 24 * 60 * 60 + lead
+    resp = flip_sign.helpers.accuweather_api_request(test_location_url_tuple)
+    assert len(http_get_mock.mock_calls) == 2
+
+    # the budget for low priority requests is used up - nothing requested, and nothing refused
+    for _ in range(5):
+        accuweather_budget.acquire()
+    accuweather_cache.timer = lambda: now + 2 * 30 * 24 * 60 * 60
+    assert not flip_sign.helpers.accuweather_prefetch(test_location_url_tuple, lead=lead)
+    assert len(http_get_mock.mock_calls) == 2
+    assert accuweather_budget.info().refused == 0
@@ -0,0 +1,80 @@
+import flip_sign.helpers as hlp
+import flip_sign.message_generation as msg_gen
+from flip_sign.weather_prefetch import WeatherPrefetcher
+from flip_sign.response_cache import PersistentResponseCache
+from flip_sign.request_budget import RequestBudget
+from unittest.mock import patch
+from urllib.error import URLError
+import json
+import time
+import pytest
+
+forecast_response = json.dumps({'Headline': {'Text': "Sunny"}, 'DailyForecasts': []})
+
+
+# use a fresh cache and budget for each test
+@pytest.fixture(autouse=True)
+def accuweather_cache(tmp_path, monkeypatch):
+    cache = PersistentResponseCache(path=str(tmp_path / "accuweather_cache.sqlite3"))
+    monkeypatch.setattr(hlp, '_accuweather_cache', cache)
+    monkeypatch.setattr(hlp, '_accuweather_budget',
+                        RequestBudget(path=str(tmp_path / "accuweather_budget.sqlite3"), limit=10))
+    return cache
+
+
+def weather_messages():
+    home = {'Key': '335689', 'LocalizedName': "Nameless"}
+    away = {'Key': '45881', 'LocalizedName': "Rio de Janeiro"}
+    return [msg_gen.AccuweatherDashboard(location=home),
+            msg_gen.AccuweatherDescription(location=home, headline=True),
+            msg_gen.AccuweatherDashboard(location=away),
+            msg_gen.BasicTextMessage(text="Not the weather")]
+
+
+def test_prefetch_watched_locations(accuweather_cache):
+    prefetcher = WeatherPrefetcher(lead=15 * 60)
+    with patch('flip_sign.helpers.http_client.get', return_value=forecast_response) as get_mock:
+        # nothing watched yet
+        assert prefetcher.prefetch() == 0
+
+        # each location requested once
+        prefetcher.watch(weather_messages())
+        assert prefetcher.prefetch() == 2
+        assert sorted(call.args[0].split('?')[0].rsplit('/', 1)[1] for call in get_mock.call_args_list) == \
+               ['335689', '45881']
+
+        # still warm
+        assert prefetcher.prefetch() == 0
+
+        # close to expiry - requested again
+        now = time.time()
+        accuweather_cache.timer = lambda: now + 4 * 60 * 60 - 5 * 60
+        assert prefetcher.prefetch() == 2
+        assert get_mock.call_count == 4
+
+        # the requests made when the messages render are served from the cache
+        for message in weather_messages()[:3]:
+            hlp.accuweather_api_request(msg_gen.accuweather_forecast_request(message.location),
+                                        priority=message.priority)
+        assert get_mock.call_count == 4
+        assert hlp.accuweather_cache_info().hits == 3
+
+
+def test_prefetch_errors_logged(caplog):
+    prefetcher = WeatherPrefetcher(lead=15 * 60)
+    prefetcher.watch(weather_messages()[:1])
+    with patch('flip_sign.helpers.http_client.get', side_effect=URLError("no internet")):
+        assert prefetcher.prefetch() == 0
+    assert caplog.records[-1].getMessage() == \
+           "Unable to prefetch forecast for location 335689.  Error: <urlopen error no internet>"
+
+
+def test_prefetch_background():
+    prefetcher = WeatherPrefetcher(lead=15 * 60, interval=0.05)
+    prefetcher.watch(weather_messages())
+    with patch('flip_sign.helpers.http_client.get', return_value=forecast_response) as get_mock:
+        assert prefetcher.start()
+        assert not prefetcher.start()
+        time.sleep(0.3)
+        prefetcher.stop()
+    assert get_mock.call_count == 2
@@ -118,3 +118,24 @@ def test_weather_description_logging_repeat(mock_datetime, mock_accuweather, cap
 
     # confirm no repeat logging
     assert not caplog.records[-1].getMessage() == caplog.records[-2].getMessage()
+
+
+@patch(f'{flip_sign.message_generation.__name__}.hlp.accuweather_api_request')
+@patch(f'{flip_sign.message_generation.__name__}.datetime.date', wraps=datetime.date)
+def test_weather_description_rendered_again(mock_datetime, mock_accuweather):
+    fake_now = datetime.datetime(year=2023, month=2, day=9, hour=7, minute=15, second=38)
+    mock_datetime.today.return_value = fake_now.date()
+    with open("./message_generation/test_assets/NamelessTN_5DayForecast_Metric.txt") as f:
+        nameless_tn_forecast_resp = json.loads(f.read())
+
+    test_msg = AccuweatherDescription(location=nameless_tn_location_resp, headline=False, date=fake_now,
+                                      day_or_night='day')
+    mock_accuweather.return_value = nameless_tn_forecast_resp
+    test_msg.render()
+    assert test_msg.text != ''
+
+    # the same message rendered in a later cycle, once the forecast no longer includes the date
+    later_resp = dict(nameless_tn_forecast_resp, DailyForecasts=nameless_tn_forecast_resp['DailyForecasts'][1:])
+    mock_accuweather.return_value = later_resp
+    with pytest.raises(ValueError, match="Provided date not found in API response."):
+        test_msg.render()
@@ -2,6 +2,7 @@
 from flip_sign.assets import root_dir
 from unittest.mock import patch
 import json
+import pytest
 import datetime
 import flip_sign.message_generation as msg_gen
 
@@ -10,6 +11,14 @@ with open(root_dir + "/../tests/message_generation/test_assets/accuweather_locat
     paris_location = json.load(f)
 
 
+# geocoding is tested in tests/helpers/google_geocode_test.py - use a fixed result here rather than the network
+@pytest.fixture(autouse=True)
+def geocode_paris():
+    with patch('flip_sign.helpers.geocode_to_lat_long') as geocode_mock:
+        geocode_mock.return_value = {'lat': 48.856614, 'lng': 2.3522219}
+        yield geocode_mock
+
+
 nyd_2005 = datetime.date(2005, 1, 1)
 
 
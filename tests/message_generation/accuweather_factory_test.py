@@ -2,12 +2,21 @@ from flip_sign.assets import root_dir
 from unittest.mock import patch
 from flip_sign.message_generation import AccuweatherAPIMessageFactory, AccuweatherDescription, BasicTextMessage
 import json
+import pytest
 import datetime
 
 with open(root_dir + "/../tests/message_generation/test_assets/accuweather_location_response_paris.json") as f:
     paris_location = json.load(f)
 
 
+# geocoding is tested in tests/helpers/google_geocode_test.py - use a fixed result here rather than the network
+@pytest.fixture(autouse=True)
+def geocode_paris():
+    with patch('flip_sign.helpers.geocode_to_lat_long') as geocode_mock:
+        geocode_mock.return_value = {'lat': 48.856614, 'lng': 2.3522219}
+        yield geocode_mock
+
+
 @patch('flip_sign.helpers.accuweather_api_request')
 def test_paris_dashboard_basic(api_request_mock):
     api_request_mock.return_value = paris_location
@@ -83,3 +92,23 @@ def test_location_api_error(geocode_mock):
     assert messages[0]  # proxy for confirming that the message displayed (e.g. with frequency=1)
 
     geocode_mock.assert_called()
+
+
+@patch('flip_sign.helpers.accuweather_api_request')
+def test_request_priority(api_request_mock, monkeypatch):
+    api_request_mock.return_value = paris_location
+    monkeypatch.setattr('flip_sign.config.HOME_LOCATION', "paris,  France")
+
+    # the home location's weather is most important against the API budget
+    messages = AccuweatherAPIMessageFactory(location_description="Paris, France", weather_descriptions=True,
+                                            headline=True).generate_messages()
+    assert api_request_mock.call_args.kwargs['priority'] == 'high'
+    assert [message.priority for message in messages] == ['high'] * 5
+
+    messages = AccuweatherAPIMessageFactory(location_description="Lyon, France").generate_messages()
+    assert api_request_mock.call_args.kwargs['priority'] == 'normal'
+    assert messages[0].priority == 'normal'
+
+    messages = AccuweatherAPIMessageFactory(location_description="Lyon, France", priority='low').generate_messages()
+    assert api_request_mock.call_args.kwargs['priority'] == 'low'
+    assert messages[0].priority == 'low'
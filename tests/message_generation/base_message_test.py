@@ -14,10 +14,9 @@ def test_display_never():
 
 
 def test_display_sometimes():
-    total = 0
-    for i in range(50):
-        if Message(0.5):
-            total += 1
-    assert total < 40
-    assert total > 10
-    assert not Message(0.5).init_failure
+    # no longer decided when the message is created - shown in proportion to its weight by the scheduler
+    message = Message(0.5)
+    assert message
+    assert message.weight == 0.5
+    assert message.reweight() == 0.5
+    assert not message.init_failure
@@ -1,4 +1,4 @@
-from flip_sign.message_generation import BasicTextMessage, basic_text_default_wrap_params
+from flip_sign.message_generation import BasicTextMessage, basic_text_default_wrap_params, prerender_text_messages
 from tests.helpers.draw_text_test import image_equal
 from PIL import Image
 
@@ -119,3 +119,32 @@ def test_type_list_wrap_text_true(caplog):
     assert test_msg.init_failure
     first_part_message = "Improper parameters.  wrap_text must be False if text is passed as list."
     assert caplog.records[-1].getMessage()[:len(first_part_message)] == first_part_message
+
+
+def test_prerender_text_messages():
+    texts = ["You", "You wrote a", "You wrote a note with chalk on my"]
+    batch_msgs = [BasicTextMessage(text=text, frequency=1) for text in texts]
+    hidden_msg = BasicTextMessage(text="not displayed", frequency=0)
+
+    assert prerender_text_messages(batch_msgs + [hidden_msg], processes=1) == len(texts)
+    assert hidden_msg.layout is None
+
+    for text, batch_msg in zip(texts, batch_msgs):
+        serial_msg = BasicTextMessage(text=text, frequency=1)
+        serial_msg.render()
+        batch_msg.render()
+        assert image_equal(serial_msg.get_image(), batch_msg.get_image())
+        assert batch_msg.applied_params == serial_msg.applied_params
+        assert batch_msg.applied_spacing == serial_msg.applied_spacing
+
+
+def test_prerender_text_messages_once():
+    laid_out = BasicTextMessage(text="You wrote a", frequency=1)
+    assert prerender_text_messages([laid_out], processes=1) == 1
+    layout = laid_out.layout
+
+    # a later cycle only lays out the new message
+    new_msg = BasicTextMessage(text="note with chalk", frequency=1)
+    assert prerender_text_messages([laid_out, new_msg], processes=1) == 1
+    assert laid_out.layout is layout
+    assert new_msg.layout is not None
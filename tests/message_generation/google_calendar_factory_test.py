@@ -2,6 +2,9 @@ from flip_sign.assets import keys, root_dir
 from unittest.mock import patch, MagicMock
 from flip_sign.message_generation import GoogleCalendarMessageFactory, EphemeralDateMessage, \
     AccuweatherAPIMessageFactory
+from flip_sign.calendar_sync import CalendarEventStore
+import flip_sign.calendar_sync as calendar_sync
+import flip_sign.message_generation as msg_gen
 import datetime
 import json
 from tzlocal import get_localzone_name
@@ -64,14 +67,22 @@ def assert_accuweather_message_factory_equal(first_factory: AccuweatherAPIMessag
     assert (first_factory.start_date - second_factory.start_date).total_seconds() < 1
 
 
-def test_calendar_factory():
-    with patch('flip_sign.message_generation.build') as build_mock:
-        build_mock.return_value.events.return_value.list.return_value.execute.return_value.get.return_value = results[0]
+def test_calendar_factory(tmp_path):
+    store = CalendarEventStore(path=str(tmp_path / "calendar_events.sqlite3"))
+    with patch('flip_sign.message_generation.google_services.service') as build_mock, \
+            patch.object(calendar_sync, 'default_store', store), \
+            patch(f'{msg_gen.__name__}.datetime', wraps=datetime) as datetime_mock:
+        # the responses were recorded on 2023-03-01
+        datetime_mock.datetime.now.return_value = datetime.datetime(2023, 3, 1, tzinfo=datetime.timezone.utc)
+
+        pages = [{'items': result} for result in results]
+        pages[-1]['nextSyncToken'] = "test-sync-token"
+        build_mock.return_value.events.return_value.list.return_value.execute.return_value = pages[0]
 
         next_mocks = []
-        for result in results[1:]:
+        for page in pages[1:]:
             next_mock = MagicMock()
-            next_mock.execute.return_value.get.return_value = result
+            next_mock.execute.return_value = page
             next_mocks.append(next_mock)
         next_mocks.append(None)
 
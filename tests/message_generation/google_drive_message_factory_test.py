@@ -5,7 +5,10 @@ from unittest.mock import patch, MagicMock
 from flip_sign.assets import root_dir, keys
 from tests.helpers.draw_text_test import image_equal
 from flip_sign.helpers import sha256_with_default
+from flip_sign.drive_sync import DriveManifest, DriveListingStore
+import flip_sign.drive_sync as drive_sync
 import json
+import pytest
 
 cache_dir = root_dir + "/cache/google_drive_images/"
 
@@ -20,6 +23,16 @@ file_names = ['Henry_Signscape_1_-_Title_H.png',
 answers = [ImageMessage(image=Path(cache_dir + file), frequency=1.0) for file in file_names]
 
 
+# use a fresh manifest and folder listing for each test, so every image is listed and checked against its checksum
+@pytest.fixture(autouse=True)
+def manifest(tmp_path, monkeypatch):
+    manifest = DriveManifest(path=str(tmp_path / "google_drive_manifest.json"))
+    monkeypatch.setattr(drive_sync, 'default_manifest', manifest)
+    monkeypatch.setattr(drive_sync, 'default_listing_store',
+                        DriveListingStore(path=str(tmp_path / "google_drive_listing.json")))
+    return manifest
+
+
 def assert_image_message_equal(first_message: ImageMessage, second_message: ImageMessage):
     """
     Asserts two image messages are equal, for the purposes of this test.  Checks if the image is identical.
@@ -37,7 +50,7 @@ def test_multi_page_results():
               "/../tests/message_generation/test_assets/google_drive_responses_multi_page_trashed.json") as f:
         results = json.load(f)
 
-    with patch('flip_sign.message_generation.build') as build_mock:
+    with patch('flip_sign.message_generation.google_services.service') as build_mock:
         with patch('flip_sign.message_generation.hlp.download_file_google_drive') as download_mock:
             build_mock.return_value.files.return_value.list.return_value.execute.return_value.get.return_value = \
                 results[0]
@@ -66,7 +79,7 @@ def test_single_page_results():
     with open(root_dir + "/../tests/message_generation/test_assets/google_drive_responses_1_page_trashed.json") as f:
         results = json.load(f)
 
-    with patch('flip_sign.message_generation.build') as build_mock:
+    with patch('flip_sign.message_generation.google_services.service') as build_mock:
         with patch('flip_sign.message_generation.hlp.download_file_google_drive') as download_mock:
             build_mock.return_value.files.return_value.list.return_value.execute.return_value.get.return_value = results
 
@@ -94,7 +107,7 @@ def test_download_changed_file():
               "/../tests/message_generation/test_assets/google_drive_responses_multi_page_trashed.json") as f:
         results = json.load(f)
 
-    with patch('flip_sign.message_generation.build') as build_mock:
+    with patch('flip_sign.message_generation.google_services.service') as build_mock:
         with patch('flip_sign.message_generation.hlp.download_file_google_drive') as download_mock:
             with patch('flip_sign.message_generation.hlp.sha256_with_default') as checksum_mock:
                 checksum_mock.side_effect = checksums
@@ -128,7 +141,7 @@ def test_google_drive_logging(caplog):
     with open(root_dir + "/../tests/message_generation/test_assets/google_drive_responses_1_page_trashed.json") as f:
         results = json.load(f)
 
-    with patch('flip_sign.message_generation.build') as build_mock:
+    with patch('flip_sign.message_generation.google_services.service') as build_mock:
         with patch('flip_sign.message_generation.hlp.download_file_google_drive') as download_mock:
             build_mock.return_value.files.return_value.list.return_value.execute.return_value.get.return_value = results
 
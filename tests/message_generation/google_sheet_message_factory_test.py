@@ -3,9 +3,12 @@ import flip_sign.message_generation as msg_gen
 from flip_sign.variable_date_functions import mlk_day
 from tests.helpers.draw_text_test import image_equal
 from flip_sign.assets import root_dir
+from flip_sign.sheet_specs import SheetSpecStore
+import flip_sign.sheet_specs as sheet_specs
 from unittest.mock import patch
 from googleapiclient.errors import HttpError
 import json
+import pytest
 from collections import namedtuple
 
 answers = [
@@ -22,6 +25,14 @@ answers = [
 ]
 
 
+
+# use a fresh store of parsed sheets for each test
+@pytest.fixture(autouse=True)
+def spec_store(tmp_path, monkeypatch):
+    store = SheetSpecStore(path=str(tmp_path / "sheet_specs.pickle"))
+    monkeypatch.setattr(sheet_specs, 'default_store', store)
+    return store
+
 def assert_accuweather_message_factory_equal(first_factory: msg_gen.AccuweatherAPIMessageFactory,
                                       second_factory: msg_gen.AccuweatherAPIMessageFactory):
     """
@@ -209,7 +220,8 @@ def test_google_sheet_message_factory():
     with open(root_dir + "/../tests/message_generation/test_assets/google_sheet_responses.json", 'r') as f:
         results = json.load(f)
 
-    with patch('flip_sign.message_generation.build') as build_mock:
+    with patch('flip_sign.message_generation.google_services.service') as build_mock:
+        build_mock.return_value.files.return_value.get.return_value.execute.return_value = {'version': '1'}
         build_mock.return_value.spreadsheets.return_value.values.return_value.get.return_value.execute.return_value = \
             results
 
@@ -238,7 +250,8 @@ def test_harder_google_sheet_message_factory():
     with open(root_dir + "/../tests/message_generation/test_assets/google_sheet_responses_harder.json", 'r') as f:
         results = json.load(f)
 
-    with patch('flip_sign.message_generation.build') as build_mock:
+    with patch('flip_sign.message_generation.google_services.service') as build_mock:
+        build_mock.return_value.files.return_value.get.return_value.execute.return_value = {'version': '1'}
         build_mock.return_value.spreadsheets.return_value.values.return_value.get.return_value.execute.return_value = \
             results
 
@@ -254,7 +267,8 @@ def test_harder_google_sheet_message_factory():
 
 # returns HttpError when sheet is not found
 def test_sheet_not_found():
-    with patch('flip_sign.message_generation.build') as build_mock:
+    with patch('flip_sign.message_generation.google_services.service') as build_mock:
+        build_mock.return_value.files.return_value.get.return_value.execute.return_value = {'version': '1'}
         response_type = namedtuple(typename="response", field_names=['status', 'reason'])
         response = response_type(status=1999, reason="Somebody set us up the bomb.")
 
@@ -277,7 +291,8 @@ def test_google_sheet_logging(caplog):
     with open(root_dir + "/../tests/message_generation/test_assets/google_sheet_responses_harder.json", 'r') as f:
         results = json.load(f)
 
-    with patch('flip_sign.message_generation.build') as build_mock:
+    with patch('flip_sign.message_generation.google_services.service') as build_mock:
+        build_mock.return_value.files.return_value.get.return_value.execute.return_value = {'version': '1'}
         build_mock.return_value.spreadsheets.return_value.values.return_value.get.return_value.execute.return_value = \
             results
 
@@ -291,3 +306,53 @@ def test_google_sheet_logging(caplog):
             assert_message_gen_objects_equal(answer, output)
 
     assert caplog.records[-1].getMessage() == "Beginning message generation for " + "Google SheetMessageFactory: blurgh"
+
+
+def test_google_sheet_change_detection(spec_store):
+    with open(root_dir + "/../tests/message_generation/test_assets/google_sheet_responses_harder.json", 'r') as f:
+        results = json.load(f)
+
+    with patch('flip_sign.message_generation.google_services.service') as build_mock, \
+            patch.object(msg_gen.GoogleSheetMessageFactory, 'compile_rows',
+                         wraps=msg_gen.GoogleSheetMessageFactory.compile_rows) as compile_mock:
+        version_get = build_mock.return_value.files.return_value.get
+        values_get = build_mock.return_value.spreadsheets.return_value.values.return_value.get
+        version_get.return_value.execute.return_value = {'version': '10'}
+        values_get.return_value.execute.return_value = results
+
+        factory = msg_gen.GoogleSheetMessageFactory(sheet_id="blurgh")
+        first_outputs = factory.generate_messages()
+        assert compile_mock.call_count == 1
+
+        # unchanged sheet - a version check only, no values requested and nothing parsed
+        values_get.reset_mock()
+        for outputs in [factory.generate_messages(), msg_gen.GoogleSheetMessageFactory(sheet_id="blurgh")
+                        .generate_messages()]:
+            assert len(outputs) == len(harder_test_answers)
+            for answer, output in zip(harder_test_answers, outputs):
+                assert_message_gen_objects_equal(answer, output)
+            # new objects are created each time
+            assert all(output is not first_output for output, first_output in zip(outputs, first_outputs))
+        values_get.assert_not_called()
+        assert compile_mock.call_count == 1
+
+        # new version with the same values (e.g. another tab edited) - values compared, nothing parsed
+        version_get.return_value.execute.return_value = {'version': '11'}
+        factory.generate_messages()
+        values_get.assert_called()
+        assert compile_mock.call_count == 1
+
+        # the parsed sheet is reused after a restart
+        restarted_store = SheetSpecStore(path=spec_store.path)
+        assert restarted_store.get("blurgh") == spec_store.get("blurgh")
+        assert restarted_store.get("blurgh").version == '11'
+
+        # changed values are parsed again
+        version_get.return_value.execute.return_value = {'version': '12'}
+        changed_results = json.loads(json.dumps(results))
+        changed_results['values'] = changed_results['values'][:2]
+        values_get.return_value.execute.return_value = changed_results
+        outputs = factory.generate_messages()
+        assert compile_mock.call_count == 2
+        assert len(outputs) == 1
+        assert_message_gen_objects_equal(harder_test_answers[0], outputs[0])
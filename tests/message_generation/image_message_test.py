@@ -49,10 +49,20 @@ def test_frequency_function():
 
 
 def test_wrong_image_size(caplog):
+    with Image.open("./helpers/test_assets/rickroll.jpeg") as rickroll_image:
+        rickroll = ImageMessage(rickroll_image, 1.0)
+        assert not rickroll  # message should not display because it's the wrong size
+        assert caplog.records[-1].getMessage() == "Image is the wrong size.  Image:" + str(rickroll_image)
+
+
+def test_image_file_fitted_to_sign():
+    # image files of other sizes are scaled and cropped to the sign
     rickroll_path = Path("./helpers/test_assets/rickroll.jpeg")
     rickroll = ImageMessage(rickroll_path, 1.0)
-    assert not rickroll  # message should not display because it's the wrong size
-    assert caplog.records[-1].getMessage() == "Image is the wrong size.  Image:" + str(rickroll_path)
+    assert rickroll
+    rickroll.render()
+    assert rickroll.get_image().mode == '1'
+    assert rickroll.get_image().size == (168, 21)
 
 
 def test_improper_input(caplog):
@@ -2,6 +2,7 @@ import flip_sign.message_generation as msg_gen
 import flip_sign.variable_date_functions as vdf
 from tests.message_generation.google_sheet_message_factory_test import assert_message_gen_objects_equal
 from unittest.mock import patch
+import time
 from flip_sign.assets import root_dir
 from pathlib import Path
 import datetime
@@ -95,9 +96,88 @@ def test_recursive_message_generate(accuweather_mock, google_calendar_mock, goog
         msg_gen.AccuweatherAPIMessageFactory(location_description="Someplace")
     ]
 
-    outputs = msg_gen.recursive_message_generate(to_be_processed=[msg_gen.GoogleSheetMessageFactory(sheet_id="init")])
+    # one worker calls the factories in depth-first order, matching the order of the mocks' side effects
+    outputs = msg_gen.recursive_message_generate(to_be_processed=[msg_gen.GoogleSheetMessageFactory(sheet_id="init")],
+                                                 max_workers=1)
 
     assert len(answers) == len(outputs)
 
     for answer, output in zip(answers, outputs):
         assert_message_gen_objects_equal(answer, output)
+
+
+class SlowFactory(msg_gen.MessageFactory):
+    """
+    A stand-in factory which waits before returning its output, as a factory waits on network requests.
+    """
+    def __init__(self, delay, output):
+        super().__init__()
+        self.logging_str = "SlowFactory"
+        self.delay = delay
+        self.output = output
+
+    def generate_messages(self):
+        time.sleep(self.delay)
+        return self.output
+
+
+def test_concurrent_message_generate():
+    def text(name):
+        return msg_gen.BasicTextMessage(text=name)
+
+    # the inner factories finish in the reverse of their depth-first order
+    to_be_processed = [
+        text("a"),
+        SlowFactory(0.2, [text("b"), SlowFactory(0.3, [text("c"), text("d")]), text("e")]),
+        SlowFactory(0.1, [SlowFactory(0.1, [text("f")]), text("g")]),
+        text("h"),
+        SlowFactory(0, [])
+    ]
+
+    start = time.monotonic()
+    outputs = msg_gen.recursive_message_generate(to_be_processed, max_workers=4)
+    elapsed = time.monotonic() - start
+
+    assert [output.text for output in outputs] == ["a", "b", "c", "d", "e", "f", "g", "h"]
+    # run concurrently: 0.5s along the slowest chain, rather than 0.7s in total
+    assert elapsed < 0.65
+
+
+def test_message_generate_timeout():
+    def text(name):
+        return msg_gen.BasicTextMessage(text=name)
+
+    to_be_processed = [SlowFactory(0, [text("a")]), SlowFactory(5, [text("b")]), SlowFactory(0.05, [text("c")])]
+
+    start = time.monotonic()
+    outputs = msg_gen.recursive_message_generate(to_be_processed, max_workers=2, timeout=0.3)
+
+    assert [output.text for output in outputs] == ["a", "c"]
+    assert time.monotonic() - start < 1
+
+
+def test_stream_message_generate():
+    def text(name):
+        return msg_gen.BasicTextMessage(text=name)
+
+    to_be_processed = [text("a"), SlowFactory(0, [text("b")]), SlowFactory(0.5, [text("c")])]
+
+    start = time.monotonic()
+    stream = msg_gen.stream_message_generate(to_be_processed, max_workers=2)
+    # messages before the slow factory are available without waiting for it
+    assert next(stream).text == "a"
+    assert next(stream).text == "b"
+    assert time.monotonic() - start < 0.4
+    assert [output.text for output in stream] == ["c"]
+
+
+def test_message_generate_deep_and_long():
+    # deeper than the recursion limit, with thousands of messages
+    factory = SlowFactory(0, [msg_gen.BasicTextMessage(text="last")])
+    for i in range(1500):
+        factory = SlowFactory(0, [msg_gen.BasicTextMessage(text=str(i)), factory])
+
+    outputs = msg_gen.recursive_message_generate([factory] + [msg_gen.BasicTextMessage(text="x")] * 5000)
+
+    assert len(outputs) == 6501
+    assert [output.text for output in outputs[:1501]] == [str(i) for i in reversed(range(1500))] + ["last"]